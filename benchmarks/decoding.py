@@ -0,0 +1,52 @@
+"""
+Compares `base64.b64decode`, which `validate_response` used before, with
+`decode_base64` for base64 encoded payloads from 4 KiB to 1 MiB, passed as
+`bytes`, `str` and `memoryview`, unwrapped and wrapped at 76 characters per
+line like MIME encoders do.
+
+Run with ``python -m benchmarks.decoding`` from the repository root.
+"""
+
+import base64
+import os
+from collections.abc import Callable
+
+from minisaml.internal.encoding import Base64Data, decode_base64
+
+from .utils import bench, report
+
+SIZES = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024]
+
+
+def b64decode(data: Base64Data) -> bytes:
+    return base64.b64decode(data)
+
+
+def main() -> None:
+    for size in SIZES:
+        raw = os.urandom(size)
+        encoded = base64.b64encode(raw)
+        wrapped = base64.encodebytes(raw)
+        number = max(10, 4 * 1024 * 1024 // size)
+        inputs: list[tuple[str, Base64Data]] = [
+            ("bytes", encoded),
+            ("str", encoded.decode("ascii")),
+            ("memoryview", memoryview(encoded)),
+            ("wrapped bytes", wrapped),
+            ("wrapped str", wrapped.decode("ascii")),
+        ]
+        for name, data in inputs:
+            decoders: list[tuple[str, Callable[[Base64Data], bytes]]] = [
+                ("b64decode", b64decode),
+                ("decode_base64", decode_base64),
+            ]
+            for decoder_name, decoder in decoders:
+                assert decoder(data) == raw
+                report(
+                    f"{size // 1024:>5} KiB {name:<14} {decoder_name}",
+                    bench(lambda: decoder(data), number=number),  # noqa: B023
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compares looking up the fields of an assertion with `find_or_raise`, which
+parses the path on every call, against the precompiled paths in
+`minisaml.internal.paths`.
+
+Run with ``python -m benchmarks.extraction`` from the repository root.
+"""
+
+import base64
+
+from lxml.etree import _Element as Element
+
+from minisaml.internal import paths
+from minisaml.internal.utils import deserialize_xml, find_or_raise
+
+from .utils import bench, read, report
+
+ASSERTION = find_or_raise(
+    deserialize_xml(base64.b64decode(read("response.xml.b64"))), "./saml:Assertion"
+)
+
+
+def with_find_or_raise(assertion: Element) -> None:
+    find_or_raise(assertion, "./saml:Issuer")
+    subject = find_or_raise(assertion, "./saml:Subject")
+    find_or_raise(subject, "./saml:NameID")
+    find_or_raise(
+        find_or_raise(subject, "./saml:SubjectConfirmation"),
+        "./saml:SubjectConfirmationData",
+    )
+    conditions = find_or_raise(assertion, "./saml:Conditions")
+    find_or_raise(conditions, "./saml:AudienceRestriction/saml:Audience")
+    find_or_raise(assertion, "./saml:AuthnStatement")
+    find_or_raise(assertion, "./saml:AttributeStatement")
+
+
+def with_compiled_paths(assertion: Element) -> None:
+    paths.ISSUER.find_one(assertion)
+    subject = paths.SUBJECT.find_one(assertion)
+    paths.NAME_ID.find_one(subject)
+    paths.SUBJECT_CONFIRMATION_DATA.find_one(
+        paths.SUBJECT_CONFIRMATION.find_one(subject)
+    )
+    conditions = paths.CONDITIONS.find_one(assertion)
+    paths.AUDIENCE.find_one(conditions)
+    paths.AUTHN_STATEMENT.find_one(assertion)
+    paths.ATTRIBUTE_STATEMENT.find_one(assertion)
+
+
+def main() -> None:
+    report("find_or_raise", bench(lambda: with_find_or_raise(ASSERTION), number=5000))
+    report("compiled paths", bench(lambda: with_compiled_paths(ASSERTION), number=5000))
+
+
+if __name__ == "__main__":
+    main()
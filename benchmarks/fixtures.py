@@ -0,0 +1,122 @@
+"""
+Generates signed SAML Responses for benchmarks.
+
+The private key of the certificates in tests/data is not part of the
+repository, so a new key and self-signed certificate are generated for each
+run instead.
+"""
+
+import base64
+import datetime
+import functools
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.x509 import Certificate
+from cryptography.x509.oid import NameOID
+from minisignxml.sign import sign
+
+from minisaml.internal.constants import NAMEID_FORMAT_UNSPECIFIED
+from minisaml.internal.namespaces import saml, samlp
+from minisaml.internal.saml import datetime_to_saml
+
+from .utils import GOOD_TIME
+
+IDP_ISSUER = "https://idp.invalid"
+AUDIENCE = "https://sp.invalid"
+ATTRIBUTE_NAME_FORMAT_URI = "urn:oasis:names:tc:SAML:2.0:attrname-format:uri"
+
+
+def signing_key_and_certificate(
+    common_name: str = "minisaml benchmark",
+) -> tuple[RSAPrivateKey, Certificate]:
+    return _generate_key_and_certificate(common_name)
+
+
+@functools.cache
+def _generate_key_and_certificate(
+    common_name: str,
+) -> tuple[RSAPrivateKey, Certificate]:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(GOOD_TIME - datetime.timedelta(days=1))
+        .not_valid_after(GOOD_TIME + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, certificate
+
+
+def signed_response(
+    *,
+    attributes: int = 10,
+    issuer: str = IDP_ISSUER,
+    audience: str = AUDIENCE,
+    assertion_id: str = "assertion-id",
+    common_name: str = "minisaml benchmark",
+) -> bytes:
+    """
+    Returns a base64 encoded SAML Response with `attributes` attributes, valid
+    at `GOOD_TIME` and signed by `signing_key_and_certificate(common_name)`.
+    """
+    key, certificate = signing_key_and_certificate(common_name)
+    issue_instant = datetime_to_saml(GOOD_TIME - datetime.timedelta(seconds=1))
+    not_on_or_after = datetime_to_saml(GOOD_TIME + datetime.timedelta(minutes=1))
+    assertion = saml.Assertion(
+        saml.Issuer(issuer),
+        saml.Subject(
+            saml.NameID("user@example.invalid", Format=NAMEID_FORMAT_UNSPECIFIED),
+            saml.SubjectConfirmation(
+                saml.SubjectConfirmationData(
+                    NotOnOrAfter=not_on_or_after, Recipient=f"{audience}/acs"
+                ),
+                Method="urn:oasis:names:tc:SAML:2.0:cm:bearer",
+            ),
+        ),
+        saml.Conditions(
+            saml.AudienceRestriction(saml.Audience(audience)),
+            NotBefore=issue_instant,
+            NotOnOrAfter=not_on_or_after,
+        ),
+        saml.AuthnStatement(
+            AuthnInstant=issue_instant,
+            SessionNotOnOrAfter=datetime_to_saml(
+                GOOD_TIME + datetime.timedelta(hours=8)
+            ),
+        ),
+        saml.AttributeStatement(
+            *(
+                saml.Attribute(
+                    saml.AttributeValue(f"value-{index}"),
+                    Name=f"urn:oid:1.3.6.1.4.1.{index}",
+                    NameFormat=ATTRIBUTE_NAME_FORMAT_URI,
+                    FriendlyName=f"attribute{index}",
+                )
+                for index in range(attributes)
+            )
+        ),
+        ID=assertion_id,
+        IssueInstant=issue_instant,
+        Version="2.0",
+    )
+    samlp.Response(
+        saml.Issuer(issuer),
+        samlp.Status(
+            samlp.StatusCode(Value="urn:oasis:names:tc:SAML:2.0:status:Success")
+        ),
+        assertion,
+        ID="response-id",
+        IssueInstant=issue_instant,
+        Destination=f"{audience}/acs",
+        Version="2.0",
+    )
+    return base64.b64encode(
+        sign(element=assertion, private_key=key, certificate=certificate, index=1)
+    )
@@ -0,0 +1,57 @@
+"""
+Measures how long importing `minisaml.request` and `minisaml.response` takes
+in a fresh interpreter, using ``-X importtime``. Importing both took about
+250ms before the crypto and XML stack was deferred to the first validation.
+
+Run with ``python -m benchmarks.imports`` from the repository root.
+"""
+
+import subprocess
+import sys
+
+from .utils import report
+
+MODULES = ("minisaml.request", "minisaml.response")
+
+
+def import_times(*modules: str) -> dict[str, int]:
+    """
+    Imports `modules` in a fresh interpreter using ``-X importtime`` and returns
+    the cumulative import time in microseconds of every module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main() -> None:
+    runs = [import_times(*MODULES) for _ in range(10)]
+    for module in MODULES:
+        report(f"import {module}", min(run[module] for run in runs) / 1e6)
+    report(
+        "import both",
+        min(sum(run[module] for module in MODULES) for run in runs) / 1e6,
+    )
+    report(
+        "import minisaml.internal.validation",
+        min(
+            import_times("minisaml.internal.validation")["minisaml.internal.validation"]
+            for _ in range(10)
+        )
+        / 1e6,
+    )
+
+
+if __name__ == "__main__":
+    main()
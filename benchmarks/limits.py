@@ -0,0 +1,68 @@
+"""
+Measures how fast oversized SAML Responses are rejected with the default
+`ResponseLimits` compared to no limits, and the overhead of the limits on a
+valid response. Signature verification is skipped for the valid response so
+the overhead is not hidden by it.
+
+Run with ``python -m benchmarks.limits`` from the repository root.
+"""
+
+import base64
+
+import time_machine
+
+from minisaml.errors import MiniSAMLError
+from minisaml.response import ResponseLimits, validate_response
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response
+from .suite import CERTIFICATE, null_extract
+from .utils import GOOD_TIME, bench, report
+
+VALID = signed_response()
+OVERSIZED = base64.b64encode(b"<a>" + b"<b/>" * 4_000_000 + b"</a>")
+MANY_ELEMENTS = base64.b64encode(b"<a>" + b"<b/>" * 100_000 + b"</a>")
+DEEP = base64.b64encode(b"<a>" * 250 + b"</a>" * 250)
+MANY_ATTRIBUTES = base64.b64encode(b"<a>" + b'<b c="1" d="1"/>' * 6_000 + b"</a>")
+
+
+def run(data: bytes | str, limits: ResponseLimits | None) -> None:
+    try:
+        validate_response(
+            data=data,
+            certificate=CERTIFICATE,
+            expected_audience=AUDIENCE,
+            idp_issuer=IDP_ISSUER,
+            limits=limits,
+        )
+    except MiniSAMLError:
+        pass
+    except Exception:  # noqa: BLE001
+        # Without limits these fail after parsing, for lack of a signature.
+        pass
+
+
+def main() -> None:
+    cases = [
+        ("oversized (21MB encoded)", OVERSIZED, 5),
+        ("many elements (100k)", MANY_ELEMENTS, 20),
+        ("deeply nested (250)", DEEP, 2000),
+        ("many attributes (12k)", MANY_ATTRIBUTES, 200),
+    ]
+    for name, data, number in cases:
+        for limits in (None, ResponseLimits()):
+            label = "default limits" if limits else "no limits"
+            report(
+                f"{name} ({label})",
+                bench(lambda: run(data, limits), number=number),  # noqa: B023
+            )
+    with time_machine.travel(GOOD_TIME, tick=False), null_extract():
+        for limits in (None, ResponseLimits()):
+            label = "default limits" if limits else "no limits"
+            report(
+                f"valid ({label})",
+                bench(lambda: run(VALID, limits), number=2000),  # noqa: B023
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Compares the memory used by stored responses with ten attributes each between
+the previous representation, regular dataclasses with a dict per attribute for
+extra XML attributes, the current slotted classes, and responses as returned by
+`validate_response`, before and after their attributes were first used.
+
+Until their attributes are used, validated responses hold a copy of the
+AttributeStatement, which lives in memory allocated by libxml2 that tracemalloc
+can't see. Each representation is therefore built in a fresh process and the
+growth of its peak resident set size is reported.
+
+Run with ``python -m benchmarks.memory`` from the repository root.
+"""
+
+import argparse
+import base64
+import datetime
+import gc
+import resource
+import subprocess
+import sys
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+
+import time_machine
+from cryptography.x509 import Certificate
+from lxml.etree import _Element as Element
+
+from minisaml.internal import paths
+from minisaml.internal.utils import deserialize_xml
+from minisaml.response import Response, gather_attributes, validate_response
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME
+
+_, CERTIFICATE = signing_key_and_certificate()
+RESPONSE = signed_response(attributes=10)
+
+
+@dataclass(frozen=True)
+class LegacyAttribute:
+    name: str
+    values: list[str]
+    format: str | None
+    extra_attributes: dict[str, str]
+
+
+@dataclass(frozen=True)
+class LegacyResponse:
+    issuer: str
+    name_id: str
+    audience: str
+    attributes: list[LegacyAttribute]
+    session_not_on_or_after: datetime.datetime | None
+    in_response_to: str | None
+    certificate: Certificate
+    assertion_id: str | None
+    not_on_or_after: datetime.datetime
+
+
+def legacy_gather_attributes(attribute_statement: Element) -> Iterable[LegacyAttribute]:
+    for attribute in paths.ATTRIBUTE.find_all(attribute_statement):
+        values = [value.text for value in paths.ATTRIBUTE_VALUE.find_all(attribute)]
+        extra_attributes = {k: v for k, v in attribute.attrib.items()}
+        name = extra_attributes.pop("Name")
+        format = extra_attributes.pop("NameFormat", None)
+        yield LegacyAttribute(
+            name=name, values=values, format=format, extra_attributes=extra_attributes
+        )
+
+
+def attribute_statement() -> Element:
+    return paths.ATTRIBUTE_STATEMENT.find_one(
+        paths.ASSERTION.find_one(deserialize_xml(base64.b64decode(RESPONSE)))
+    )
+
+
+def legacy(index: int) -> object:
+    return LegacyResponse(
+        issuer=IDP_ISSUER,
+        name_id=f"user{index}@example.invalid",
+        audience=AUDIENCE,
+        attributes=list(legacy_gather_attributes(attribute_statement())),
+        session_not_on_or_after=GOOD_TIME,
+        in_response_to=None,
+        certificate=CERTIFICATE,
+        assertion_id=f"assertion-{index}",
+        not_on_or_after=GOOD_TIME,
+    )
+
+
+def slotted(index: int) -> object:
+    response = Response(
+        issuer=IDP_ISSUER,
+        name_id=f"user{index}@example.invalid",
+        audience=AUDIENCE,
+        attributes=list(gather_attributes(attribute_statement())),
+        session_not_on_or_after=GOOD_TIME,
+        in_response_to=None,
+        certificate=CERTIFICATE,
+        assertion_id=f"assertion-{index}",
+        not_on_or_after=GOOD_TIME,
+    )
+    response.attrs
+    return response
+
+
+def validated(index: int) -> object:
+    return validate_response(
+        data=RESPONSE,
+        certificate=CERTIFICATE,
+        expected_audience=AUDIENCE,
+        idp_issuer=IDP_ISSUER,
+    )
+
+
+def validated_gathered(index: int) -> object:
+    response = validate_response(
+        data=RESPONSE,
+        certificate=CERTIFICATE,
+        expected_audience=AUDIENCE,
+        idp_issuer=IDP_ISSUER,
+    )
+    response.attrs
+    return response
+
+
+REPRESENTATIONS: dict[str, Callable[[int], object]] = {
+    "legacy": legacy,
+    "slotted": slotted,
+    "validated": validated,
+    "validated, attributes used": validated_gathered,
+}
+
+
+def peak_rss() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(build: Callable[[int], object], count: int) -> int:
+    """
+    Returns the growth of the peak resident set size while building and
+    holding `count` responses.
+    """
+    with time_machine.travel(GOOD_TIME, tick=False):
+        # Warm up imports and caches, so only the stored responses count.
+        build(-1)
+        gc.collect()
+        before = peak_rss()
+        responses = [build(index) for index in range(count)]
+        size = peak_rss() - before
+    del responses
+    return size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=20_000)
+    parser.add_argument("--representation", choices=REPRESENTATIONS)
+    args = parser.parse_args()
+    if args.representation is not None:
+        size = measure(REPRESENTATIONS[args.representation], args.count)
+        print(  # noqa: T201
+            f"{args.representation:<28} {size / 2**20:>8.1f} MiB "
+            f"{size / args.count:>8.0f} bytes/response"
+        )
+        return
+    for name in REPRESENTATIONS:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.memory",
+                "--count",
+                str(args.count),
+                "--representation",
+                name,
+            ],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Measures loading a federation metadata aggregate into a `MetadataRegistry`,
+reloading it after a single entity changed, which only rebuilds that entity,
+compared to rebuilding every entity, and looking up an issuer.
+
+Reloads still parse and hash every entity to find the changed ones, so
+reloading with one or no entity changed takes about the same time. The
+saving is the difference to rebuilding all entities.
+
+Run with ``python -m benchmarks.metadata`` from the repository root. Pass
+``--count`` to change the number of entities in the aggregate.
+"""
+
+import argparse
+import base64
+import itertools
+
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from minisaml.metadata import MetadataRegistry
+
+from .fixtures import signing_key_and_certificate
+from .utils import bench, report
+
+_, CERTIFICATE = signing_key_and_certificate()
+DER = base64.b64encode(CERTIFICATE.public_bytes(Encoding.DER)).decode("ascii")
+
+
+def entity(index: int, location: str) -> str:
+    return (
+        f'<md:EntityDescriptor entityID="https://idp{index}.invalid">'
+        '<md:IDPSSODescriptor protocolSupportEnumeration="'
+        'urn:oasis:names:tc:SAML:2.0:protocol">'
+        '<md:KeyDescriptor use="signing"><ds:KeyInfo><ds:X509Data>'
+        f"<ds:X509Certificate>{DER}</ds:X509Certificate>"
+        "</ds:X509Data></ds:KeyInfo></md:KeyDescriptor>"
+        '<md:SingleSignOnService Binding="'
+        'urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect" '
+        f'Location="{location}"/>'
+        "</md:IDPSSODescriptor></md:EntityDescriptor>"
+    )
+
+
+def aggregate(count: int, changed: int | None = None) -> bytes:
+    entities = "".join(
+        entity(
+            index,
+            f"https://idp{index}.invalid/{'new' if index == changed else 'sso'}",
+        )
+        for index in range(count)
+    )
+    return (
+        '<md:EntitiesDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" '
+        f'xmlns:ds="http://www.w3.org/2000/09/xmldsig#">{entities}'
+        "</md:EntitiesDescriptor>"
+    ).encode("ascii")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args()
+    original = aggregate(args.count)
+    changed = aggregate(args.count, changed=args.count // 2)
+    print(  # noqa: T201
+        f"{args.count} entities, {len(original) / 2**20:.1f} MiB of metadata"
+    )
+    report(
+        "load, every entity built",
+        bench(lambda: MetadataRegistry().load(original), number=1, repeat=3),
+    )
+    registry = MetadataRegistry()
+    registry.load(original)
+    # Alternates between both documents, so every load changes one entity.
+    documents = itertools.cycle([changed, original])
+    report(
+        "reload, one entity changed",
+        bench(lambda: registry.load(next(documents)), number=2, repeat=3),
+    )
+    report(
+        "reload, nothing changed",
+        bench(lambda: registry.load(original), number=1, repeat=3),
+    )
+    registry.load(changed, etag='"changed"')
+    report(
+        "reload, same ETag",
+        bench(lambda: registry.load(b"", etag='"changed"'), number=1000),
+    )
+    report("lookup", bench(lambda: registry("https://idp0.invalid"), number=100_000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measures the cost of rejecting expired and wrong-audience responses with and
+without the prefilter, and its overhead on valid responses.
+
+Run with ``python -m benchmarks.prefilter`` from the repository root.
+"""
+
+import datetime
+
+import time_machine
+
+from minisaml.errors import MiniSAMLError
+from minisaml.response import validate_response
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME, bench, report
+
+RESPONSE = signed_response()
+_, CERTIFICATE = signing_key_and_certificate()
+
+
+def run(*, audience: str, prefilter: bool) -> None:
+    try:
+        validate_response(
+            data=RESPONSE,
+            certificate=CERTIFICATE,
+            expected_audience=audience,
+            idp_issuer=IDP_ISSUER,
+            prefilter=prefilter,
+        )
+    except MiniSAMLError:
+        pass
+
+
+def main() -> None:
+    cases = [
+        ("valid", GOOD_TIME, AUDIENCE),
+        ("expired", GOOD_TIME + datetime.timedelta(days=1), AUDIENCE),
+        ("audience mismatch", GOOD_TIME, "https://other-sp.invalid"),
+    ]
+    for name, now, audience in cases:
+        with time_machine.travel(now, tick=False):
+            for prefilter in (False, True):
+                report(
+                    f"{name} ({'prefilter' if prefilter else 'no prefilter'})",
+                    bench(
+                        lambda: run(audience=audience, prefilter=prefilter),  # noqa: B023
+                        number=500,
+                    ),
+                )
+
+
+if __name__ == "__main__":
+    main()
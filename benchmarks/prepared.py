@@ -0,0 +1,64 @@
+"""
+Compares validating a response with `validate_response`, which derives the
+certificate store and algorithm allowlists on every call, against a reused
+`PreparedValidator`, for an Identity Provider with two certificates (during a
+key rollover) and an attribute allowlist.
+
+Run with ``python -m benchmarks.prepared`` from the repository root.
+"""
+
+import time_machine
+from cryptography.hazmat.primitives import hashes
+from minisignxml.config import VerifyConfig
+
+from minisaml.certificates import CertificateStore
+from minisaml.internal.verify import PreparedVerifyConfig
+from minisaml.response import PreparedValidator, ValidationConfig, validate_response
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME, bench, report
+
+RESPONSE = signed_response()
+CONFIG = ValidationConfig(
+    certificate=[
+        signing_key_and_certificate("minisaml rollover")[1],
+        signing_key_and_certificate()[1],
+    ],
+    signature_verification_config=VerifyConfig(
+        allowed_signature_method={hashes.SHA1, hashes.SHA256},
+        allowed_digest_method={hashes.SHA1, hashes.SHA256},
+    ),
+    attribute_names=[f"attribute-{index}" for index in range(20)],
+)
+VALIDATOR = PreparedValidator(CONFIG, expected_audience=AUDIENCE, idp_issuer=IDP_ISSUER)
+
+
+def function() -> None:
+    validate_response(
+        data=RESPONSE,
+        certificate=CONFIG.certificate,
+        expected_audience=AUDIENCE,
+        idp_issuer=IDP_ISSUER,
+        signature_verification_config=CONFIG.signature_verification_config,
+        attribute_names=CONFIG.attribute_names,
+    ).attrs
+
+
+def prepared() -> None:
+    VALIDATOR.validate(RESPONSE).attrs
+
+
+def setup() -> None:
+    CertificateStore.of(CONFIG.certificate)
+    PreparedVerifyConfig.of(CONFIG.signature_verification_config)
+
+
+def main() -> None:
+    with time_machine.travel(GOOD_TIME, tick=False):
+        report("per-call setup", bench(setup, number=2000))
+        report("validate_response", bench(function, number=500))
+        report("PreparedValidator.validate", bench(prepared, number=500))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares redirects per second of `get_request_redirect_url` against a reused
+`AuthnRequestBuilder`, unsigned and signed with a 2048 bit RSA key.
+
+Run with ``python -m benchmarks.redirects`` from the repository root.
+"""
+
+from minisaml.request import AuthnRequestBuilder, get_request_redirect_url
+from minisaml.signing import RedirectSigner
+
+from .fixtures import signing_key_and_certificate
+from .utils import bench, report
+
+SAML_ENDPOINT = "https://idp.invalid/sso?tenant=example"
+AUDIENCE = "https://sp.invalid"
+ACS_URL = "https://sp.invalid/saml/acs"
+
+BUILDER = AuthnRequestBuilder(
+    saml_endpoint=SAML_ENDPOINT, expected_audience=AUDIENCE, acs_url=ACS_URL
+)
+
+SIGNER = RedirectSigner(signing_key_and_certificate("minisaml sp")[0])
+
+SIGNED_BUILDER = AuthnRequestBuilder(
+    saml_endpoint=SAML_ENDPOINT,
+    expected_audience=AUDIENCE,
+    acs_url=ACS_URL,
+    signer=SIGNER,
+)
+
+
+def function() -> None:
+    get_request_redirect_url(
+        saml_endpoint=SAML_ENDPOINT, expected_audience=AUDIENCE, acs_url=ACS_URL
+    )
+
+
+def builder() -> None:
+    BUILDER.get_redirect_url()
+
+
+def signed_function() -> None:
+    get_request_redirect_url(
+        saml_endpoint=SAML_ENDPOINT,
+        expected_audience=AUDIENCE,
+        acs_url=ACS_URL,
+        relay_state="/next",
+        signer=SIGNER,
+    )
+
+
+def signed_builder() -> None:
+    SIGNED_BUILDER.get_redirect_url(relay_state="/next")
+
+
+def main() -> None:
+    report("get_request_redirect_url", bench(function, number=5000))
+    report("AuthnRequestBuilder.get_redirect_url", bench(builder, number=5000))
+    report("get_request_redirect_url (signed)", bench(signed_function, number=500))
+    report(
+        "AuthnRequestBuilder.get_redirect_url (signed)",
+        bench(signed_builder, number=500),
+    )
+
+
+if __name__ == "__main__":
+    main()
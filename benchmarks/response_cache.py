@@ -0,0 +1,61 @@
+"""
+Compares validating a response with a `PreparedValidator` against validating
+the same response again with a `ResponseCache`, with and without replay
+protection, which still rejects the resubmitted response.
+
+Run with ``python -m benchmarks.response_cache`` from the repository root.
+"""
+
+import datetime
+
+import time_machine
+
+from minisaml.errors import ReplayDetected
+from minisaml.replay import ReplayProtection
+from minisaml.response import PreparedValidator, ResponseCache, ValidationConfig
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME, bench, report
+
+RESPONSE = signed_response()
+CERTIFICATE = signing_key_and_certificate()[1]
+TTL = datetime.timedelta(minutes=1)
+
+
+def validator(config: ValidationConfig) -> PreparedValidator:
+    return PreparedValidator(config, expected_audience=AUDIENCE, idp_issuer=IDP_ISSUER)
+
+
+UNCACHED = validator(ValidationConfig(certificate=CERTIFICATE))
+CACHED = validator(
+    ValidationConfig(certificate=CERTIFICATE, response_cache=ResponseCache(ttl=TTL))
+)
+REPLAY_PROTECTED = validator(
+    ValidationConfig(
+        certificate=CERTIFICATE,
+        replay_protection=ReplayProtection(),
+        response_cache=ResponseCache(ttl=TTL),
+    )
+)
+
+
+def replayed() -> None:
+    try:
+        REPLAY_PROTECTED.validate(RESPONSE)
+    except ReplayDetected:
+        pass
+
+
+def main() -> None:
+    with time_machine.travel(GOOD_TIME, tick=False):
+        CACHED.validate(RESPONSE)
+        REPLAY_PROTECTED.validate(RESPONSE)
+        report("validate", bench(lambda: UNCACHED.validate(RESPONSE), number=500))
+        report(
+            "validate, cached", bench(lambda: CACHED.validate(RESPONSE), number=5000)
+        )
+        report("validate, cached, replay detected", bench(replayed, number=5000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares the number of XML parses and the time per call of the multi-tenant
+validation path against the previous implementation, which parsed the
+document once to find the issuer and twice more during signature verification.
+
+Run with ``python -m benchmarks.single_parse`` from the repository root.
+"""
+
+import base64
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import time_machine
+from minisignxml.internal import utils as minisignxml_utils
+from minisignxml.verify import extract_verified_element_and_certificate
+
+import minisaml.internal.validation
+from minisaml.internal.utils import find_or_raise
+from minisaml.response import ValidationConfig, validate_multi_tenant_response
+
+from .utils import GOOD_TIME, bench, load_certificate, read, report
+
+DATA = read("response.xml.b64")
+CERTIFICATE = load_certificate()
+CONFIG = ValidationConfig(certificate=CERTIFICATE)
+
+
+def legacy() -> None:
+    tree = minisignxml_utils.deserialize_xml(base64.b64decode(DATA))
+    find_or_raise(find_or_raise(tree, "./saml:Assertion"), "./saml:Issuer")
+    extract_verified_element_and_certificate(
+        xml=base64.b64decode(DATA), certificates={CERTIFICATE}
+    )
+
+
+def current() -> None:
+    validate_multi_tenant_response(
+        data=DATA,
+        get_config_for_issuer=lambda issuer: (CONFIG, None),
+        expected_audience="https://sp.invalid",
+    )
+
+
+@contextmanager
+def count_parses() -> Iterator[list[None]]:
+    calls: list[None] = []
+    originals: list[tuple[Any, Callable[[bytes], Any]]] = [
+        (module, getattr(module, "deserialize_xml"))
+        for module in (minisaml.internal.validation, minisignxml_utils)
+    ]
+    for module, original in originals:
+
+        def counting(xml: bytes, original: Callable[[bytes], Any] = original) -> Any:
+            calls.append(None)
+            return original(xml)
+
+        module.deserialize_xml = counting
+    try:
+        yield calls
+    finally:
+        for module, original in originals:
+            module.deserialize_xml = original
+
+
+def main() -> None:
+    with time_machine.travel(GOOD_TIME, tick=False):
+        for name, func in [("legacy", legacy), ("single parse", current)]:
+            with count_parses() as calls:
+                func()
+            print(f"{name}: {len(calls)} parse(s) per response")  # noqa: T201
+            report(name, bench(func, number=500))
+
+
+if __name__ == "__main__":
+    main()
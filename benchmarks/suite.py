@@ -0,0 +1,219 @@
+"""
+Benchmarks the service provider hot path: creating redirect URLs, validating
+single- and multi-tenant responses and gathering attributes.
+
+Run with ``python -m benchmarks.suite`` from the repository root. The results
+are compared against ``benchmarks/baseline.json``, exiting with status 1 if
+any benchmark got slower than the baseline by more than ``--threshold``. Pass
+``--save`` to overwrite the baseline with the results of the run instead.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import platform
+import sys
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+import time_machine
+from cryptography.x509 import Certificate
+from lxml.etree import _Element as Element
+from minisignxml.config import VerifyConfig
+
+import minisaml.internal.validation
+from minisaml.certificates import CertificateStore
+from minisaml.internal import paths
+from minisaml.internal.utils import deserialize_xml
+from minisaml.request import get_request_redirect_url
+from minisaml.response import (
+    ValidationConfig,
+    gather_attributes,
+    validate_multi_tenant_response,
+    validate_multi_tenant_response_async,
+    validate_response,
+)
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME, bench, bench_async, report
+
+BASELINE = Path(__file__).parent / "baseline.json"
+
+_, CERTIFICATE = signing_key_and_certificate()
+CONFIG = ValidationConfig(certificate=CERTIFICATE)
+RESPONSE = signed_response()
+
+
+def attribute_statement(attributes: int) -> Element:
+    tree = deserialize_xml(base64.b64decode(signed_response(attributes=attributes)))
+    return paths.ATTRIBUTE_STATEMENT.find_one(paths.ASSERTION.find_one(tree))
+
+
+ATTRIBUTE_STATEMENTS = {count: attribute_statement(count) for count in (10, 100, 1000)}
+
+
+@contextmanager
+def null_extract() -> Iterator[None]:
+    """
+    Skips signature verification, like the `null_extract` test fixture.
+    """
+    module: Any = minisaml.internal.validation
+    original = module.extract_verified_element_and_certificate
+
+    def extract(
+        *, tree: Element, certificates: CertificateStore, config: VerifyConfig
+    ) -> tuple[Element, Certificate]:
+        return tree, CERTIFICATE
+
+    module.extract_verified_element_and_certificate = extract
+    try:
+        yield
+    finally:
+        module.extract_verified_element_and_certificate = original
+
+
+def redirect_url() -> None:
+    get_request_redirect_url(
+        saml_endpoint="https://idp.invalid/sso",
+        expected_audience=AUDIENCE,
+        acs_url=f"{AUDIENCE}/acs",
+    )
+
+
+def single_tenant() -> None:
+    validate_response(
+        data=RESPONSE,
+        certificate=CERTIFICATE,
+        expected_audience=AUDIENCE,
+        idp_issuer=IDP_ISSUER,
+    )
+
+
+def multi_tenant() -> None:
+    validate_multi_tenant_response(
+        data=RESPONSE,
+        get_config_for_issuer=lambda issuer: (CONFIG, None),
+        expected_audience=AUDIENCE,
+    )
+
+
+async def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, None]:
+    return CONFIG, None
+
+
+async def multi_tenant_async_callback() -> None:
+    await validate_multi_tenant_response(
+        data=RESPONSE,
+        get_config_for_issuer=get_config_for_issuer,
+        expected_audience=AUDIENCE,
+    )
+
+
+async def multi_tenant_async() -> None:
+    await validate_multi_tenant_response_async(
+        data=RESPONSE,
+        get_config_for_issuer=get_config_for_issuer,
+        expected_audience=AUDIENCE,
+    )
+
+
+def attributes(count: int) -> Callable[[], None]:
+    statement = ATTRIBUTE_STATEMENTS[count]
+
+    def run() -> None:
+        list(gather_attributes(statement))
+
+    return run
+
+
+def run_all() -> dict[str, float]:
+    results: dict[str, float] = {}
+
+    def record(name: str, seconds: float) -> None:
+        report(name, seconds)
+        results[name] = seconds
+
+    def record_async(
+        name: str, func: Callable[[], Awaitable[None]], *, number: int
+    ) -> None:
+        record(name, asyncio.run(bench_async(func, number=number)))
+
+    record("get_request_redirect_url", bench(redirect_url, number=2000))
+    with time_machine.travel(GOOD_TIME, tick=False):
+        record("validate_response", bench(single_tenant, number=200))
+        with null_extract():
+            record(
+                "validate_response (null_extract)", bench(single_tenant, number=2000)
+            )
+        record("validate_multi_tenant_response", bench(multi_tenant, number=200))
+        record_async(
+            "validate_multi_tenant_response (async callback)",
+            multi_tenant_async_callback,
+            number=200,
+        )
+        record_async(
+            "validate_multi_tenant_response_async", multi_tenant_async, number=200
+        )
+    for count in ATTRIBUTE_STATEMENTS:
+        record(
+            f"gather_attributes ({count} attributes)",
+            bench(attributes(count), number=max(10, 10_000 // count)),
+        )
+    return results
+
+
+def compare(
+    results: dict[str, float], baseline: dict[str, float], threshold: float
+) -> list[str]:
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        ratio = seconds / baseline[name]
+        print(f"{name:<48} {ratio:>10.2f}x baseline")  # noqa: T201
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="Store the results as the new baseline."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Maximum allowed ratio between a result and the baseline.",
+    )
+    args = parser.parse_args()
+    results = run_all()
+    if args.save:
+        args.baseline.write_text(
+            json.dumps(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+        return
+    if not args.baseline.exists():
+        return
+    baseline = json.loads(args.baseline.read_text())["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")  # noqa: T201
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
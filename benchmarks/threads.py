@@ -0,0 +1,94 @@
+"""
+Measures how validation and redirect throughput scale with the number of
+threads sharing one `PreparedValidator` and one `AuthnRequestBuilder`.
+
+On builds with a GIL, throughput stays flat as only one thread runs Python
+code at a time. On free-threaded builds (``python3.13t``, ``python3.14t``)
+throughput should grow with the thread count up to the number of cores.
+
+Run with ``python -m benchmarks.threads`` from the repository root. Pass the
+thread counts to measure as arguments, ``1 2 4 8`` by default.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable
+
+import time_machine
+
+from minisaml.request import AuthnRequestBuilder
+from minisaml.response import PreparedValidator, ValidationConfig
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response, signing_key_and_certificate
+from .utils import GOOD_TIME
+
+RESPONSE = signed_response()
+VALIDATOR = PreparedValidator(
+    ValidationConfig(certificate=signing_key_and_certificate()[1]),
+    expected_audience=AUDIENCE,
+    idp_issuer=IDP_ISSUER,
+)
+BUILDER = AuthnRequestBuilder(
+    saml_endpoint="https://idp.invalid/sso",
+    expected_audience=AUDIENCE,
+    acs_url="https://sp.invalid/saml/acs",
+)
+
+
+def validate() -> None:
+    VALIDATOR.validate(RESPONSE).attrs
+
+
+def redirect() -> None:
+    BUILDER.get_redirect_url()
+
+
+def throughput(func: Callable[[], None], *, threads: int, number: int) -> float:
+    """
+    Returns the calls per second of `threads` threads each calling `func`
+    `number` times.
+    """
+    barrier = threading.Barrier(threads + 1)
+
+    def target() -> None:
+        barrier.wait()
+        for _ in range(number):
+            func()
+
+    workers = [threading.Thread(target=target) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    return threads * number / (time.perf_counter() - start)
+
+
+def main() -> None:
+    thread_counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4, 8]
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(  # noqa: T201
+        f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}, "
+        f"{os.cpu_count()} CPUs"
+    )
+    with time_machine.travel(GOOD_TIME, tick=False):
+        for name, func, number in [
+            ("validate", validate, 200),
+            ("redirect", redirect, 2000),
+        ]:
+            func()
+            single = None
+            for threads in thread_counts:
+                ops = throughput(func, threads=threads, number=number)
+                single = single or ops
+                print(  # noqa: T201
+                    f"{name:<10} {threads:>3} threads {ops:>10.0f} op/s "
+                    f"{ops / single:>6.2f}x"
+                )
+
+
+if __name__ == "__main__":
+    main()
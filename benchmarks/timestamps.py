@@ -0,0 +1,45 @@
+"""
+Compares parsing SAML timestamps using `datetime.strptime` against
+`minisaml.internal.saml.saml_to_datetime`, with and without its cache.
+
+Run with ``python -m benchmarks.timestamps`` from the repository root.
+"""
+
+import datetime
+
+from minisaml.internal.constants import DATE_TIME_FORMAT, DATE_TIME_FORMAT_FRACTIONAL
+from minisaml.internal.saml import saml_to_datetime
+
+from .utils import bench, report
+
+TIMESTAMPS = ["2020-01-16T14:32:31Z", "2013-03-18T08:48:15.127Z"]
+
+
+def with_strptime() -> None:
+    for s in TIMESTAMPS:
+        datetime.datetime.strptime(
+            s, DATE_TIME_FORMAT_FRACTIONAL if "." in s else DATE_TIME_FORMAT
+        ).replace(tzinfo=datetime.timezone.utc)
+
+
+def uncached() -> None:
+    for s in TIMESTAMPS:
+        saml_to_datetime.__wrapped__(s)
+
+
+def cached() -> None:
+    for s in TIMESTAMPS:
+        saml_to_datetime(s)
+
+
+def main() -> None:
+    for name, func in [
+        ("strptime", with_strptime),
+        ("saml_to_datetime (uncached)", uncached),
+        ("saml_to_datetime (cached)", cached),
+    ]:
+        report(name, bench(func, number=20000) / len(TIMESTAMPS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Measures the overhead of validation observers: no observer, an observer
+which discards the trace and the logging observer with logging disabled.
+Signature verification is skipped so the overhead is not hidden by it.
+
+Run with ``python -m benchmarks.tracing`` from the repository root.
+"""
+
+import time_machine
+
+from minisaml.response import validate_response
+from minisaml.tracing import CallbackObserver, LoggingObserver, ValidationObserver
+
+from .fixtures import AUDIENCE, IDP_ISSUER, signed_response
+from .suite import CERTIFICATE, null_extract
+from .utils import GOOD_TIME, bench, report
+
+RESPONSE = signed_response()
+
+
+def run(observer: ValidationObserver | None) -> None:
+    validate_response(
+        data=RESPONSE,
+        certificate=CERTIFICATE,
+        expected_audience=AUDIENCE,
+        idp_issuer=IDP_ISSUER,
+        observer=observer,
+    )
+
+
+def main() -> None:
+    observers: list[tuple[str, ValidationObserver | None]] = [
+        ("no observer", None),
+        ("discarding observer", CallbackObserver(lambda trace: None)),
+        ("logging observer (disabled)", LoggingObserver()),
+    ]
+    with time_machine.travel(GOOD_TIME, tick=False), null_extract():
+        for name, observer in observers:
+            report(name, bench(lambda: run(observer), number=2000))  # noqa: B023
+
+
+if __name__ == "__main__":
+    main()
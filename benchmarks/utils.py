@@ -0,0 +1,47 @@
+import datetime
+import time
+import timeit
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+
+from cryptography.x509 import Certificate, load_pem_x509_certificate
+
+DATA = Path(__file__).parent.parent / "tests" / "data"
+
+# Point in time at which tests/data/response.xml.b64 is valid.
+GOOD_TIME = datetime.datetime(2020, 1, 16, 14, 32, 32, tzinfo=datetime.timezone.utc)
+
+
+def read(filename: str) -> bytes:
+    return DATA.joinpath(filename).read_bytes()
+
+
+def load_certificate(filename: str = "cert.pem") -> Certificate:
+    return load_pem_x509_certificate(read(filename))
+
+
+def bench(func: Callable[[], object], *, number: int, repeat: int = 5) -> float:
+    """
+    Returns the best observed time per call in seconds.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<48} {seconds * 1e6:>10.1f} us/op {1 / seconds:>10.0f} op/s")  # noqa: T201
+
+
+async def bench_async(
+    func: Callable[[], Awaitable[object]], *, number: int, repeat: int = 5
+) -> float:
+    """
+    Returns the best observed time per call in seconds, awaiting `func()`
+    `number` times in a row on the running event loop.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
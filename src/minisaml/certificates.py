@@ -0,0 +1,92 @@
+import functools
+import hashlib
+from collections.abc import Collection, Iterable, Iterator
+from typing import Any
+
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from cryptography.x509 import Certificate, load_der_x509_certificate
+
+
+class CertificateStore(Collection[Certificate]):
+    """
+    Immutable collection of certificates indexed by the SHA-256 fingerprint of
+    their DER encoding and by their public key.
+    """
+
+    def __init__(self, certificates: Iterable[Certificate]) -> None:
+        self._by_fingerprint: dict[bytes, Certificate] = {}
+        self._by_public_key: dict[bytes, tuple[Certificate, ...]] = {}
+        for certificate in certificates:
+            self._by_fingerprint[fingerprint(certificate)] = certificate
+        for certificate in self._by_fingerprint.values():
+            key = _public_key_bytes(certificate)
+            self._by_public_key[key] = self._by_public_key.get(key, ()) + (certificate,)
+
+    @classmethod
+    def of(
+        cls, certificate: Certificate | Collection[Certificate]
+    ) -> "CertificateStore":
+        if isinstance(certificate, CertificateStore):
+            return certificate
+        if isinstance(certificate, Certificate):
+            return cls((certificate,))
+        return cls(certificate)
+
+    def __contains__(self, item: object) -> bool:
+        return (
+            isinstance(item, Certificate) and fingerprint(item) in self._by_fingerprint
+        )
+
+    def __iter__(self) -> Iterator[Certificate]:
+        return iter(self._by_fingerprint.values())
+
+    def __len__(self) -> int:
+        return len(self._by_fingerprint)
+
+    def __repr__(self) -> str:
+        return f"CertificateStore({list(self)!r})"
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Certificates can't be pickled, store them DER encoded instead.
+        return _load_certificate_store, (
+            tuple(certificate.public_bytes(Encoding.DER) for certificate in self),
+        )
+
+    def get_by_fingerprint(self, sha256_fingerprint: bytes) -> Certificate | None:
+        return self._by_fingerprint.get(sha256_fingerprint)
+
+    def get_by_der(self, der: bytes) -> Certificate | None:
+        return self._by_fingerprint.get(hashlib.sha256(der).digest())
+
+    def get_by_public_key(self, public_key: RSAPublicKey) -> tuple[Certificate, ...]:
+        return self._by_public_key.get(
+            public_key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo),
+            (),
+        )
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(certificate: Certificate) -> bytes:
+    return hashlib.sha256(certificate.public_bytes(Encoding.DER)).digest()
+
+
+@functools.lru_cache(maxsize=1024)
+def public_key(certificate: Certificate) -> RSAPublicKey:
+    key = certificate.public_key()
+    if not isinstance(key, RSAPublicKey):
+        raise TypeError(
+            f"Only certificates with RSA Keys are supported. Got {key!r} instead."
+        )
+    return key
+
+
+@functools.lru_cache(maxsize=1024)
+def _public_key_bytes(certificate: Certificate) -> bytes:
+    return certificate.public_key().public_bytes(
+        Encoding.DER, PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def _load_certificate_store(ders: tuple[bytes, ...]) -> CertificateStore:
+    return CertificateStore(load_der_x509_certificate(der) for der in ders)
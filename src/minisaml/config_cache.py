@@ -0,0 +1,219 @@
+import asyncio
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Generic
+
+from .response import (
+    AsyncGetConfigForIssuer,
+    State,
+    SyncGetConfigForIssuer,
+    ValidationConfig,
+)
+
+
+class _ConfigCacheEntries(Generic[State]):
+    def __init__(
+        self,
+        *,
+        ttl: datetime.timedelta,
+        max_size: int,
+        stale_while_revalidate: datetime.timedelta,
+    ) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_while_revalidate = stale_while_revalidate
+        self._ttl = ttl.total_seconds()
+        self._max_age = (ttl + stale_while_revalidate).total_seconds()
+        # issuer -> (fetched at, config), in least recently used order.
+        self._entries: OrderedDict[
+            str, tuple[float, tuple[ValidationConfig, State]]
+        ] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(
+        self, issuer: str, now: float
+    ) -> tuple[tuple[ValidationConfig, State] | None, bool]:
+        """
+        Returns the cached config for `issuer`, or None if there is no usable
+        one, and whether it is still fresh.
+        """
+        entry = self._entries.get(issuer)
+        if entry is None:
+            return None, False
+        fetched_at, config = entry
+        age = now - fetched_at
+        if age >= self._max_age:
+            del self._entries[issuer]
+            return None, False
+        self._entries.move_to_end(issuer)
+        return config, age < self._ttl
+
+    def _store(self, issuer: str, config: tuple[ValidationConfig, State]) -> None:
+        self._entries[issuer] = (time.time(), config)
+        self._entries.move_to_end(issuer)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class ConfigCache(_ConfigCacheEntries[State]):
+    """
+    Caches the results of a `get_config_for_issuer` callback for `ttl`.
+
+    Concurrent lookups of the same issuer are collapsed into a single call of
+    `get_config_for_issuer`. For `stale_while_revalidate` after the TTL
+    expired, the stale config is returned while it is refreshed in the
+    background, on `executor` if given or on a new thread otherwise. Failed
+    lookups are not cached.
+    """
+
+    def __init__(
+        self,
+        get_config_for_issuer: SyncGetConfigForIssuer[State],
+        *,
+        ttl: datetime.timedelta,
+        max_size: int = 1024,
+        stale_while_revalidate: datetime.timedelta = datetime.timedelta(),
+        executor: Executor | None = None,
+    ) -> None:
+        super().__init__(
+            ttl=ttl, max_size=max_size, stale_while_revalidate=stale_while_revalidate
+        )
+        self.get_config_for_issuer = get_config_for_issuer
+        self.executor = executor
+        self._pending: dict[str, Future[tuple[ValidationConfig, State]]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, issuer: str) -> tuple[ValidationConfig, State]:
+        with self._lock:
+            config, fresh = self._get(issuer, time.time())
+            if config is not None and fresh:
+                return config
+            future = self._pending.get(issuer)
+            fetch = future is None
+            if future is None:
+                future = self._pending[issuer] = Future()
+        if config is not None:
+            if fetch:
+                self._refresh_in_background(issuer, future)
+            return config
+        if fetch:
+            self._fetch(issuer, future)
+        return future.result()
+
+    def invalidate(self, issuer: str | None = None) -> None:
+        """
+        Drops the cached config of `issuer`, or of all issuers if `issuer` is
+        None. Lookups already in progress are not cached.
+        """
+        with self._lock:
+            if issuer is None:
+                self._entries.clear()
+                self._pending.clear()
+            else:
+                self._entries.pop(issuer, None)
+                self._pending.pop(issuer, None)
+
+    def _refresh_in_background(
+        self, issuer: str, future: "Future[tuple[ValidationConfig, State]]"
+    ) -> None:
+        if self.executor is not None:
+            self.executor.submit(self._fetch, issuer, future)
+        else:
+            threading.Thread(
+                target=self._fetch, args=(issuer, future), daemon=True
+            ).start()
+
+    def _fetch(
+        self, issuer: str, future: "Future[tuple[ValidationConfig, State]]"
+    ) -> None:
+        try:
+            config = self.get_config_for_issuer(issuer)
+        except BaseException as exc:
+            # Also for KeyboardInterrupt, SystemExit or GreenletExit, callers
+            # waiting for this lookup would otherwise wait forever.
+            with self._lock:
+                if self._pending.get(issuer) is future:
+                    del self._pending[issuer]
+            future.set_exception(exc)
+            if not isinstance(exc, Exception):
+                raise
+            return
+        with self._lock:
+            if self._pending.get(issuer) is future:
+                del self._pending[issuer]
+                self._store(issuer, config)
+        future.set_result(config)
+
+
+class AsyncConfigCache(_ConfigCacheEntries[State]):
+    """
+    Asyncio equivalent of `ConfigCache` for an async `get_config_for_issuer`
+    callback. Stale configs are refreshed in a background task. Instances must
+    only be used from a single event loop.
+    """
+
+    def __init__(
+        self,
+        get_config_for_issuer: AsyncGetConfigForIssuer[State],
+        *,
+        ttl: datetime.timedelta,
+        max_size: int = 1024,
+        stale_while_revalidate: datetime.timedelta = datetime.timedelta(),
+    ) -> None:
+        super().__init__(
+            ttl=ttl, max_size=max_size, stale_while_revalidate=stale_while_revalidate
+        )
+        self.get_config_for_issuer = get_config_for_issuer
+        self._pending: dict[str, asyncio.Task[tuple[ValidationConfig, State]]] = {}
+
+    async def __call__(self, issuer: str) -> tuple[ValidationConfig, State]:
+        config, fresh = self._get(issuer, time.time())
+        if config is not None and fresh:
+            return config
+        task = self._pending.get(issuer)
+        if task is None:
+            task = self._pending[issuer] = asyncio.ensure_future(self._fetch(issuer))
+            task.add_done_callback(_retrieve_exception)
+        if config is not None:
+            return config
+        # Cancelling one caller must not cancel the lookup shared with others.
+        return await asyncio.shield(task)
+
+    def invalidate(self, issuer: str | None = None) -> None:
+        """
+        Drops the cached config of `issuer`, or of all issuers if `issuer` is
+        None. Lookups already in progress are not cached.
+        """
+        if issuer is None:
+            self._entries.clear()
+            self._pending.clear()
+        else:
+            self._entries.pop(issuer, None)
+            self._pending.pop(issuer, None)
+
+    async def _fetch(self, issuer: str) -> tuple[ValidationConfig, State]:
+        task = asyncio.current_task()
+        try:
+            config = await self.get_config_for_issuer(issuer)
+        except BaseException:
+            if self._pending.get(issuer) is task:
+                del self._pending[issuer]
+            raise
+        if self._pending.get(issuer) is task:
+            del self._pending[issuer]
+            self._store(issuer, config)
+        return config
+
+
+def _retrieve_exception(task: "asyncio.Task[object]") -> None:
+    # Failed background refreshes are retried on the next lookup, avoid
+    # "exception was never retrieved" warnings for them.
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,323 @@
+import binascii
+from collections.abc import Collection, Iterable
+from typing import Any
+from xml.sax.saxutils import quoteattr
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.ciphers import Cipher
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.ciphers.algorithms import AES
+from cryptography.hazmat.primitives.ciphers.modes import CBC
+from cryptography.hazmat.primitives.serialization import (
+    Encoding,
+    NoEncryption,
+    PrivateFormat,
+    PublicFormat,
+    load_der_private_key,
+    load_pem_private_key,
+)
+from cryptography.x509 import load_der_x509_certificate
+from lxml.etree import QName, XMLSyntaxError
+from lxml.etree import _Element as Element
+from minisignxml.internal.utils import base64_binary_content
+
+from .errors import DecryptionFailed, MalformedSAMLResponse, UnsupportedEncryption
+from .internal import paths
+from .internal.constants import (
+    NAMES_SAML2_ASSERTION,
+    XMLENC11_AES128_GCM,
+    XMLENC11_AES192_GCM,
+    XMLENC11_AES256_GCM,
+    XMLENC11_RSA_OAEP,
+    XMLENC_AES128_CBC,
+    XMLENC_AES192_CBC,
+    XMLENC_AES256_CBC,
+    XMLENC_RSA_OAEP_MGF1P,
+)
+from .internal.utils import deserialize_xml
+
+_DIGEST_METHODS: dict[str, type[hashes.HashAlgorithm]] = {
+    "http://www.w3.org/2000/09/xmldsig#sha1": hashes.SHA1,
+    "http://www.w3.org/2001/04/xmldsig-more#sha224": hashes.SHA224,
+    "http://www.w3.org/2001/04/xmlenc#sha256": hashes.SHA256,
+    "http://www.w3.org/2001/04/xmldsig-more#sha384": hashes.SHA384,
+    "http://www.w3.org/2001/04/xmlenc#sha512": hashes.SHA512,
+}
+
+_MGF_METHODS: dict[str, type[hashes.HashAlgorithm]] = {
+    "http://www.w3.org/2009/xmlenc11#mgf1sha1": hashes.SHA1,
+    "http://www.w3.org/2009/xmlenc11#mgf1sha224": hashes.SHA224,
+    "http://www.w3.org/2009/xmlenc11#mgf1sha256": hashes.SHA256,
+    "http://www.w3.org/2009/xmlenc11#mgf1sha384": hashes.SHA384,
+    "http://www.w3.org/2009/xmlenc11#mgf1sha512": hashes.SHA512,
+}
+
+# Content encryption algorithm: (key size in bytes, is GCM)
+_BLOCK_ENCRYPTION_METHODS: dict[str, tuple[int, bool]] = {
+    XMLENC_AES128_CBC: (16, False),
+    XMLENC_AES192_CBC: (24, False),
+    XMLENC_AES256_CBC: (32, False),
+    XMLENC11_AES128_GCM: (16, True),
+    XMLENC11_AES192_GCM: (24, True),
+    XMLENC11_AES256_GCM: (32, True),
+}
+
+_DIGEST_METHOD = "{http://www.w3.org/2000/09/xmldsig#}DigestMethod"
+_MGF = "{http://www.w3.org/2009/xmlenc11#}MGF"
+_OAEP_PARAMS = "{http://www.w3.org/2001/04/xmlenc#}OAEPparams"
+
+
+class AssertionDecryptor:
+    """
+    Decrypts `saml:EncryptedAssertion` elements using the private keys of a
+    Service Provider. Keys are loaded once when the decryptor is created, so
+    create it once per Service Provider and re-use it. Instances are immutable
+    and can be shared between threads.
+
+    Supports RSA-OAEP key transport and AES-GCM or AES-CBC content
+    encryption. AES-CBC is not authenticated, so it is only decrypted if the
+    caller authenticated the encrypted assertion beforehand. Every failure to
+    decrypt the assertion or to parse the plaintext raises the same
+    `DecryptionFailed`, so the errors do not reveal anything about the
+    plaintext.
+    """
+
+    def __init__(self, private_keys: RSAPrivateKey | Iterable[RSAPrivateKey]) -> None:
+        if isinstance(private_keys, RSAPrivateKey):
+            private_keys = (private_keys,)
+        self._keys: tuple[RSAPrivateKey, ...] = tuple(private_keys)
+        if not self._keys:
+            raise ValueError("At least one private key is required")
+        for key in self._keys:
+            if not isinstance(key, RSAPrivateKey):
+                raise TypeError(
+                    f"Only RSA private keys are supported. Got {key!r} instead."
+                )
+        self._by_public_key = {
+            key.public_key().public_bytes(
+                Encoding.DER, PublicFormat.SubjectPublicKeyInfo
+            ): key
+            for key in self._keys
+        }
+
+    @classmethod
+    def from_pem(
+        cls, data: bytes | Collection[bytes], password: bytes | None = None
+    ) -> "AssertionDecryptor":
+        """
+        Loads PEM encoded private keys, all encrypted with `password` if given.
+        """
+        if isinstance(data, bytes):
+            data = (data,)
+        keys = []
+        for pem in data:
+            key = load_pem_private_key(pem, password)
+            if not isinstance(key, RSAPrivateKey):
+                raise TypeError(
+                    f"Only RSA private keys are supported. Got {key!r} instead."
+                )
+            keys.append(key)
+        return cls(keys)
+
+    @property
+    def private_keys(self) -> tuple[RSAPrivateKey, ...]:
+        return self._keys
+
+    def __repr__(self) -> str:
+        return f"AssertionDecryptor(<{len(self._keys)} private keys>)"
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        # Private keys can't be pickled, store them DER encoded instead.
+        return _load_decryptor, (
+            tuple(
+                key.private_bytes(Encoding.DER, PrivateFormat.PKCS8, NoEncryption())
+                for key in self._keys
+            ),
+        )
+
+    def decrypt(
+        self, encrypted_assertion: Element, *, authenticated: bool = False
+    ) -> Element:
+        """
+        Decrypts `encrypted_assertion` and returns the `saml:Assertion` it
+        contains. The assertion is parsed in the namespace context of
+        `encrypted_assertion` but not inserted into its document.
+
+        AES-CBC is only accepted if `authenticated` is True, meaning the
+        signature of an element containing `encrypted_assertion` has been
+        verified. Otherwise a modified ciphertext could be used to learn the
+        plaintext from how decrypting it fails.
+        """
+        encrypted_data = paths.ENCRYPTED_DATA.find_one(encrypted_assertion)
+        method = _algorithm(paths.ENCRYPTION_METHOD.find_one(encrypted_data))
+        if method not in _BLOCK_ENCRYPTION_METHODS:
+            raise UnsupportedEncryption(algorithm=method)
+        key_size, is_gcm = _BLOCK_ENCRYPTION_METHODS[method]
+        if not is_gcm and not authenticated:
+            raise UnsupportedEncryption(algorithm=method)
+        encrypted_keys = paths.KEY_INFO_ENCRYPTED_KEY.find_all(
+            encrypted_data
+        ) + paths.ENCRYPTED_KEY.find_all(encrypted_assertion)
+        if not encrypted_keys:
+            raise MalformedSAMLResponse("Encrypted assertion without EncryptedKey")
+        cipher_value = _base64_content(paths.CIPHER_VALUE.find_one(encrypted_data))
+        key = self._decrypt_key(encrypted_keys, key_size)
+        plaintext = (
+            _decrypt_gcm(key, cipher_value)
+            if is_gcm
+            else _decrypt_cbc(key, cipher_value)
+        )
+        return _parse_assertion(plaintext, encrypted_assertion)
+
+    def decrypt_in_place(
+        self, encrypted_assertion: Element, *, authenticated: bool = False
+    ) -> Element:
+        """
+        Replaces `encrypted_assertion` with the assertion it contains, which
+        is returned.
+        """
+        assertion = self.decrypt(encrypted_assertion, authenticated=authenticated)
+        parent = encrypted_assertion.getparent()
+        if parent is None:
+            raise MalformedSAMLResponse("Encrypted assertion is the root element")
+        parent.replace(encrypted_assertion, assertion)
+        return assertion
+
+    def _decrypt_key(self, encrypted_keys: list[Element], key_size: int) -> bytes:
+        for encrypted_key in encrypted_keys:
+            method = paths.ENCRYPTION_METHOD.find_one(encrypted_key)
+            oaep = _oaep_padding(method)
+            cipher_value = _base64_content(paths.CIPHER_VALUE.find_one(encrypted_key))
+            for private_key in self._candidate_keys(encrypted_key):
+                try:
+                    key = private_key.decrypt(cipher_value, oaep)
+                except ValueError:
+                    continue
+                if len(key) != key_size:
+                    raise DecryptionFailed()
+                return key
+        raise DecryptionFailed()
+
+    def _candidate_keys(self, encrypted_key: Element) -> Iterable[RSAPrivateKey]:
+        # If the certificate the key was encrypted for is given, only the
+        # matching private key is tried, otherwise all of them.
+        certificates = paths.KEY_INFO_CERTIFICATE.find_all(encrypted_key)
+        if len(certificates) == 1:
+            try:
+                certificate = load_der_x509_certificate(
+                    base64_binary_content(certificates[0])
+                )
+            except (ValueError, binascii.Error):
+                return self._keys
+            key = self._by_public_key.get(
+                certificate.public_key().public_bytes(
+                    Encoding.DER, PublicFormat.SubjectPublicKeyInfo
+                )
+            )
+            if key is not None:
+                return (key,)
+        return self._keys
+
+
+def _load_decryptor(ders: tuple[bytes, ...]) -> AssertionDecryptor:
+    keys = []
+    for der in ders:
+        key = load_der_private_key(der, None)
+        assert isinstance(key, RSAPrivateKey)
+        keys.append(key)
+    return AssertionDecryptor(keys)
+
+
+def _algorithm(method: Element) -> str:
+    algorithm: str | None = method.get("Algorithm")
+    if algorithm is None:
+        raise UnsupportedEncryption(algorithm="No algorithm specified")
+    return algorithm
+
+
+def _base64_content(element: Element) -> bytes:
+    try:
+        return base64_binary_content(element)
+    except binascii.Error:
+        raise MalformedSAMLResponse("Invalid base64 in CipherValue")
+
+
+def _hash_algorithm(
+    algorithms: dict[str, type[hashes.HashAlgorithm]],
+    element: Element | None,
+    default: type[hashes.HashAlgorithm],
+) -> hashes.HashAlgorithm:
+    if element is None:
+        return default()
+    algorithm = _algorithm(element)
+    if algorithm not in algorithms:
+        raise UnsupportedEncryption(algorithm=algorithm)
+    return algorithms[algorithm]()
+
+
+def _oaep_padding(method: Element) -> padding.OAEP:
+    algorithm = _algorithm(method)
+    digest = _hash_algorithm(_DIGEST_METHODS, method.find(_DIGEST_METHOD), hashes.SHA1)
+    if algorithm == XMLENC_RSA_OAEP_MGF1P:
+        mgf_digest: hashes.HashAlgorithm = hashes.SHA1()
+    elif algorithm == XMLENC11_RSA_OAEP:
+        mgf_digest = _hash_algorithm(_MGF_METHODS, method.find(_MGF), hashes.SHA1)
+    else:
+        raise UnsupportedEncryption(algorithm=algorithm)
+    oaep_params = method.find(_OAEP_PARAMS)
+    return padding.OAEP(
+        mgf=padding.MGF1(mgf_digest),
+        algorithm=digest,
+        label=None if oaep_params is None else _base64_content(oaep_params) or None,
+    )
+
+
+def _decrypt_gcm(key: bytes, cipher_value: bytes) -> bytes:
+    # 96 bit IV followed by the ciphertext and the 128 bit tag.
+    if len(cipher_value) < 12 + 16:
+        raise DecryptionFailed()
+    try:
+        return AESGCM(key).decrypt(cipher_value[:12], cipher_value[12:], None)
+    except InvalidTag:
+        raise DecryptionFailed()
+
+
+def _decrypt_cbc(key: bytes, cipher_value: bytes) -> bytes:
+    # 128 bit IV followed by the ciphertext. XML Encryption padding only
+    # specifies the last byte, the number of padding bytes, the other padding
+    # bytes are arbitrary.
+    if len(cipher_value) < 32 or len(cipher_value) % 16:
+        raise DecryptionFailed()
+    decryptor = Cipher(AES(key), CBC(cipher_value[:16])).decryptor()
+    plaintext = decryptor.update(cipher_value[16:]) + decryptor.finalize()
+    padding_length = plaintext[-1]
+    if not 1 <= padding_length <= 16:
+        raise DecryptionFailed()
+    return plaintext[:-padding_length]
+
+
+def _parse_assertion(plaintext: bytes, context: Element) -> Element:
+    # The plaintext is an element serialized in the namespace context of the
+    # encrypted element, so it may use prefixes declared on its ancestors. It
+    # is parsed inside a wrapper declaring all namespaces in scope. Any
+    # plaintext other than a single assertion raises the same error as an
+    # invalid ciphertext.
+    declarations = b"".join(
+        b" xmlns"
+        + (b":" + prefix.encode() if prefix else b"")
+        + b"="
+        + quoteattr(uri).encode()
+        for prefix, uri in context.nsmap.items()
+    )
+    try:
+        wrapper = deserialize_xml(
+            b"<wrapper" + declarations + b">" + plaintext + b"</wrapper>"
+        )
+    except (XMLSyntaxError, ValueError):
+        raise DecryptionFailed()
+    if len(wrapper) != 1 or wrapper[0].tag != QName(NAMES_SAML2_ASSERTION, "Assertion"):
+        raise DecryptionFailed()
+    return wrapper[0]
@@ -1,9 +1,16 @@
 import datetime
-from dataclasses import dataclass
+from collections.abc import Container
+from dataclasses import dataclass, fields, is_dataclass
+from typing import Any
 
 
 class MiniSAMLError(Exception):
-    pass
+    def __reduce__(self) -> str | tuple[Any, ...]:
+        # Dataclass based errors do not pass their fields to Exception.__init__,
+        # so the default implementation would not be able to recreate them.
+        if is_dataclass(self):
+            return type(self), tuple(getattr(self, f.name) for f in fields(self))
+        return super().__reduce__()
 
 
 class MalformedSAMLResponse(MiniSAMLError):
@@ -25,10 +32,74 @@ class ResponseTooEarly(MiniSAMLError):
 @dataclass
 class AudienceMismatch(MiniSAMLError):
     received_audience: str
-    expected_audience: str
+    expected_audience: str | Container[str]
 
 
 @dataclass
 class IssuerMismatch(MiniSAMLError):
     received_issuer: str
     expected_issuer: str
+
+
+@dataclass
+class ReplayDetected(MiniSAMLError):
+    assertion_id: str
+
+
+@dataclass
+class UnsolicitedResponse(MiniSAMLError):
+    in_response_to: str | None
+
+
+@dataclass
+class ReplayCacheFull(MiniSAMLError):
+    max_size: int
+
+
+@dataclass
+class ResponseLimitExceeded(MiniSAMLError):
+    limit: int
+
+
+class EncodedSizeLimitExceeded(ResponseLimitExceeded):
+    pass
+
+
+class DecodedSizeLimitExceeded(ResponseLimitExceeded):
+    pass
+
+
+class ElementCountLimitExceeded(ResponseLimitExceeded):
+    pass
+
+
+class DepthLimitExceeded(ResponseLimitExceeded):
+    pass
+
+
+class AttributeCountLimitExceeded(ResponseLimitExceeded):
+    pass
+
+
+class DecryptionFailed(MiniSAMLError):
+    pass
+
+
+@dataclass
+class UnsupportedEncryption(MiniSAMLError):
+    algorithm: str
+
+
+class MalformedMetadata(MiniSAMLError):
+    pass
+
+
+@dataclass
+class UnknownIssuer(MiniSAMLError):
+    issuer: str
+
+
+@dataclass
+class MetadataExpired(MiniSAMLError):
+    issuer: str
+    valid_until: datetime.datetime
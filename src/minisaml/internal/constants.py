@@ -1,6 +1,19 @@
 NAMES_SAML2_PROTOCOL = "urn:oasis:names:tc:SAML:2.0:protocol"
 NAMES_SAML2_ASSERTION = "urn:oasis:names:tc:SAML:2.0:assertion"
+NAMES_SAML2_METADATA = "urn:oasis:names:tc:SAML:2.0:metadata"
 NAMEID_FORMAT_UNSPECIFIED = "urn:oasis:names:tc:SAML:1.1:nameid-format:unspecified"
 BINDINGS_HTTP_POST = "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST"
+BINDINGS_HTTP_REDIRECT = "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect"
 DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 DATE_TIME_FORMAT_FRACTIONAL = "%Y-%m-%dT%H:%M:%S.%fZ"
+XMLENC = "http://www.w3.org/2001/04/xmlenc#"
+XMLENC11 = "http://www.w3.org/2009/xmlenc11#"
+XMLENC_ELEMENT = XMLENC + "Element"
+XMLENC_RSA_OAEP_MGF1P = XMLENC + "rsa-oaep-mgf1p"
+XMLENC11_RSA_OAEP = XMLENC11 + "rsa-oaep"
+XMLENC_AES128_CBC = XMLENC + "aes128-cbc"
+XMLENC_AES192_CBC = XMLENC + "aes192-cbc"
+XMLENC_AES256_CBC = XMLENC + "aes256-cbc"
+XMLENC11_AES128_GCM = XMLENC11 + "aes128-gcm"
+XMLENC11_AES192_GCM = XMLENC11 + "aes192-gcm"
+XMLENC11_AES256_GCM = XMLENC11 + "aes256-gcm"
@@ -0,0 +1,124 @@
+import base64
+import binascii
+import sys
+
+_BASE64_CHARACTERS = (
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="
+)
+# Line breaks and spaces are allowed between base64 characters, as some
+# Identity Providers wrap the encoded response. Anything else is rejected.
+_WHITESPACE = b"\t\n\r "
+_ALLOWED_CHARACTERS = _BASE64_CHARACTERS + _WHITESPACE
+
+# Number of padding characters of an encoding by decoded length modulo 3.
+_PADDING_LENGTH = (0, 2, 1)
+
+Base64Data = bytes | bytearray | memoryview | str
+
+
+if sys.version_info >= (3, 11):
+
+    def _a2b_base64_strict(data: Base64Data) -> bytes:
+        decoded = binascii.a2b_base64(data, strict_mode=True)
+        _check_excess_padding(data)
+        return decoded
+
+else:
+
+    def _a2b_base64_strict(data: Base64Data) -> bytes:
+        decoded = base64.b64decode(data, validate=True)
+        _check_excess_padding(data)
+        return decoded
+
+
+def _check_excess_padding(data: Base64Data) -> None:
+    # Before Python 3.13, strict decoding accepts padding following a
+    # complete group of four characters.
+    tail = data[-3:]
+    if isinstance(tail, str):
+        tail = tail.encode("ascii")
+    elif not isinstance(tail, bytes):
+        tail = bytes(tail)
+    if tail.endswith(b"=") and (len(data) % 4 or tail.startswith(b"=")):
+        raise binascii.Error("Excess base64 padding")
+
+
+def decode_base64(data: Base64Data) -> bytes:
+    """
+    Decodes base64 encoded `data`, which may contain whitespace between the
+    base64 characters. Unlike `base64.b64decode`, other characters outside of
+    the base64 alphabet and data after the padding are not discarded but
+    raise `binascii.Error`.
+
+    Input without whitespace, the usual case, is validated and decoded in a
+    single pass straight from the buffer of `data`, without first copying
+    `str` input to `bytes`. Strict decoding stops at the first whitespace
+    character, in that case the input is validated separately and decoded
+    by the lenient decoder, which skips the whitespace.
+    """
+    try:
+        return _a2b_base64_strict(data)
+    except ValueError:
+        pass
+    if isinstance(data, str):
+        try:
+            data = data.encode("ascii")
+        except UnicodeEncodeError:
+            raise binascii.Error("Non-ASCII character in base64 data")
+    elif not isinstance(data, bytes):
+        data = bytes(data)
+    if data.translate(None, _ALLOWED_CHARACTERS):
+        raise binascii.Error("Invalid character in base64 data")
+    # The lenient decoder ignores anything after the padding and padding
+    # which does not complete a group, so both are checked here.
+    padding = data.find(b"=")
+    padding_length = 0
+    if padding != -1:
+        padding_characters = data[padding:].translate(None, _WHITESPACE)
+        if padding_characters not in (b"=", b"=="):
+            raise binascii.Error("Data after base64 padding")
+        padding_length = len(padding_characters)
+    decoded = binascii.a2b_base64(data)
+    if padding_length != _PADDING_LENGTH[len(decoded) % 3]:
+        raise binascii.Error("Incorrect base64 padding")
+    return decoded
+
+
+class Base64Decoder:
+    """
+    Incremental equivalent of `decode_base64`. The concatenation of the
+    results of `decode` and `final` equals the result of `decode_base64` on
+    the concatenated input, or `decode` or `final` raises `binascii.Error`.
+
+    Whitespace is discarded. Complete groups of four characters are decoded
+    as they arrive, from the first padding character onwards the input is
+    buffered and decoded by `final`, so that padding followed by more data is
+    rejected like by `decode_base64`.
+    """
+
+    __slots__ = ("_pending", "_padding_seen")
+
+    def __init__(self) -> None:
+        self._pending = b""
+        self._padding_seen = False
+
+    def decode(self, chunk: bytes) -> bytes:
+        if chunk.translate(None, _ALLOWED_CHARACTERS):
+            raise binascii.Error("Invalid character in base64 data")
+        data = self._pending + chunk.translate(None, _WHITESPACE)
+        if self._padding_seen:
+            self._pending = data
+            return b""
+        padding = data.find(b"=")
+        if padding == -1:
+            end = len(data) - len(data) % 4
+        else:
+            end = padding - padding % 4
+            self._padding_seen = True
+        self._pending = data[end:]
+        return _a2b_base64_strict(data[:end])
+
+    def final(self) -> bytes:
+        pending = self._pending
+        self._pending = b""
+        return _a2b_base64_strict(pending) if pending else b""
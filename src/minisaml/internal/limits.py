@@ -0,0 +1,87 @@
+import functools
+
+from lxml.etree import _Element as Element
+
+from ..errors import (
+    AttributeCountLimitExceeded,
+    DepthLimitExceeded,
+    ElementCountLimitExceeded,
+)
+from .utils import ThreadLocalXPath
+
+
+class StructureLimiter:
+    """
+    Checks the number of elements, the nesting depth and the number of XML
+    attributes of a parsed document. `None` disables a limit.
+
+    The checks are XPath expressions evaluated by libxml2 once the document
+    has been parsed. Counting parse events in Python to reject documents
+    while they are parsed costs more per element than parsing itself. Each
+    limit is evaluated at most once, so a rejected document costs its parse
+    and the checks up to the exceeded limit.
+    """
+
+    __slots__ = (
+        "max_elements",
+        "max_depth",
+        "max_attributes",
+        "_too_deep",
+        "_too_many_elements",
+        "_too_many_attributes",
+    )
+
+    def __init__(
+        self,
+        *,
+        max_elements: int | None,
+        max_depth: int | None,
+        max_attributes: int | None,
+    ) -> None:
+        self.max_elements = max_elements
+        self.max_depth = max_depth
+        self.max_attributes = max_attributes
+        # Selects the elements nested one level deeper than allowed.
+        self._too_deep = (
+            None
+            if max_depth is None
+            else ThreadLocalXPath(f"boolean(/{'*/' * max_depth}*)")
+        )
+        self._too_many_elements = (
+            None
+            if max_elements is None
+            else ThreadLocalXPath(f"count(//*) > {max_elements}")
+        )
+        self._too_many_attributes = (
+            None
+            if max_attributes is None
+            else ThreadLocalXPath(f"count(//@*) > {max_attributes}")
+        )
+
+    def check_tree(self, tree: Element) -> None:
+        if self._too_many_elements is not None and self._too_many_elements.xpath(tree):
+            assert self.max_elements is not None
+            raise ElementCountLimitExceeded(limit=self.max_elements)
+        if self._too_deep is not None and self._too_deep.xpath(tree):
+            assert self.max_depth is not None
+            raise DepthLimitExceeded(limit=self.max_depth)
+        if self._too_many_attributes is not None and (
+            self._too_many_attributes.xpath(tree)
+        ):
+            assert self.max_attributes is not None
+            raise AttributeCountLimitExceeded(limit=self.max_attributes)
+
+
+@functools.lru_cache(maxsize=32)
+def structure_limiter(
+    max_elements: int | None, max_depth: int | None, max_attributes: int | None
+) -> StructureLimiter | None:
+    """
+    Returns a cached `StructureLimiter` for the given limits, or `None` if all
+    of them are disabled.
+    """
+    if max_elements is None and max_depth is None and max_attributes is None:
+        return None
+    return StructureLimiter(
+        max_elements=max_elements, max_depth=max_depth, max_attributes=max_attributes
+    )
@@ -1,8 +1,24 @@
+from minisignxml.internal.constants import XMLDSIG
 from minisignxml.internal.namespaces import make_namespace
 
-from .constants import NAMES_SAML2_ASSERTION, NAMES_SAML2_PROTOCOL
+from .constants import (
+    NAMES_SAML2_ASSERTION,
+    NAMES_SAML2_METADATA,
+    NAMES_SAML2_PROTOCOL,
+    XMLENC,
+    XMLENC11,
+)
 
 samlp = make_namespace("samlp", NAMES_SAML2_PROTOCOL)
 saml = make_namespace("saml", NAMES_SAML2_ASSERTION)
+xenc = make_namespace("xenc", XMLENC)
+md = make_namespace("md", NAMES_SAML2_METADATA)
 
-NAMESPACE_MAP = {"samlp": NAMES_SAML2_PROTOCOL, "saml": NAMES_SAML2_ASSERTION}
+NAMESPACE_MAP = {
+    "samlp": NAMES_SAML2_PROTOCOL,
+    "saml": NAMES_SAML2_ASSERTION,
+    "md": NAMES_SAML2_METADATA,
+    "ds": XMLDSIG,
+    "xenc": XMLENC,
+    "xenc11": XMLENC11,
+}
@@ -0,0 +1,25 @@
+from .utils import CompiledPath
+
+ASSERTION = CompiledPath("./saml:Assertion")
+ISSUER = CompiledPath("./saml:Issuer")
+SUBJECT = CompiledPath("./saml:Subject")
+NAME_ID = CompiledPath("./saml:NameID")
+SUBJECT_CONFIRMATION = CompiledPath("./saml:SubjectConfirmation")
+SUBJECT_CONFIRMATION_DATA = CompiledPath("./saml:SubjectConfirmationData")
+CONDITIONS = CompiledPath("./saml:Conditions")
+AUDIENCE = CompiledPath("./saml:AudienceRestriction/saml:Audience")
+AUTHN_STATEMENT = CompiledPath("./saml:AuthnStatement")
+ATTRIBUTE_STATEMENT = CompiledPath("./saml:AttributeStatement")
+ATTRIBUTE = CompiledPath("./saml:Attribute")
+ATTRIBUTE_VALUE = CompiledPath("./saml:AttributeValue")
+ENCRYPTED_ASSERTION = CompiledPath("./saml:EncryptedAssertion")
+SIGNATURE = CompiledPath("./ds:Signature")
+ENCRYPTED_DATA = CompiledPath("./xenc:EncryptedData")
+ENCRYPTED_KEY = CompiledPath("./xenc:EncryptedKey")
+KEY_INFO_ENCRYPTED_KEY = CompiledPath("./ds:KeyInfo/xenc:EncryptedKey")
+KEY_INFO_CERTIFICATE = CompiledPath("./ds:KeyInfo/ds:X509Data/ds:X509Certificate")
+ENCRYPTION_METHOD = CompiledPath("./xenc:EncryptionMethod")
+CIPHER_VALUE = CompiledPath("./xenc:CipherData/xenc:CipherValue")
+IDP_SSO_DESCRIPTOR = CompiledPath("./md:IDPSSODescriptor")
+KEY_DESCRIPTOR = CompiledPath("./md:KeyDescriptor")
+SINGLE_SIGN_ON_SERVICE = CompiledPath("./md:SingleSignOnService")
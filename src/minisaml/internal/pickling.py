@@ -0,0 +1,54 @@
+import copyreg
+import io
+import pickle
+from typing import Any
+
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509 import Certificate, load_der_x509_certificate
+from defusedxml.lxml import RestrictedElement
+from lxml.etree import _Element as Element
+from lxml.etree import tostring
+from minisignxml.errors import CertificateMismatch
+
+from .utils import deserialize_xml
+
+
+def load_certificate(der: bytes) -> Certificate:
+    # load_der_x509_certificate itself can't be referenced by pickle
+    return load_der_x509_certificate(der)
+
+
+def reduce_certificate(certificate: Certificate) -> tuple[Any, tuple[bytes]]:
+    return load_certificate, (certificate.public_bytes(Encoding.DER),)
+
+
+def reduce_element(element: Element) -> tuple[Any, tuple[bytes]]:
+    return deserialize_xml, (tostring(element, with_tail=False),)
+
+
+def reduce_certificate_mismatch(
+    error: CertificateMismatch,
+) -> tuple[Any, tuple[Any, ...]]:
+    return CertificateMismatch, (
+        error.received_certificate,
+        error.expected_certificates,
+    )
+
+
+class _ResultPickler(pickle.Pickler):
+    # Allows errors raised by minisignxml, which hold certificates and elements,
+    # to be sent between processes. The reducers only apply to this pickler,
+    # not to pickle or multiprocessing in general.
+    dispatch_table = {
+        **copyreg.dispatch_table,
+        Certificate: reduce_certificate,
+        CertificateMismatch: reduce_certificate_mismatch,
+        Element: reduce_element,
+        RestrictedElement: reduce_element,
+    }
+
+
+def dumps(obj: object) -> bytes:
+    buffer = io.BytesIO()
+    _ResultPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
@@ -1,42 +1,145 @@
 import datetime
-
-from minisignxml.internal.utils import serialize_xml
+import functools
+import re
+import secrets
 
 from .constants import (
     BINDINGS_HTTP_POST,
     DATE_TIME_FORMAT,
-    DATE_TIME_FORMAT_FRACTIONAL,
     NAMEID_FORMAT_UNSPECIFIED,
 )
-from .namespaces import saml, samlp
 
 
 def datetime_to_saml(t: datetime.datetime) -> str:
     return t.strftime(DATE_TIME_FORMAT)
 
 
+# UTC offsets range from -12:00 to +14:00.
+MAX_OFFSET_HOURS = 14
+
+# Matches DATE_TIME_FORMAT and DATE_TIME_FORMAT_FRACTIONAL, additionally
+# allowing any number of fractional digits and numeric UTC offsets.
+DATE_TIME_PATTERN = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?"
+    r"(?:Z|([+-])(\d{2}):(\d{2}))",
+    re.ASCII,
+)
+
+
+@functools.lru_cache(maxsize=256)
 def saml_to_datetime(s: str) -> datetime.datetime:
-    if "." in s:
-        return datetime.datetime.strptime(s, DATE_TIME_FORMAT_FRACTIONAL).replace(
-            tzinfo=datetime.timezone.utc
-        )
-    return datetime.datetime.strptime(s, DATE_TIME_FORMAT).replace(
-        tzinfo=datetime.timezone.utc
+    match = DATE_TIME_PATTERN.fullmatch(s)
+    if match is None:
+        raise ValueError(f"Invalid SAML date time {s!r}")
+    (
+        year,
+        month,
+        day,
+        hour,
+        minute,
+        second,
+        fraction,
+        offset_sign,
+        offset_hours,
+        offset_minutes,
+    ) = match.groups()
+    result = datetime.datetime(
+        int(year),
+        int(month),
+        int(day),
+        int(hour),
+        int(minute),
+        int(second),
+        int(fraction[:6].ljust(6, "0")) if fraction else 0,
+        tzinfo=datetime.timezone.utc,
     )
+    if offset_sign is not None:
+        if int(offset_hours) > MAX_OFFSET_HOURS or int(offset_minutes) > 59:
+            raise ValueError(f"Invalid SAML date time offset {s!r}")
+        offset = datetime.timedelta(
+            hours=int(offset_hours), minutes=int(offset_minutes)
+        )
+        try:
+            result = result - offset if offset_sign == "+" else result + offset
+        except OverflowError:
+            raise ValueError(f"SAML date time {s!r} is out of range") from None
+    return result
 
 
 def build_saml_request(
-    issuer: str, acs_url: str, request_id: str, force_reauthentication: bool
+    issuer: str,
+    acs_url: str,
+    request_id: str,
+    force_reauthentication: bool,
+    issue_instant: str | None = None,
 ) -> bytes:
+    # Imported here so parsing timestamps does not load lxml and minisignxml.
+    from minisignxml.internal.utils import serialize_xml
+
+    from .namespaces import saml, samlp
+
     request = samlp.AuthnRequest(
         saml.Issuer(issuer),
         samlp.NameIDPolicy(Format=NAMEID_FORMAT_UNSPECIFIED),
         ID=request_id,
         Version="2.0",
-        IssueInstant=datetime_to_saml(datetime.datetime.now(datetime.timezone.utc)),
+        IssueInstant=issue_instant
+        or datetime_to_saml(datetime.datetime.now(datetime.timezone.utc)),
         ProtocolBinding=BINDINGS_HTTP_POST,
         AssertionConsumerServiceURL=acs_url,
     )
     if force_reauthentication:
         request.set("ForceAuthn", "true")
     return serialize_xml(request)
+
+
+# Characters which exclusive C14N escapes in attribute values.
+ATTRIBUTE_ESCAPED_CHARACTERS = re.compile(r'[&<"]')
+
+
+class SAMLRequestTemplate:
+    """
+    Serialized SAML request for a fixed issuer, ACS URL and re-authentication
+    setting. `render` produces the same bytes as `build_saml_request` without
+    building and serializing a tree.
+    """
+
+    def __init__(self, issuer: str, acs_url: str, force_reauthentication: bool) -> None:
+        self.issuer = issuer
+        self.acs_url = acs_url
+        self.force_reauthentication = force_reauthentication
+        id_marker = secrets.token_hex()
+        issue_instant_marker = secrets.token_hex()
+        xml = build_saml_request(
+            issuer=issuer,
+            acs_url=acs_url,
+            request_id=id_marker,
+            force_reauthentication=force_reauthentication,
+            issue_instant=issue_instant_marker,
+        )
+        # C14N sorts attributes by name, so ID always comes before IssueInstant
+        self._head, rest = xml.split(id_marker.encode())
+        self._middle, self._tail = rest.split(issue_instant_marker.encode())
+
+    def render(self, request_id: str) -> bytes:
+        if not request_id.isprintable() or ATTRIBUTE_ESCAPED_CHARACTERS.search(
+            request_id
+        ):
+            # Leave escaping and rejecting of invalid characters to lxml.
+            return build_saml_request(
+                issuer=self.issuer,
+                acs_url=self.acs_url,
+                request_id=request_id,
+                force_reauthentication=self.force_reauthentication,
+            )
+        return b"".join(
+            (
+                self._head,
+                request_id.encode("utf-8"),
+                self._middle,
+                datetime_to_saml(datetime.datetime.now(datetime.timezone.utc)).encode(
+                    "ascii"
+                ),
+                self._tail,
+            )
+        )
@@ -0,0 +1,62 @@
+import logging
+import time
+
+from cryptography.x509 import Certificate
+
+from ..certificates import fingerprint
+from ..tracing import StageTiming, ValidationObserver, ValidationTrace
+
+logger = logging.getLogger("minisaml")
+
+
+class TraceRecorder:
+    """
+    Collects the stage timings of a single validation for a
+    `ValidationObserver`. Each call to `mark` ends the current stage.
+    """
+
+    __slots__ = (
+        "observer",
+        "issuer",
+        "certificate",
+        "_start_time_ns",
+        "_start_counter_ns",
+        "_last_counter_ns",
+        "_stages",
+    )
+
+    def __init__(self, observer: ValidationObserver, issuer: str | None = None) -> None:
+        self.observer = observer
+        self.issuer = issuer
+        self.certificate: Certificate | None = None
+        self._start_time_ns = time.time_ns()
+        self._start_counter_ns = self._last_counter_ns = time.perf_counter_ns()
+        self._stages: list[StageTiming] = []
+
+    def _time_ns(self, counter_ns: int) -> int:
+        return self._start_time_ns + counter_ns - self._start_counter_ns
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter_ns()
+        self._stages.append(
+            StageTiming(stage, self._time_ns(self._last_counter_ns), self._time_ns(now))
+        )
+        self._last_counter_ns = now
+
+    def finish(self, error: BaseException | None = None) -> None:
+        trace = ValidationTrace(
+            start_time_ns=self._start_time_ns,
+            end_time_ns=self._time_ns(time.perf_counter_ns()),
+            stages=tuple(self._stages),
+            issuer=self.issuer,
+            certificate_fingerprint=None
+            if self.certificate is None
+            else fingerprint(self.certificate).hex(),
+            error=error,
+        )
+        try:
+            self.observer.observe(trace)
+        except Exception:
+            # A failing observer must neither mask the validation error nor
+            # reject a valid response.
+            logger.exception("Validation observer %r failed", self.observer)
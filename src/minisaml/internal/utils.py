@@ -1,8 +1,100 @@
+import threading
+from collections.abc import Mapping
+from typing import cast
+
+from defusedxml.lxml import RestrictedElement, check_docinfo, fromstring
+from lxml.etree import ElementDefaultClassLookup, XMLParser, XPath
 from lxml.etree import _Element as Element
 from minisignxml.internal import utils
 
 from .namespaces import NAMESPACE_MAP
 
 
+class _ParserTLS(threading.local):
+    parser: XMLParser | None = None
+
+
+_parser_tls = _ParserTLS()
+
+
+def _new_parser() -> XMLParser:
+    # Same configuration as the defusedxml default parser, but comments are
+    # dropped while parsing. Exclusive C14N (which is what the signature
+    # covers) ignores comments, so the tree we read values from has to
+    # ignore them as well, otherwise a comment inside a signed text node
+    # would truncate the value returned by `.text`.
+    parser = XMLParser(resolve_entities=False, remove_comments=True)
+    parser.set_element_class_lookup(
+        ElementDefaultClassLookup(element=RestrictedElement)
+    )
+    return parser
+
+
+def _get_parser() -> XMLParser:
+    parser = _parser_tls.parser
+    if parser is None:
+        parser = _parser_tls.parser = _new_parser()
+    return parser
+
+
+def deserialize_xml(xml: bytes) -> Element:
+    return fromstring(xml, parser=_get_parser())
+
+
+class XMLFeedParser:
+    """
+    Incremental equivalent of `deserialize_xml`. Each instance uses its own
+    parser, so streams read concurrently on the same thread (for example by
+    coroutines) do not interfere with each other.
+    """
+
+    __slots__ = ("_parser",)
+
+    def __init__(self) -> None:
+        self._parser = _new_parser()
+
+    def feed(self, data: bytes) -> None:
+        if data:
+            self._parser.feed(data)
+
+    def close(self) -> Element:
+        root: Element = self._parser.close()
+        check_docinfo(root.getroottree())
+        return root
+
+
 def find_or_raise(element: Element, path: str) -> Element:
     return utils.find_or_raise(element, path, NAMESPACE_MAP)
+
+
+class ThreadLocalXPath(threading.local):
+    """
+    XPath expression compiled once per thread. lxml serializes concurrent
+    evaluations of the same `XPath` object with a lock, so sharing one
+    between threads would make every thread evaluating it wait for the
+    others. `threading.local` calls `__init__` again in every other thread
+    using the instance, which compiles the expression for that thread.
+    """
+
+    def __init__(self, path: str, namespaces: Mapping[str, str] | None = None) -> None:
+        self.path = path
+        self.xpath = XPath(path, namespaces=namespaces)
+
+
+class CompiledPath:
+    """
+    Precompiled equivalent of `find_or_raise(element, path)` for paths used on
+    every response. Raises the same errors as `find_or_raise`.
+    """
+
+    __slots__ = ("path", "_local")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = ThreadLocalXPath(path, NAMESPACE_MAP)
+
+    def find_all(self, element: Element) -> list[Element]:
+        return cast(list[Element], self._local.xpath(element))
+
+    def find_one(self, element: Element) -> Element:
+        return utils.exactly_one(self.find_all(element), self.path, element)
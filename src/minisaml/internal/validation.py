@@ -0,0 +1,941 @@
+"""
+Parsing and validation of SAML Responses. Imported by `minisaml.response` on
+first use, so importing the public API does not load lxml, minisignxml,
+cryptography or asyncio.
+"""
+
+import asyncio
+import binascii
+import copy
+import datetime
+import functools
+import hashlib
+import itertools
+from collections.abc import AsyncIterable, Callable, Collection, Iterable, Sequence
+from concurrent.futures import Executor
+from typing import TypeVar
+
+from cryptography.x509 import Certificate, load_der_x509_certificate
+from lxml.etree import QName, XMLSyntaxError
+from lxml.etree import _Element as Element
+from minisignxml.config import VerifyConfig
+from minisignxml.errors import ElementNotFound, MiniSignXMLError
+
+from ..certificates import CertificateStore
+from ..encryption import AssertionDecryptor
+from ..errors import (
+    AudienceMismatch,
+    DecodedSizeLimitExceeded,
+    EncodedSizeLimitExceeded,
+    IssuerMismatch,
+    MalformedSAMLResponse,
+    MiniSAMLError,
+    ReplayCacheFull,
+    ReplayDetected,
+    ResponseExpired,
+    ResponseLimitExceeded,
+    ResponseTooEarly,
+    UnsolicitedResponse,
+)
+from ..replay import ReplayProtection
+from ..response import (
+    AsyncGetConfigForIssuer,
+    Attribute,
+    ExpectedAudience,
+    Readable,
+    Response,
+    ResponseCache,
+    ResponseData,
+    ResponseLimits,
+    ResponseStream,
+    State,
+    SyncGetConfigForIssuer,
+    TimeDriftLimits,
+    ValidationConfig,
+    _LazyAttributes,
+    gather_attributes,
+)
+from ..tracing import (
+    STAGE_CACHE,
+    STAGE_DECODE,
+    STAGE_DECRYPT,
+    STAGE_EXTRACT,
+    STAGE_PARSE,
+    STAGE_PREFILTER,
+    STAGE_REPLAY,
+    STAGE_TENANT_LOOKUP,
+    STAGE_VERIFY,
+    ValidationObserver,
+)
+from . import paths
+from .constants import NAMES_SAML2_ASSERTION, NAMES_SAML2_PROTOCOL
+from .encoding import Base64Decoder, decode_base64
+from .limits import structure_limiter
+from .saml import saml_to_datetime
+from .tracing import TraceRecorder
+from .utils import XMLFeedParser, deserialize_xml
+from .verify import PreparedVerifyConfig, extract_verified_element_and_certificate
+
+T = TypeVar("T")
+
+# Errors which depend on more than the response and the validation parameters
+# and may not be raised again when the same response is validated later.
+_UNCACHEABLE_ERRORS = (
+    ResponseTooEarly,
+    ReplayDetected,
+    UnsolicitedResponse,
+    ReplayCacheFull,
+)
+
+_DEFAULT_VERIFY_CONFIG = PreparedVerifyConfig.of(VerifyConfig.default())
+
+
+async def run_in_executor(
+    func: Callable[[], T],
+    executor: Executor | None,
+    concurrency_limit: asyncio.Semaphore | None,
+) -> T:
+    loop = asyncio.get_running_loop()
+    if concurrency_limit is None:
+        return await loop.run_in_executor(executor, func)
+    async with concurrency_limit:
+        return await loop.run_in_executor(executor, func)
+
+
+def validate_multi_tenant_tree(
+    *,
+    tree: Element,
+    get_config_for_issuer: SyncGetConfigForIssuer[State]
+    | AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    decoded: bytes | None = None,
+    digest: bytes | None = None,
+    trace: TraceRecorder | None = None,
+) -> tuple[Response, State] | asyncio.Future[tuple[Response, State]]:
+    issuer = _get_issuer(tree)
+    if trace is not None:
+        trace.issuer = issuer
+    maybe_awaitable = get_config_for_issuer(issuer)
+
+    if isinstance(maybe_awaitable, tuple):
+        if trace is not None:
+            trace.mark(STAGE_TENANT_LOOKUP)
+        config, state = maybe_awaitable
+        return (
+            _validate_tenant_tree(
+                tree=tree,
+                decoded=decoded,
+                digest=digest,
+                config=config,
+                expected_audience=expected_audience,
+                issuer=issuer,
+                trace=trace,
+            ),
+            state,
+        )
+    else:
+        result_future: asyncio.Future[tuple[Response, State]] = asyncio.Future()
+
+        def handle_result(
+            task: "asyncio.Future[tuple[ValidationConfig, State]]",
+        ) -> None:
+            if task.cancelled():
+                result_future.cancel()
+                return
+
+            try:
+                config, state = task.result()
+                if trace is not None:
+                    trace.mark(STAGE_TENANT_LOOKUP)
+
+                result_future.set_result(
+                    (
+                        _validate_tenant_tree(
+                            tree=tree,
+                            decoded=decoded,
+                            digest=digest,
+                            config=config,
+                            expected_audience=expected_audience,
+                            issuer=issuer,
+                            trace=trace,
+                        ),
+                        state,
+                    )
+                )
+            except Exception as exc:
+                result_future.set_exception(exc)
+
+        task = asyncio.ensure_future(maybe_awaitable)
+        task.add_done_callback(handle_result)
+        return result_future
+
+
+def finish_multi_tenant_trace(
+    trace: TraceRecorder,
+    result: tuple[Response, State] | asyncio.Future[tuple[Response, State]],
+) -> tuple[Response, State] | asyncio.Future[tuple[Response, State]]:
+    """
+    Finishes `trace` once the `result` of `validate_multi_tenant_tree` is
+    known.
+    """
+    if isinstance(result, tuple):
+        trace.finish()
+    else:
+
+        def finish_trace(future: asyncio.Future[tuple[Response, State]]) -> None:
+            if not future.cancelled():
+                trace.finish(future.exception())
+
+        result.add_done_callback(finish_trace)
+    return result
+
+
+def _validate_tenant_tree(
+    *,
+    tree: Element,
+    decoded: bytes | None,
+    digest: bytes | None,
+    config: ValidationConfig,
+    expected_audience: ExpectedAudience,
+    issuer: str,
+    trace: TraceRecorder | None = None,
+) -> Response:
+    def validate() -> Response:
+        return validate_tree(
+            tree=tree,
+            certificate=config._certificate_store,
+            expected_audience=expected_audience,
+            idp_issuer=issuer,
+            signature_verification_config=config._prepared_verify_config,
+            allowed_time_drift=config.allowed_time_drift,
+            replay_protection=config.replay_protection,
+            attribute_names=config.attribute_names,
+            prefilter=config.prefilter,
+            decryptor=config.decryptor,
+            tree_limits=config.limits,
+            trace=trace,
+        )
+
+    if config.response_cache is None:
+        return validate()
+    if digest is None:
+        # Responses which were not streamed are only hashed if needed.
+        assert decoded is not None
+        digest = hashlib.sha256(decoded).digest()
+    # The configuration is only known once the response has been parsed, so
+    # only verification is skipped for resubmitted responses.
+    return _validate_cached(
+        response_cache=config.response_cache,
+        digest=digest,
+        parameters=(config, expected_audience, issuer),
+        validate=validate,
+        replay_protection=config.replay_protection,
+        allowed_time_drift=config.allowed_time_drift,
+        trace=trace,
+    )
+
+
+async def validate_multi_tenant_tree_async(
+    *,
+    tree: Element,
+    get_config_for_issuer: SyncGetConfigForIssuer[State]
+    | AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    executor: Executor | None,
+    concurrency_limit: asyncio.Semaphore | None,
+    decoded: bytes | None = None,
+    digest: bytes | None = None,
+    trace: TraceRecorder | None = None,
+) -> tuple[Response, State]:
+    issuer = _get_issuer(tree)
+    if trace is not None:
+        trace.issuer = issuer
+    maybe_awaitable = get_config_for_issuer(issuer)
+    if isinstance(maybe_awaitable, tuple):
+        config, state = maybe_awaitable
+    else:
+        config, state = await maybe_awaitable
+    if trace is not None:
+        trace.mark(STAGE_TENANT_LOOKUP)
+    response = await run_in_executor(
+        functools.partial(
+            _validate_tenant_tree,
+            tree=tree,
+            decoded=decoded,
+            digest=digest,
+            config=config,
+            expected_audience=expected_audience,
+            issuer=issuer,
+            trace=trace,
+        ),
+        executor,
+        concurrency_limit,
+    )
+    return response, state
+
+
+def validate_response_cached(
+    *,
+    data: ResponseData,
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None,
+    allowed_time_drift: TimeDriftLimits,
+    replay_protection: ReplayProtection | None,
+    attribute_names: Collection[str] | None,
+    prefilter: bool,
+    limits: ResponseLimits | None,
+    decryptor: AssertionDecryptor | None,
+    observer: ValidationObserver | None,
+    response_cache: ResponseCache,
+) -> Response:
+    if signature_verification_config is None:
+        signature_verification_config = _DEFAULT_VERIFY_CONFIG
+    trace = None if observer is None else TraceRecorder(observer, idp_issuer)
+    try:
+        decoded = _decode_and_check(data, trace, limits)
+        # The response is looked up before it is parsed, resubmitted
+        # responses are neither parsed nor verified again.
+        response = _validate_cached(
+            response_cache=response_cache,
+            digest=hashlib.sha256(decoded).digest(),
+            parameters=(
+                certificate,
+                expected_audience,
+                idp_issuer,
+                signature_verification_config,
+                allowed_time_drift,
+                attribute_names,
+                prefilter,
+                limits,
+                decryptor,
+            ),
+            validate=lambda: validate_tree(
+                tree=_parse_decoded(decoded, trace, limits),
+                certificate=certificate,
+                expected_audience=expected_audience,
+                idp_issuer=idp_issuer,
+                signature_verification_config=signature_verification_config,
+                allowed_time_drift=allowed_time_drift,
+                replay_protection=replay_protection,
+                attribute_names=attribute_names,
+                prefilter=prefilter,
+                decryptor=decryptor,
+                trace=trace,
+            ),
+            replay_protection=replay_protection,
+            allowed_time_drift=allowed_time_drift,
+            trace=trace,
+        )
+    except Exception as exc:
+        if trace is not None:
+            trace.finish(exc)
+        raise
+    if trace is not None:
+        trace.finish()
+    return response
+
+
+def _validate_cached(
+    *,
+    response_cache: ResponseCache,
+    digest: bytes,
+    parameters: tuple[object, ...],
+    validate: Callable[[], Response],
+    replay_protection: ReplayProtection | None,
+    allowed_time_drift: TimeDriftLimits,
+    trace: TraceRecorder | None,
+) -> Response:
+    """
+    Returns the cached outcome of validating the response with `digest` with
+    `parameters`, or calls `validate` and caches its outcome.
+    """
+    cached = response_cache._get(digest, parameters)
+    if cached is None:
+        try:
+            response = validate()
+        except (MiniSAMLError, MiniSignXMLError) as exc:
+            if not isinstance(exc, _UNCACHEABLE_ERRORS):
+                try:
+                    # Without the traceback and the frames it references.
+                    error = copy.copy(exc)
+                except Exception:
+                    pass
+                else:
+                    response_cache._store(digest, parameters, error)
+            raise
+        response_cache._store(digest, parameters, response)
+        return response
+    if trace is not None:
+        trace.mark(STAGE_CACHE)
+    if not isinstance(cached, Response):
+        raise copy.copy(cached)
+    if trace is not None:
+        trace.certificate = cached.certificate
+    if replay_protection is not None:
+        # Set on every response returned by `validate_tree`.
+        assert cached.not_on_or_after is not None
+        replay_protection.check(
+            assertion_id=cached.assertion_id,
+            in_response_to=cached.in_response_to,
+            expires_at=cached.not_on_or_after
+            + allowed_time_drift.not_on_or_after_max_drift,
+        )
+        if trace is not None:
+            trace.mark(STAGE_REPLAY)
+    return cached
+
+
+def parse_response(
+    data: ResponseData,
+    trace: TraceRecorder | None = None,
+    limits: ResponseLimits | None = None,
+) -> Element:
+    if trace is None and limits is None:
+        return _deserialize_response(_decode_response(data))
+    return _parse_decoded(_decode_and_check(data, trace, limits), trace, limits)
+
+
+def decode_and_parse(
+    data: ResponseData,
+    trace: TraceRecorder | None = None,
+    limits: ResponseLimits | None = None,
+) -> tuple[bytes, Element]:
+    decoded = _decode_and_check(data, trace, limits)
+    return decoded, _parse_decoded(decoded, trace, limits)
+
+
+def _decode_and_check(
+    data: ResponseData,
+    trace: TraceRecorder | None = None,
+    limits: ResponseLimits | None = None,
+) -> bytes:
+    if limits is not None:
+        _check_size(
+            _encoded_size(data), limits.max_encoded_size, EncodedSizeLimitExceeded
+        )
+    decoded = _decode_response(data)
+    if limits is not None:
+        _check_size(len(decoded), limits.max_decoded_size, DecodedSizeLimitExceeded)
+    if trace is not None:
+        trace.mark(STAGE_DECODE)
+    return decoded
+
+
+def _parse_decoded(
+    decoded: bytes,
+    trace: TraceRecorder | None = None,
+    limits: ResponseLimits | None = None,
+) -> Element:
+    tree = _deserialize_response(decoded)
+    if limits is not None:
+        _check_structure(limits, tree)
+    if trace is not None:
+        trace.mark(STAGE_PARSE)
+    return tree
+
+
+def _decode_response(data: ResponseData) -> bytes:
+    try:
+        return decode_base64(data)
+    except binascii.Error:
+        raise MalformedSAMLResponse("SAML Response is not valid base64")
+
+
+def _deserialize_response(decoded: bytes) -> Element:
+    try:
+        return deserialize_xml(decoded)
+    except XMLSyntaxError:
+        raise MalformedSAMLResponse("SAML Response is not well-formed XML")
+
+
+def _encoded_size(data: ResponseData) -> int:
+    return data.nbytes if isinstance(data, memoryview) else len(data)
+
+
+def _check_size(
+    size: int,
+    limit: int | None,
+    error: type[ResponseLimitExceeded],
+) -> None:
+    if limit is not None and size > limit:
+        raise error(limit=limit)
+
+
+class _ResponseStreamParser:
+    """
+    Decodes and parses a SAML Response from chunks of its base64 encoding,
+    rejecting it as soon as it exceeds `limits`. If `digest` is true, the
+    SHA-256 digest of the decoded response is computed along the way. Reading,
+    decoding and parsing the stream are traced as a single parse stage.
+    """
+
+    __slots__ = (
+        "_limits",
+        "_trace",
+        "_decoder",
+        "_parser",
+        "_hash",
+        "_encoded_size",
+        "_decoded_size",
+    )
+
+    def __init__(
+        self,
+        limits: ResponseLimits | None,
+        trace: TraceRecorder | None = None,
+        digest: bool = False,
+    ) -> None:
+        self._limits = limits
+        self._trace = trace
+        self._decoder = Base64Decoder()
+        self._parser = XMLFeedParser()
+        self._hash = hashlib.sha256() if digest else None
+        self._encoded_size = 0
+        self._decoded_size = 0
+
+    def digest(self) -> bytes:
+        assert self._hash is not None
+        return self._hash.digest()
+
+    def feed(self, chunk: bytes) -> None:
+        self.count(chunk)
+        self._decode(chunk)
+
+    def count(self, chunk: bytes) -> None:
+        """
+        Checks the encoded size limit for `chunk` without decoding it.
+        """
+        if self._limits is not None:
+            self._encoded_size += len(chunk)
+            _check_size(
+                self._encoded_size,
+                self._limits.max_encoded_size,
+                EncodedSizeLimitExceeded,
+            )
+
+    def parse_counted(self, chunks: Iterable[bytes]) -> Element:
+        """
+        Decodes and parses `chunks`, which were already passed to `count`.
+        """
+        for chunk in chunks:
+            self._decode(chunk)
+        return self.close()
+
+    def close(self) -> Element:
+        try:
+            decoded = self._decoder.final()
+        except binascii.Error:
+            raise MalformedSAMLResponse("SAML Response is not valid base64")
+        self._feed_decoded(decoded)
+        try:
+            tree = self._parser.close()
+        except XMLSyntaxError:
+            raise MalformedSAMLResponse("SAML Response is not well-formed XML")
+        if self._limits is not None:
+            _check_structure(self._limits, tree)
+        if self._trace is not None:
+            self._trace.mark(STAGE_PARSE)
+        return tree
+
+    def _decode(self, chunk: bytes) -> None:
+        try:
+            decoded = self._decoder.decode(chunk)
+        except binascii.Error:
+            raise MalformedSAMLResponse("SAML Response is not valid base64")
+        self._feed_decoded(decoded)
+
+    def _feed_decoded(self, data: bytes) -> None:
+        if self._limits is not None:
+            self._decoded_size += len(data)
+            _check_size(
+                self._decoded_size,
+                self._limits.max_decoded_size,
+                DecodedSizeLimitExceeded,
+            )
+        if self._hash is not None:
+            self._hash.update(data)
+        try:
+            self._parser.feed(data)
+        except XMLSyntaxError:
+            raise MalformedSAMLResponse("SAML Response is not well-formed XML")
+
+
+def _read_chunks(stream: ResponseStream, chunk_size: int) -> Iterable[bytes]:
+    if isinstance(stream, Readable):
+        return iter(functools.partial(stream.read, chunk_size), b"")
+    return stream
+
+
+def parse_response_stream(
+    stream: ResponseStream,
+    chunk_size: int,
+    limits: ResponseLimits | None = None,
+    trace: TraceRecorder | None = None,
+) -> Element:
+    parser = _ResponseStreamParser(limits, trace)
+    for chunk in _read_chunks(stream, chunk_size):
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def _parse_stream_async(
+    parser: _ResponseStreamParser,
+    stream: AsyncIterable[bytes],
+    executor: Executor | None,
+) -> Element:
+    """
+    Reads `stream` on the event loop, only checking its encoded size as the
+    chunks arrive, and decodes and parses it in a single call on `executor`.
+    lxml parsers must not be used from more than one thread, even one after
+    the other, so feeding each chunk on the executor as it arrives is not an
+    option.
+    """
+    chunks: list[bytes] = []
+    async for chunk in stream:
+        parser.count(chunk)
+        chunks.append(chunk)
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, parser.parse_counted, chunks
+    )
+
+
+async def parse_response_stream_async(
+    stream: AsyncIterable[bytes],
+    limits: ResponseLimits | None = None,
+    trace: TraceRecorder | None = None,
+    executor: Executor | None = None,
+) -> Element:
+    return await _parse_stream_async(
+        _ResponseStreamParser(limits, trace), stream, executor
+    )
+
+
+def digest_and_parse_stream(
+    stream: ResponseStream,
+    chunk_size: int,
+    limits: ResponseLimits | None = None,
+    trace: TraceRecorder | None = None,
+) -> tuple[bytes, Element]:
+    parser = _ResponseStreamParser(limits, trace, digest=True)
+    for chunk in _read_chunks(stream, chunk_size):
+        parser.feed(chunk)
+    tree = parser.close()
+    return parser.digest(), tree
+
+
+async def digest_and_parse_stream_async(
+    stream: AsyncIterable[bytes],
+    limits: ResponseLimits | None = None,
+    trace: TraceRecorder | None = None,
+    executor: Executor | None = None,
+) -> tuple[bytes, Element]:
+    parser = _ResponseStreamParser(limits, trace, digest=True)
+    tree = await _parse_stream_async(parser, stream, executor)
+    return parser.digest(), tree
+
+
+def _get_issuer(tree: Element) -> str:
+    if not paths.ASSERTION.find_all(tree) and paths.ENCRYPTED_ASSERTION.find_all(tree):
+        # The assertion can only be decrypted once the configuration of the
+        # issuer is known, so the issuer of the response is used instead. It
+        # is compared to the issuer of the verified assertion later on.
+        response_issuer: str = paths.ISSUER.find_one(tree).text
+        return response_issuer
+    assertion = paths.ASSERTION.find_one(tree)
+    issuer: str = paths.ISSUER.find_one(assertion).text
+    return issuer
+
+
+def validate_tree(
+    *,
+    tree: Element,
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None,
+    allowed_time_drift: TimeDriftLimits,
+    replay_protection: ReplayProtection | None,
+    attribute_names: Collection[str] | None,
+    prefilter: bool = False,
+    decryptor: AssertionDecryptor | None = None,
+    tree_limits: ResponseLimits | None = None,
+    trace: TraceRecorder | None = None,
+) -> Response:
+    if signature_verification_config is None:
+        signature_verification_config = _DEFAULT_VERIFY_CONFIG
+    if tree_limits is not None:
+        # The limits of multi-tenant configurations are only known once the
+        # response has been parsed, so its structure is checked afterwards.
+        _check_structure(tree_limits, tree)
+    if prefilter:
+        _prefilter_tree(
+            tree=tree,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            allowed_time_drift=allowed_time_drift,
+        )
+        if trace is not None:
+            trace.mark(STAGE_PREFILTER)
+    if paths.ENCRYPTED_ASSERTION.find_all(tree):
+        element, certificate_used = _decrypt_and_verify(
+            tree=tree,
+            certificate=certificate,
+            signature_verification_config=signature_verification_config,
+            decryptor=decryptor,
+            trace=trace,
+        )
+    else:
+        element, certificate_used = extract_verified_element_and_certificate(
+            tree=tree,
+            certificates=CertificateStore.of(certificate),
+            config=signature_verification_config,
+        )
+        if trace is not None:
+            trace.certificate = certificate_used
+            trace.mark(STAGE_VERIFY)
+    if element.tag == QName(NAMES_SAML2_PROTOCOL, "Response"):
+        assertion = paths.ASSERTION.find_one(element)
+    elif element.tag == QName(NAMES_SAML2_ASSERTION, "Assertion"):
+        assertion = element
+    else:
+        raise MalformedSAMLResponse(
+            "Signed element is neither a Response with an Assertion, nor an Assertion"
+        )
+    issuer = paths.ISSUER.find_one(assertion).text
+    if issuer != idp_issuer:
+        raise IssuerMismatch(received_issuer=issuer, expected_issuer=idp_issuer)
+    subject = paths.SUBJECT.find_one(assertion)
+    name_id = paths.NAME_ID.find_one(subject).text
+    subject_confirmation_method = paths.SUBJECT_CONFIRMATION.find_one(subject)
+    subject_confirmation_data = paths.SUBJECT_CONFIRMATION_DATA.find_one(
+        subject_confirmation_method
+    )
+    in_response_to = subject_confirmation_data.attrib.get("InResponseTo", None)
+    conditions = paths.CONDITIONS.find_one(assertion)
+    not_before = _conditions_time(conditions, "NotBefore")
+    not_on_or_after = _conditions_time(conditions, "NotOnOrAfter")
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if now + allowed_time_drift.not_before_max_drift < not_before:
+        raise ResponseTooEarly(observed_time=now, not_before=not_before)
+    if now - allowed_time_drift.not_on_or_after_max_drift >= not_on_or_after:
+        raise ResponseExpired(observed_time=now, not_on_or_after=not_on_or_after)
+
+    audience = _match_audience(conditions, expected_audience)
+
+    raw_session_not_on_or_after = paths.AUTHN_STATEMENT.find_one(assertion).attrib.get(
+        "SessionNotOnOrAfter", None
+    )
+
+    try:
+        session_not_on_or_after = raw_session_not_on_or_after and saml_to_datetime(
+            raw_session_not_on_or_after
+        )
+    except (ValueError, OverflowError):
+        raise MalformedSAMLResponse(
+            f"Invalid SessionNotOnOrAfter {raw_session_not_on_or_after!r}"
+        ) from None
+
+    try:
+        attribute_statement = paths.ATTRIBUTE_STATEMENT.find_one(assertion)
+    except ElementNotFound:
+        attribute_statement = None
+
+    attributes: Sequence[Attribute]
+    if attribute_statement is None:
+        attributes = []
+    elif attribute_names is not None:
+        # An allowlist usually keeps a handful of attributes, gathering them
+        # right away is cheaper than keeping a copy of the whole statement.
+        attributes = list(
+            gather_attributes(attribute_statement, attribute_names=attribute_names)
+        )
+    else:
+        attributes = _LazyAttributes(attribute_statement, attribute_names)
+
+    assertion_id = assertion.get("ID")
+
+    if trace is not None:
+        trace.mark(STAGE_EXTRACT)
+
+    if replay_protection is not None:
+        replay_protection.check(
+            assertion_id=assertion_id,
+            in_response_to=in_response_to,
+            expires_at=not_on_or_after + allowed_time_drift.not_on_or_after_max_drift,
+        )
+        if trace is not None:
+            trace.mark(STAGE_REPLAY)
+
+    return Response(
+        issuer=issuer,
+        name_id=name_id,
+        audience=audience,
+        attributes=attributes,
+        session_not_on_or_after=session_not_on_or_after,
+        in_response_to=in_response_to,
+        certificate=certificate_used,
+        assertion_id=assertion_id,
+        not_on_or_after=not_on_or_after,
+    )
+
+
+def _conditions_time(conditions: Element, name: str) -> datetime.datetime:
+    raw = conditions.get(name)
+    if raw is None:
+        raise MalformedSAMLResponse(f"Conditions without {name}")
+    try:
+        return saml_to_datetime(raw)
+    except (ValueError, OverflowError):
+        raise MalformedSAMLResponse(f"Invalid {name} {raw!r}") from None
+
+
+def _decrypt_and_verify(
+    *,
+    tree: Element,
+    certificate: Certificate | Collection[Certificate],
+    signature_verification_config: VerifyConfig,
+    decryptor: AssertionDecryptor | None,
+    trace: TraceRecorder | None,
+) -> tuple[Element, Certificate]:
+    if decryptor is None:
+        raise MalformedSAMLResponse(
+            "Response contains an encrypted assertion, but no decryptor is configured"
+        )
+    if not paths.SIGNATURE.find_all(tree):
+        # Only the assertion is signed, its signature is inside the encrypted
+        # data, so only AES-GCM, which authenticates the ciphertext, is
+        # accepted.
+        decryptor.decrypt_in_place(paths.ENCRYPTED_ASSERTION.find_one(tree))
+        if trace is not None:
+            trace.mark(STAGE_DECRYPT)
+        element, certificate_used = extract_verified_element_and_certificate(
+            tree=tree,
+            certificates=CertificateStore.of(certificate),
+            config=signature_verification_config,
+        )
+        if trace is not None:
+            trace.certificate = certificate_used
+            trace.mark(STAGE_VERIFY)
+        return element, certificate_used
+    # The response is signed, so the encrypted assertion is authenticated
+    # before it is decrypted, which makes AES-CBC safe to decrypt. Only the
+    # assertion of the verified element is decrypted.
+    element, certificate_used = extract_verified_element_and_certificate(
+        tree=tree,
+        certificates=CertificateStore.of(certificate),
+        config=signature_verification_config,
+    )
+    if trace is not None:
+        trace.certificate = certificate_used
+        trace.mark(STAGE_VERIFY)
+    if element.tag == QName(
+        NAMES_SAML2_PROTOCOL, "Response"
+    ) and paths.ENCRYPTED_ASSERTION.find_all(element):
+        decryptor.decrypt_in_place(
+            paths.ENCRYPTED_ASSERTION.find_one(element), authenticated=True
+        )
+        if trace is not None:
+            trace.mark(STAGE_DECRYPT)
+    return element, certificate_used
+
+
+def _prefilter_tree(
+    *,
+    tree: Element,
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    allowed_time_drift: TimeDriftLimits,
+) -> None:
+    """
+    Performs the issuer, time and audience checks of `validate_tree` on the
+    not yet verified assertion of `tree`, so that responses which would fail
+    them anyway are rejected without verifying their signature. Checks whose
+    input is missing or ambiguous are skipped, `validate_tree` repeats all
+    of them on the verified assertion.
+    """
+    if tree.tag == QName(NAMES_SAML2_ASSERTION, "Assertion"):
+        assertion = tree
+    else:
+        assertions = paths.ASSERTION.find_all(tree)
+        if len(assertions) != 1:
+            return
+        assertion = assertions[0]
+    issuers = paths.ISSUER.find_all(assertion)
+    if len(issuers) == 1 and issuers[0].text != idp_issuer:
+        raise IssuerMismatch(
+            received_issuer=issuers[0].text, expected_issuer=idp_issuer
+        )
+    conditions = paths.CONDITIONS.find_all(assertion)
+    if len(conditions) != 1:
+        return
+    try:
+        not_before = saml_to_datetime(conditions[0].attrib["NotBefore"])
+        not_on_or_after = saml_to_datetime(conditions[0].attrib["NotOnOrAfter"])
+    except (KeyError, ValueError, OverflowError):
+        # Left to `validate_tree`, so the response is rejected with the same
+        # error as without the prefilter.
+        pass
+    else:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if now + allowed_time_drift.not_before_max_drift < not_before:
+            raise ResponseTooEarly(observed_time=now, not_before=not_before)
+        if now - allowed_time_drift.not_on_or_after_max_drift >= not_on_or_after:
+            raise ResponseExpired(observed_time=now, not_on_or_after=not_on_or_after)
+    if paths.AUDIENCE.find_all(conditions[0]):
+        _match_audience(conditions[0], expected_audience)
+
+
+def _match_audience(conditions: Element, expected_audience: ExpectedAudience) -> str:
+    """
+    Returns the first audience of `conditions` accepted by `expected_audience`.
+    An assertion is only addressed to the audiences common to all of its
+    `AudienceRestriction` elements, so each of them has to contain an accepted
+    audience.
+    """
+    audiences = paths.AUDIENCE.find_all(conditions)
+    if len(audiences) == 1:
+        # Fast path for the usual single audience.
+        audience: str = audiences[0].text
+        if not _audience_accepted(audience, expected_audience):
+            raise AudienceMismatch(
+                received_audience=audience, expected_audience=expected_audience
+            )
+        return audience
+    if not audiences:
+        raise ElementNotFound(paths.AUDIENCE.path, conditions)
+    matched = None
+    for _, restriction in itertools.groupby(audiences, key=Element.getparent):
+        texts: list[str] = [audience.text for audience in restriction]
+        match = next(
+            (text for text in texts if _audience_accepted(text, expected_audience)),
+            None,
+        )
+        if match is None:
+            raise AudienceMismatch(
+                received_audience=texts[0], expected_audience=expected_audience
+            )
+        if matched is None:
+            matched = match
+    assert matched is not None
+    return matched
+
+
+def _audience_accepted(audience: str, expected_audience: ExpectedAudience) -> bool:
+    if isinstance(expected_audience, str):
+        return audience == expected_audience
+    return audience in expected_audience
+
+
+@functools.lru_cache(maxsize=32)
+def load_certificates(ders: tuple[bytes, ...]) -> CertificateStore:
+    return CertificateStore(load_der_x509_certificate(der) for der in ders)
+
+
+def _check_structure(limits: ResponseLimits, tree: Element) -> None:
+    limiter = structure_limiter(
+        limits.max_elements, limits.max_depth, limits.max_attributes
+    )
+    if limiter is not None:
+        limiter.check_tree(tree)
@@ -0,0 +1,166 @@
+from collections.abc import Mapping
+from dataclasses import dataclass
+from hmac import compare_digest
+from typing import cast
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.x509 import Certificate, load_der_x509_certificate
+from lxml.etree import _Element as Element
+from minisignxml.config import VerifyConfig
+from minisignxml.errors import (
+    CertificateMismatch,
+    UnsupportedAlgorithm,
+    VerificationFailed,
+)
+from minisignxml.internal import utils
+from minisignxml.internal.constants import (
+    XML_EXC_C14N,
+    XMLDSIG_ENVELOPED_SIGNATURE,
+    XMLDSIG_RSA_SHA1,
+    XMLDSIG_RSA_SHA256,
+    XMLDSIG_SHA1,
+    XMLENC_SHA256,
+)
+from minisignxml.internal.namespaces import NAMESPACE_MAP
+from minisignxml.internal.utils import base64_binary_content
+
+from ..certificates import CertificateStore, public_key
+from ..errors import MalformedSAMLResponse
+from .utils import ThreadLocalXPath
+
+_FIND_BY_ID = ThreadLocalXPath("descendant-or-self::*[@ID = $reference_id]")
+_PADDING = padding.PKCS1v15()
+
+
+@dataclass(frozen=True)
+class PreparedVerifyConfig(VerifyConfig):
+    """
+    `VerifyConfig` with its allowlists resolved to the algorithm URIs they
+    allow, so verifying a signature needs a single lookup per algorithm
+    instead of creating a hash object and checking it against the allowlist.
+    """
+
+    signature_methods: Mapping[str, hashes.HashAlgorithm]
+    digest_methods: Mapping[str, hashes.HashAlgorithm]
+
+    @classmethod
+    def of(cls, config: VerifyConfig) -> "PreparedVerifyConfig":
+        if isinstance(config, PreparedVerifyConfig):
+            return config
+        allowed_signature_method = tuple(config.allowed_signature_method)
+        allowed_digest_method = tuple(config.allowed_digest_method)
+        signature_methods = {
+            algorithm: hasher
+            for algorithm in (XMLDSIG_RSA_SHA1, XMLDSIG_RSA_SHA256)
+            if isinstance(
+                hasher := utils.signature_method_hasher(algorithm),
+                allowed_signature_method,
+            )
+        }
+        digest_methods = {
+            algorithm: hasher
+            for algorithm in (XMLDSIG_SHA1, XMLENC_SHA256)
+            if isinstance(
+                hasher := utils.digest_method_hasher(algorithm), allowed_digest_method
+            )
+        }
+        return cls(
+            allowed_signature_method=frozenset(allowed_signature_method),
+            allowed_digest_method=frozenset(allowed_digest_method),
+            signature_methods=signature_methods,
+            digest_methods=digest_methods,
+        )
+
+
+def extract_verified_element_and_certificate(
+    *,
+    tree: Element,
+    certificates: CertificateStore,
+    config: VerifyConfig = VerifyConfig.default(),
+) -> tuple[Element, Certificate]:
+    """
+    Equivalent of `minisignxml.verify.extract_verified_element_and_certificate`
+    operating on an already parsed document.
+
+    Unlike the minisignxml version, the verified element is not serialized and
+    parsed again, instead the referenced element of `tree` is returned. This is
+    safe as long as `tree` was parsed with `minisaml.internal.utils.deserialize_xml`,
+    which drops comments, so the returned element contains exactly the
+    information covered by the digest. Note that `tree` is modified in place as
+    the enveloped signature gets removed from it.
+
+    The certificate embedded in the signature is looked up in `certificates` by
+    its fingerprint, and the signature is verified using the cached public key
+    of the configured certificate, so the embedded certificate only needs to
+    be decoded if it does not match any configured certificate. Passing a
+    `PreparedVerifyConfig` avoids resolving the algorithm allowlists per call.
+    """
+    prepared = PreparedVerifyConfig.of(config)
+    signature = utils.find_or_raise(tree, ".//ds:Signature")
+    signed_info = utils.find_or_raise(signature, "./ds:SignedInfo")
+    signature_method = utils.find_or_raise(signed_info, "./ds:SignatureMethod")
+    signature_value = utils.find_or_raise(signature, "./ds:SignatureValue")
+    key_info = utils.find_or_raise(
+        signature, "./ds:KeyInfo/ds:X509Data/ds:X509Certificate"
+    )
+    xml_cert_der = base64_binary_content(key_info)
+    xml_cert = certificates.get_by_der(xml_cert_der)
+    if xml_cert is None:
+        raise CertificateMismatch(load_der_x509_certificate(xml_cert_der), certificates)
+    c14n_method = utils.find_or_raise(signed_info, "ds:CanonicalizationMethod")
+    if c14n_method.get("Algorithm") != XML_EXC_C14N:
+        raise UnsupportedAlgorithm(
+            c14n_method.get("Algorithm", "No algorithm specified")
+        )
+    signature_method_algorithm = signature_method.get("Algorithm")
+    if signature_method_algorithm is None:
+        raise UnsupportedAlgorithm("No algorithm specified")
+    signature_hasher = prepared.signature_methods.get(signature_method_algorithm)
+    if signature_hasher is None:
+        raise UnsupportedAlgorithm(signature_method_algorithm)
+    try:
+        public_key(xml_cert).verify(
+            base64_binary_content(signature_value),
+            utils.serialize_xml(signed_info),
+            _PADDING,
+            signature_hasher,
+        )
+    except InvalidSignature:
+        raise VerificationFailed()
+    reference = utils.find_or_raise(signed_info, "ds:Reference")
+    reference_uri = reference.get("URI", "")
+    if not reference_uri.startswith("#") or len(reference_uri) == 1:
+        raise MalformedSAMLResponse(
+            f"Unsupported signature Reference URI {reference_uri!r}"
+        )
+    reference_id = reference_uri[1:]
+    transforms = {
+        transform.get("Algorithm")
+        for transform in utils.find_or_raise(reference, "ds:Transforms").findall(
+            "./ds:Transform", NAMESPACE_MAP
+        )
+    }
+    if transforms != {XMLDSIG_ENVELOPED_SIGNATURE, XML_EXC_C14N}:
+        raise UnsupportedAlgorithm(transforms)
+    digest_method = utils.find_or_raise(reference, "ds:DigestMethod").get("Algorithm")
+    if digest_method is None:
+        raise UnsupportedAlgorithm("No algorithm specified")
+    digest_value = utils.find_or_raise(reference, "ds:DigestValue")
+    digest_hasher = prepared.digest_methods.get(digest_method)
+    if digest_hasher is None:
+        raise UnsupportedAlgorithm(digest_method)
+    referenced_element = utils.exactly_one(
+        cast(list[Element], _FIND_BY_ID.xpath(tree, reference_id=reference_id)),
+        f".//*[@ID = {reference_id!r}]",
+        tree,
+    )
+    # remove the signature node (since it's enveloped)
+    utils.remove_preserving_whitespace(signature)
+    referenced_digest = utils.hash_digest(
+        digest_hasher, utils.serialize_xml(referenced_element)
+    )
+    if not compare_digest(base64_binary_content(digest_value), referenced_digest):
+        raise VerificationFailed()
+    return referenced_element, xml_cert
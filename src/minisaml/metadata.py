@@ -0,0 +1,253 @@
+import binascii
+import datetime
+import hashlib
+import io
+import os
+import threading
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import IO
+
+from cryptography.x509 import Certificate, load_der_x509_certificate
+from defusedxml.lxml import check_docinfo
+from lxml.etree import _Element as Element
+from lxml.etree import iterparse, tostring
+from minisignxml.internal.utils import base64_binary_content
+
+from .certificates import CertificateStore
+from .errors import MalformedMetadata, MetadataExpired, UnknownIssuer
+from .internal import paths
+from .internal.constants import (
+    BINDINGS_HTTP_REDIRECT,
+    NAMES_SAML2_METADATA,
+    NAMES_SAML2_PROTOCOL,
+)
+from .internal.saml import saml_to_datetime
+from .response import ValidationConfig
+
+MetadataSource = bytes | str | os.PathLike[str] | IO[bytes]
+
+_ENTITY_DESCRIPTOR = f"{{{NAMES_SAML2_METADATA}}}EntityDescriptor"
+
+
+@dataclass(frozen=True)
+class EntityMetadata:
+    """
+    The parts of the metadata of an Identity Provider needed by a Service
+    Provider.
+    """
+
+    entity_id: str
+    certificates: CertificateStore
+    single_sign_on_url: str | None
+    valid_until: datetime.datetime | None
+
+
+def parse_metadata(source: MetadataSource) -> Iterator[EntityMetadata]:
+    """
+    Yields the Identity Providers described by the `EntityDescriptor` or
+    `EntitiesDescriptor` in `source`, which is a file name, binary file or
+    the document itself. Entities without a SAML 2 `IDPSSODescriptor` are
+    skipped.
+
+    The document is parsed incrementally and each entity is discarded once
+    it has been processed, so memory use does not grow with the number of
+    entities.
+    """
+    for element, valid_until in _iter_entities(source):
+        metadata = _entity_metadata(element, valid_until)
+        if metadata is not None:
+            yield metadata
+
+
+def _iter_entities(
+    source: MetadataSource,
+) -> Iterator[tuple[Element, datetime.datetime | None]]:
+    """
+    Yields each `EntityDescriptor` of `source` with its effective
+    `validUntil`, the earliest of its own and that of its ancestors. The
+    element is cleared once the consumer moves on to the next one.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    checked = False
+    for _, element in iterparse(
+        source,
+        events=("end",),
+        tag=_ENTITY_DESCRIPTOR,
+        resolve_entities=False,
+        no_network=True,
+        load_dtd=False,
+        remove_comments=True,
+        remove_pis=True,
+    ):
+        if not checked:
+            # The document type declaration precedes the first element.
+            check_docinfo(element.getroottree())
+            checked = True
+        valid_until = None
+        for node in (element, *element.iterancestors()):
+            raw_valid_until = node.get("validUntil")
+            if raw_valid_until is not None:
+                try:
+                    node_valid_until = saml_to_datetime(raw_valid_until)
+                except ValueError:
+                    raise MalformedMetadata(f"Invalid validUntil {raw_valid_until!r}")
+                if valid_until is None or node_valid_until < valid_until:
+                    valid_until = node_valid_until
+        yield element, valid_until
+        # Discard the entity and everything parsed before it.
+        element.clear(keep_tail=True)
+        parent = element.getparent()
+        if parent is not None:
+            while element.getprevious() is not None:
+                del parent[0]
+
+
+def _entity_metadata(
+    element: Element, valid_until: datetime.datetime | None
+) -> EntityMetadata | None:
+    entity_id = element.get("entityID")
+    if not entity_id:
+        raise MalformedMetadata("EntityDescriptor without entityID")
+    for descriptor in paths.IDP_SSO_DESCRIPTOR.find_all(element):
+        protocols = descriptor.get("protocolSupportEnumeration", "").split()
+        if NAMES_SAML2_PROTOCOL in protocols:
+            break
+    else:
+        return None
+    certificates: list[Certificate] = []
+    for key_descriptor in paths.KEY_DESCRIPTOR.find_all(descriptor):
+        if key_descriptor.get("use", "signing") != "signing":
+            continue
+        for certificate in paths.KEY_INFO_CERTIFICATE.find_all(key_descriptor):
+            try:
+                certificates.append(
+                    load_der_x509_certificate(base64_binary_content(certificate))
+                )
+            except (ValueError, binascii.Error):
+                raise MalformedMetadata(f"Invalid signing certificate of {entity_id}")
+    single_sign_on_url = None
+    for service in paths.SINGLE_SIGN_ON_SERVICE.find_all(descriptor):
+        if service.get("Binding") == BINDINGS_HTTP_REDIRECT:
+            single_sign_on_url = service.get("Location")
+            break
+    return EntityMetadata(
+        entity_id=entity_id,
+        certificates=CertificateStore(certificates),
+        single_sign_on_url=single_sign_on_url,
+        valid_until=valid_until,
+    )
+
+
+def _default_config(metadata: EntityMetadata) -> ValidationConfig:
+    return ValidationConfig(certificate=metadata.certificates)
+
+
+class MetadataRegistry:
+    """
+    Registry of Identity Providers built from SAML metadata, which can be
+    passed as `get_config_for_issuer`. Lookups are a single dictionary lookup
+    and never wait for a refresh, which replaces the registry atomically.
+
+    Refreshing only rebuilds the entities whose metadata changed, unchanged
+    entities keep their `ValidationConfig`.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str] | None = None,
+        *,
+        config_factory: Callable[[EntityMetadata], ValidationConfig] | None = None,
+    ) -> None:
+        self.path = path
+        self.config_factory = config_factory or _default_config
+        self.etag: str | None = None
+        # entity ID -> (config, metadata), replaced as a whole on refresh.
+        self._entries: dict[str, tuple[ValidationConfig, EntityMetadata]] = {}
+        # entity ID -> (digest of the entity, effective validUntil)
+        self._versions: dict[str, tuple[bytes, datetime.datetime | None]] = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            self.refresh()
+
+    def __call__(self, issuer: str) -> tuple[ValidationConfig, EntityMetadata]:
+        entry = self._entries.get(issuer)
+        if entry is None:
+            raise UnknownIssuer(issuer=issuer)
+        valid_until = entry[1].valid_until
+        if valid_until is not None and valid_until <= datetime.datetime.now(
+            datetime.timezone.utc
+        ):
+            raise MetadataExpired(issuer=issuer, valid_until=valid_until)
+        return entry
+
+    def __contains__(self, issuer: object) -> bool:
+        return issuer in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[EntityMetadata]:
+        return (metadata for _, metadata in self._entries.values())
+
+    def refresh(self) -> bool:
+        """
+        Loads the metadata file at `path` if it changed since it was last
+        loaded. Returns whether it was loaded.
+        """
+        if self.path is None:
+            raise ValueError("MetadataRegistry has no path to refresh from")
+        stat = os.stat(self.path)
+        # Like the ETag of a static file server, changes whenever the file is
+        # replaced or modified.
+        etag = f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if etag == self.etag:
+            return False
+        with open(self.path, "rb") as fobj:
+            return self.load(fobj, etag=etag)
+
+    def load(self, source: MetadataSource, *, etag: str | None = None) -> bool:
+        """
+        Replaces the entities of the registry with those in `source`. If
+        `etag` is given and equals the `etag` of the loaded metadata, for
+        example because an HTTP server answered a conditional request with
+        304 Not Modified, nothing is done. Returns whether `source` was
+        loaded.
+        """
+        with self._lock:
+            if etag is not None and etag == self.etag:
+                return False
+            entries: dict[str, tuple[ValidationConfig, EntityMetadata]] = {}
+            versions: dict[str, tuple[bytes, datetime.datetime | None]] = {}
+            for element, valid_until in _iter_entities(source):
+                entity_id = element.get("entityID")
+                if not entity_id:
+                    raise MalformedMetadata("EntityDescriptor without entityID")
+                if entity_id in versions:
+                    raise MalformedMetadata(f"Duplicate entityID {entity_id}")
+                # Hashing the serialized entity costs about a tenth of
+                # rebuilding it, which mostly is loading its certificates.
+                version = (
+                    hashlib.sha256(tostring(element, with_tail=False)).digest(),
+                    valid_until,
+                )
+                versions[entity_id] = version
+                entry: tuple[ValidationConfig, EntityMetadata] | None
+                if self._versions.get(entity_id) == version:
+                    # Unchanged, entities which are no Identity Provider have
+                    # no entry.
+                    entry = self._entries.get(entity_id)
+                else:
+                    metadata = _entity_metadata(element, valid_until)
+                    entry = (
+                        None
+                        if metadata is None
+                        else (self.config_factory(metadata), metadata)
+                    )
+                if entry is not None:
+                    entries[entity_id] = entry
+            self._entries = entries
+            self._versions = versions
+            self.etag = etag
+            return True
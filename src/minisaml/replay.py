@@ -0,0 +1,213 @@
+import datetime
+import heapq
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from .errors import (
+    MalformedSAMLResponse,
+    ReplayCacheFull,
+    ReplayDetected,
+    UnsolicitedResponse,
+)
+
+ASSERTION_KEY_PREFIX = "assertion:"
+REQUEST_KEY_PREFIX = "request:"
+
+
+class ReplayCacheBackend(ABC):
+    @abstractmethod
+    def add(self, key: str, expires_at: datetime.datetime) -> bool:
+        """
+        Stores `key` until `expires_at`. Returns False without changing anything
+        if `key` is already stored and not expired yet, True otherwise.
+        """
+
+    @abstractmethod
+    def pop(self, key: str) -> bool:
+        """
+        Removes `key`. Returns True if `key` was stored and not expired yet,
+        False otherwise.
+        """
+
+
+class MemoryReplayCache(ReplayCacheBackend):
+    """
+    In-process backend holding at most `max_size` keys. Expired keys are swept
+    on every operation. By default keys which have not expired yet are never
+    evicted, since forgetting one would allow replaying it, so adding a key to
+    a cache still full after sweeping raises `ReplayCacheFull`. With
+    `evict_oldest`, the key expiring first is evicted instead, which suits
+    keys that only grant access when present, such as request IDs.
+    """
+
+    def __init__(self, max_size: int = 100_000, *, evict_oldest: bool = False) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.evict_oldest = evict_oldest
+        self._entries: dict[str, float] = {}
+        # (expiry, key) pairs, entries whose key was removed or re-added with
+        # a different expiry are skipped when popped.
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str, expires_at: datetime.datetime) -> bool:
+        expiry = expires_at.timestamp()
+        with self._lock:
+            self._sweep(time.time())
+            if key in self._entries:
+                return False
+            if len(self._entries) >= self.max_size:
+                if not self.evict_oldest:
+                    raise ReplayCacheFull(max_size=self.max_size)
+                self._evict_first_expiring()
+            self._entries[key] = expiry
+            heapq.heappush(self._expiry_heap, (expiry, key))
+            return True
+
+    def pop(self, key: str) -> bool:
+        with self._lock:
+            self._sweep(time.time())
+            return self._entries.pop(key, None) is not None
+
+    def _evict_first_expiring(self) -> None:
+        heap = self._expiry_heap
+        entries = self._entries
+        while heap:
+            expiry, key = heapq.heappop(heap)
+            if entries.get(key) == expiry:
+                del entries[key]
+                return
+
+    def _sweep(self, now: float) -> None:
+        heap = self._expiry_heap
+        entries = self._entries
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            if entries.get(key) == expiry:
+                del entries[key]
+        # Popped keys leave stale heap entries behind, rebuild the heap once
+        # they make up the majority of it.
+        if len(heap) > 2 * len(entries) + 64:
+            self._expiry_heap = [(expiry, key) for key, expiry in entries.items()]
+            heapq.heapify(self._expiry_heap)
+
+
+class SQLiteReplayCache(ReplayCacheBackend):
+    """
+    Backend storing keys in an SQLite database file, allowing multiple worker
+    processes on the same host to share replay protection.
+    """
+
+    def __init__(self, path: str | Path, *, sweep_interval: int = 1000) -> None:
+        self.sweep_interval = sweep_interval
+        self._operations = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS minisaml_replay_cache"
+            " (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS minisaml_replay_cache_expires_at"
+            " ON minisaml_replay_cache (expires_at)"
+        )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def add(self, key: str, expires_at: datetime.datetime) -> bool:
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            cursor = self._connection.execute(
+                "INSERT INTO minisaml_replay_cache (key, expires_at) VALUES (?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at"
+                " WHERE minisaml_replay_cache.expires_at <= ?",
+                (key, expires_at.timestamp(), now),
+            )
+            return cursor.rowcount == 1
+
+    def pop(self, key: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._maybe_sweep(now)
+            cursor = self._connection.execute(
+                "DELETE FROM minisaml_replay_cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            )
+            return cursor.rowcount == 1
+
+    def _maybe_sweep(self, now: float) -> None:
+        self._operations += 1
+        if self._operations % self.sweep_interval == 0:
+            self._connection.execute(
+                "DELETE FROM minisaml_replay_cache WHERE expires_at <= ?", (now,)
+            )
+
+
+class ReplayProtection:
+    """
+    Rejects SAML Assertions which have been seen before and, if
+    `check_in_response_to` is enabled, responses which are not a response to
+    a request registered with `register_request`.
+
+    Anyone can make the service provider register requests, so request IDs
+    must not share a bounded in-memory store with assertion IDs, where they
+    could fill it and cause every response to be rejected. Unless
+    `request_backend` is given, they are kept in a separate in-memory store
+    evicting the oldest request IDs if `backend` is in-memory, and in
+    `backend` itself otherwise, so shared backends keep working across
+    processes.
+    """
+
+    def __init__(
+        self,
+        backend: ReplayCacheBackend | None = None,
+        *,
+        check_in_response_to: bool = False,
+        request_lifetime: datetime.timedelta = datetime.timedelta(minutes=10),
+        request_backend: ReplayCacheBackend | None = None,
+    ) -> None:
+        self.backend = backend if backend is not None else MemoryReplayCache()
+        if request_backend is None:
+            request_backend = (
+                MemoryReplayCache(max_size=10_000, evict_oldest=True)
+                if isinstance(self.backend, MemoryReplayCache)
+                else self.backend
+            )
+        self.request_backend = request_backend
+        self.check_in_response_to = check_in_response_to
+        self.request_lifetime = request_lifetime
+
+    def register_request(self, request_id: str) -> None:
+        self.request_backend.add(
+            REQUEST_KEY_PREFIX + request_id,
+            datetime.datetime.now(datetime.timezone.utc) + self.request_lifetime,
+        )
+
+    def check(
+        self,
+        *,
+        assertion_id: str | None,
+        in_response_to: str | None,
+        expires_at: datetime.datetime,
+    ) -> None:
+        if assertion_id is None:
+            raise MalformedSAMLResponse("Assertion has no ID")
+        if not self.backend.add(ASSERTION_KEY_PREFIX + assertion_id, expires_at):
+            raise ReplayDetected(assertion_id=assertion_id)
+        if self.check_in_response_to and (
+            in_response_to is None
+            or not self.request_backend.pop(REQUEST_KEY_PREFIX + in_response_to)
+        ):
+            raise UnsolicitedResponse(in_response_to=in_response_to)
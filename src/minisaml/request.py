@@ -1,10 +1,18 @@
+from __future__ import annotations
+
 import base64
 import secrets
 import zlib
+from typing import TYPE_CHECKING
+from urllib.parse import quote
 
 from yarl import URL
 
-from .internal.saml import build_saml_request
+from .internal.saml import SAMLRequestTemplate, build_saml_request
+
+if TYPE_CHECKING:
+    from .replay import ReplayProtection
+    from .signing import RedirectSigner
 
 
 def get_request_redirect_url(
@@ -15,19 +23,98 @@ def get_request_redirect_url(
     force_reauthentication: bool = False,
     request_id: str | None = None,
     relay_state: str | None = None,
+    replay_protection: ReplayProtection | None = None,
+    signer: RedirectSigner | None = None,
 ) -> str:
+    request_id = request_id or secrets.token_urlsafe()
     request_xml = build_saml_request(
         issuer=expected_audience,
         acs_url=acs_url,
-        request_id=request_id or secrets.token_urlsafe(),
+        request_id=request_id,
         force_reauthentication=force_reauthentication,
     )
+    if replay_protection is not None:
+        replay_protection.register_request(request_id)
+    url = URL(saml_endpoint)
+    if signer is not None:
+        return _signed_redirect_url(
+            _query_prefix(url), request_xml, relay_state, signer
+        )
+    return _redirect_url(url, request_xml, relay_state)
+
 
-    query = {
-        "SAMLRequest": base64.b64encode(zlib.compress(request_xml)[2:-4]).decode(
-            "utf-8"
+class AuthnRequestBuilder:
+    """
+    Reusable equivalent of `get_request_redirect_url` for a fixed endpoint,
+    audience, ACS URL, re-authentication setting and signer.
+    """
+
+    def __init__(
+        self,
+        *,
+        saml_endpoint: str,
+        expected_audience: str,
+        acs_url: str,
+        force_reauthentication: bool = False,
+        signer: RedirectSigner | None = None,
+    ) -> None:
+        self.saml_endpoint = saml_endpoint
+        self.signer = signer
+        self._url = URL(saml_endpoint)
+        self._query_prefix = _query_prefix(self._url)
+        self._template = SAMLRequestTemplate(
+            issuer=expected_audience,
+            acs_url=acs_url,
+            force_reauthentication=force_reauthentication,
         )
-    }
+
+    def get_redirect_url(
+        self,
+        *,
+        request_id: str | None = None,
+        relay_state: str | None = None,
+        replay_protection: ReplayProtection | None = None,
+    ) -> str:
+        request_id = request_id or secrets.token_urlsafe()
+        request_xml = self._template.render(request_id)
+        if replay_protection is not None:
+            replay_protection.register_request(request_id)
+        if self.signer is not None:
+            return _signed_redirect_url(
+                self._query_prefix, request_xml, relay_state, self.signer
+            )
+        return _redirect_url(self._url, request_xml, relay_state)
+
+
+def _encode_request(request_xml: bytes) -> str:
+    return base64.b64encode(zlib.compress(request_xml)[2:-4]).decode("utf-8")
+
+
+def _redirect_url(url: URL, request_xml: bytes, relay_state: str | None) -> str:
+    query = {"SAMLRequest": _encode_request(request_xml)}
     if relay_state is not None:
         query["RelayState"] = relay_state
-    return str(URL(saml_endpoint).update_query(query))
+    return str(url.update_query(query))
+
+
+def _query_prefix(url: URL) -> str:
+    # The endpoint URL up to and including the separator before the SAML
+    # parameters, which are appended without parsing the URL again.
+    prefix = str(url.with_path(url.raw_path, encoded=True)) + "?"
+    if url.raw_query_string:
+        prefix += url.raw_query_string + "&"
+    return prefix
+
+
+def _signed_redirect_url(
+    query_prefix: str,
+    request_xml: bytes,
+    relay_state: str | None,
+    signer: RedirectSigner,
+) -> str:
+    # The signature covers the URL encoded parameters exactly as they appear
+    # in the URL, so the query string is built by hand instead of by yarl.
+    query = "SAMLRequest=" + quote(_encode_request(request_xml), safe="")
+    if relay_state is not None:
+        query += "&RelayState=" + quote(relay_state, safe="")
+    return query_prefix + signer.sign_query(query)
@@ -1,59 +1,191 @@
-import asyncio
-import base64
+from __future__ import annotations
+
 import datetime
-from collections.abc import Awaitable, Callable, Collection, Iterable
-from dataclasses import dataclass
+import functools
+import itertools
+import sys
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import (
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Collection,
+    Container,
+    Iterable,
+    Iterator,
+    Mapping,
+    Sequence,
+)
+from dataclasses import dataclass, field, fields
 from typing import (
+    TYPE_CHECKING,
+    Any,
+    Protocol,
+    TypeAlias,
     TypeVar,
     overload,
+    runtime_checkable,
 )
 
-from cryptography.x509 import Certificate
-from lxml.etree import QName
-from lxml.etree import _Element as Element
-from minisignxml.config import VerifyConfig
-from minisignxml.errors import ElementNotFound
-from minisignxml.internal import utils
-from minisignxml.verify import extract_verified_element_and_certificate
-
-from .errors import (
-    AudienceMismatch,
-    IssuerMismatch,
-    MalformedSAMLResponse,
-    ResponseExpired,
-    ResponseTooEarly,
-)
-from .internal.constants import NAMES_SAML2_ASSERTION, NAMES_SAML2_PROTOCOL
-from .internal.namespaces import NAMESPACE_MAP
-from .internal.saml import saml_to_datetime
-from .internal.utils import find_or_raise
+from .errors import MiniSAMLError
+from .internal.encoding import Base64Data
 
+# The crypto and XML stack is only imported by `minisaml.internal.validation`,
+# once the first response is validated, keeping the import of this module cheap
+# for short lived processes which might only ever create SAML Requests.
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
 
-@dataclass(frozen=True)
+    from cryptography.x509 import Certificate
+    from lxml.etree import _Element as Element
+    from minisignxml.config import VerifyConfig
+    from minisignxml.errors import MiniSignXMLError
+
+    from .certificates import CertificateStore
+    from .encryption import AssertionDecryptor
+    from .internal.verify import PreparedVerifyConfig
+    from .replay import ReplayProtection
+    from .tracing import ValidationObserver
+
+
+@dataclass(frozen=True, slots=True)
 class Attribute:
     name: str
     values: list[str]
     format: str | None
-    extra_attributes: dict[str, str]
+    extra_attributes: Mapping[str, str]
 
     @property
     def value(self) -> str | None:
         return self.values[0] if self.values else None
 
 
-@dataclass(frozen=True)
+class _LazyAttributes(Sequence[Attribute]):
+    """
+    Attributes of an AttributeStatement, gathered on first access. Only the
+    serialized statement is kept, so a response does not keep the parsed
+    document, including its signature and any decrypted assertion, alive,
+    and uses less memory than a copy of the tree would. It is released once
+    the attributes have been gathered. Gathering is guarded by a lock, so
+    threads sharing a response gather the attributes only once.
+    """
+
+    __slots__ = ("_attribute_statement", "_attribute_names", "_attributes", "_lock")
+
+    def __init__(
+        self,
+        attribute_statement: Element,
+        attribute_names: Collection[str] | None,
+    ) -> None:
+        from lxml.etree import tostring
+
+        # Without the tail, the text following the statement in its parent,
+        # which would make the serialized statement an invalid document.
+        self._attribute_statement: bytes | None = tostring(
+            attribute_statement, with_tail=False
+        )
+        self._attribute_names = attribute_names
+        self._attributes: list[Attribute] | None = None
+        self._lock = threading.Lock()
+
+    def _materialize(self) -> list[Attribute]:
+        attributes = self._attributes
+        if attributes is not None:
+            return attributes
+        with self._lock:
+            attributes = self._attributes
+            if attributes is not None:
+                # Another thread gathered the attributes while we waited.
+                return attributes
+            from .internal.utils import deserialize_xml
+
+            assert self._attribute_statement is not None
+            attributes = list(
+                gather_attributes(
+                    deserialize_xml(self._attribute_statement),
+                    attribute_names=self._attribute_names,
+                )
+            )
+            self._attributes = attributes
+            self._attribute_statement = None
+        return attributes
+
+    @overload
+    def __getitem__(self, index: int) -> Attribute:
+        pass
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Attribute]:
+        pass
+
+    def __getitem__(self, index: int | slice) -> Attribute | list[Attribute]:
+        return self._materialize()[index]
+
+    def __len__(self) -> int:
+        return len(self._materialize())
+
+    def __iter__(self) -> Iterator[Attribute]:
+        return iter(self._materialize())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, _LazyAttributes):
+            return self._materialize() == other._materialize()
+        return self._materialize() == other
+
+    def __repr__(self) -> str:
+        return repr(self._materialize())
+
+    def __reduce__(self) -> tuple[Any, ...]:
+        return list, (self._materialize(),)
+
+
+@dataclass(frozen=True, slots=True)
 class Response:
     issuer: str
     name_id: str
     audience: str
-    attributes: list[Attribute]
+    attributes: Sequence[Attribute]
     session_not_on_or_after: datetime.datetime | None
     in_response_to: str | None
     certificate: Certificate
+    # Defaults keep constructing responses directly, for example in tests,
+    # working as before these fields were added.
+    assertion_id: str | None = None
+    not_on_or_after: datetime.datetime | None = None
+    _attrs: dict[str, str | None] | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     @property
     def attrs(self) -> dict[str, str | None]:
-        return {attr.name: attr.value for attr in self.attributes}
+        attrs = self._attrs
+        if attrs is None:
+            attrs = {attr.name: attr.value for attr in self.attributes}
+            object.__setattr__(self, "_attrs", attrs)
+        return attrs
+
+    def __getstate__(self) -> dict[str, Any]:
+        from cryptography.hazmat.primitives.serialization import Encoding
+
+        # Certificates can't be pickled, store them DER encoded instead.
+        state = {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if field.init
+        }
+        state["certificate"] = self.certificate.public_bytes(Encoding.DER)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        from cryptography.x509 import load_der_x509_certificate
+
+        state["certificate"] = load_der_x509_certificate(state["certificate"])
+        object.__setattr__(self, "_attrs", None)
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
 
 @dataclass(frozen=True)
@@ -62,36 +194,171 @@ class TimeDriftLimits:
     not_on_or_after_max_drift: datetime.timedelta
 
     @classmethod
-    def none(cls) -> "TimeDriftLimits":
+    def none(cls) -> TimeDriftLimits:
         return cls(
             not_before_max_drift=datetime.timedelta(),
             not_on_or_after_max_drift=datetime.timedelta(),
         )
 
 
+@dataclass(frozen=True)
+class ResponseLimits:
+    """
+    Limits on the size and structure of SAML Responses. Sizes are checked
+    before decoding and, for streams, while decoding, the structure once the
+    response has been parsed. `None` disables a limit.
+    """
+
+    max_encoded_size: int | None = 1024 * 1024
+    max_decoded_size: int | None = 512 * 1024
+    max_elements: int | None = 10_000
+    max_depth: int | None = 64
+    max_attributes: int | None = 10_000
+
+
+# minisignxml is only imported for validation, hence the forward references.
+_CachedOutcome: TypeAlias = "Response | MiniSAMLError | MiniSignXMLError"
+
+
+class ResponseCache:
+    """
+    Caches the outcome of validating a SAML Response, the `Response` or the
+    error, for at most `ttl`, so a response submitted again, for example after
+    a browser retried the POST, is not verified again. Responses are looked up
+    by the SHA-256 digest of their decoded XML and only reused if they were
+    validated with the same parameters. Responses are never cached past their
+    `NotOnOrAfter`.
+
+    Replay protection still applies to cached responses, a response accepted
+    once is rejected with `ReplayDetected` when it is submitted again. At most
+    `max_size` responses are cached, the least recently used one is evicted
+    once the cache is full.
+    """
+
+    def __init__(self, *, ttl: datetime.timedelta, max_size: int = 1024) -> None:
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.ttl = ttl
+        self.max_size = max_size
+        self._ttl = ttl.total_seconds()
+        # digest -> (expires at, parameters, result), in least recently used
+        # order.
+        self._entries: OrderedDict[
+            bytes, tuple[float, tuple[object, ...], _CachedOutcome]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _get(
+        self, digest: bytes, parameters: tuple[object, ...]
+    ) -> _CachedOutcome | None:
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            expires_at, cached_parameters, result = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            if cached_parameters != parameters:
+                return None
+            self._entries.move_to_end(digest)
+            return result
+
+    def _store(
+        self,
+        digest: bytes,
+        parameters: tuple[object, ...],
+        result: _CachedOutcome,
+    ) -> None:
+        now = time.time()
+        expires_at = now + self._ttl
+        if isinstance(result, Response) and result.not_on_or_after is not None:
+            expires_at = min(expires_at, result.not_on_or_after.timestamp())
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._entries[digest] = (expires_at, parameters, result)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _default_verify_config() -> VerifyConfig:
+    from minisignxml.config import VerifyConfig
+
+    return VerifyConfig.default()
+
+
 @dataclass(frozen=True)
 class ValidationConfig:
     """
-    ValidationConfig(certificate, signature_verification_config=VerifyConfig.default(), allowed_time_drift=TimeDriftLimits.none())
+    ValidationConfig(certificate, signature_verification_config=VerifyConfig.default(), allowed_time_drift=TimeDriftLimits.none(), replay_protection=None, attribute_names=None, prefilter=False, limits=None, decryptor=None, response_cache=None)
     """
 
     certificate: Certificate | Collection[Certificate]
-    signature_verification_config: VerifyConfig = VerifyConfig.default()
+    signature_verification_config: VerifyConfig = field(
+        default_factory=_default_verify_config
+    )
     allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none()
+    replay_protection: ReplayProtection | None = None
+    attribute_names: Collection[str] | None = None
+    prefilter: bool = False
+    limits: ResponseLimits | None = None
+    decryptor: AssertionDecryptor | None = None
+    response_cache: ResponseCache | None = None
 
+    # Derived once per configuration, so configurations returned again by
+    # `get_config_for_issuer` don't index their certificates or resolve their
+    # algorithm allowlists on every response.
+    @functools.cached_property
+    def _certificate_store(self) -> CertificateStore:
+        from .certificates import CertificateStore
+
+        return CertificateStore.of(self.certificate)
+
+    @functools.cached_property
+    def _prepared_verify_config(self) -> PreparedVerifyConfig:
+        from .internal.verify import PreparedVerifyConfig
+
+        return PreparedVerifyConfig.of(self.signature_verification_config)
+
+
+@runtime_checkable
+class Readable(Protocol):
+    def read(self, size: int, /) -> bytes:
+        pass
+
+
+ResponseStream = Readable | Iterable[bytes]
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
 
 State = TypeVar("State")
 
 SyncGetConfigForIssuer = Callable[[str], tuple[ValidationConfig, State]]
 AsyncGetConfigForIssuer = Callable[[str], Awaitable[tuple[ValidationConfig, State]]]
+# The base64 encoded SAML Response, as in the `SAMLResponse` form field.
+ResponseData = Base64Data
+# A single audience, or a container such as a frozenset of audiences or any
+# object implementing `__contains__`.
+ExpectedAudience = str | Container[str]
 
 
 @overload
 def validate_multi_tenant_response(
     *,
-    data: bytes | str,
+    data: ResponseData,
     get_config_for_issuer: SyncGetConfigForIssuer[State],
-    expected_audience: str,
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = ...,
+    observer: ValidationObserver | None = ...,
 ) -> tuple[Response, State]:
     pass
 
@@ -99,169 +366,662 @@ def validate_multi_tenant_response(
 @overload
 def validate_multi_tenant_response(
     *,
-    data: bytes | str,
+    data: ResponseData,
     get_config_for_issuer: AsyncGetConfigForIssuer[State],
-    expected_audience: str,
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = ...,
+    observer: ValidationObserver | None = ...,
 ) -> Awaitable[tuple[Response, State]]:
     pass
 
 
 def validate_multi_tenant_response(
     *,
-    data: bytes | str,
+    data: ResponseData,
     get_config_for_issuer: SyncGetConfigForIssuer[State]
     | AsyncGetConfigForIssuer[State],
-    expected_audience: str,
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = None,
+    observer: ValidationObserver | None = None,
 ) -> tuple[Response, State] | Awaitable[tuple[Response, State]]:
-    xml = base64.b64decode(data)
-    tree = utils.deserialize_xml(xml)
-    assertion = find_or_raise(tree, "./saml:Assertion")
-    issuer = find_or_raise(assertion, "./saml:Issuer").text
-    maybe_awaitable = get_config_for_issuer(issuer)
-
-    if isinstance(maybe_awaitable, tuple):
-        config, state = maybe_awaitable
-        return (
-            validate_response(
-                data=data,
-                certificate=config.certificate,
-                expected_audience=expected_audience,
-                idp_issuer=issuer,
-                signature_verification_config=config.signature_verification_config,
-                allowed_time_drift=config.allowed_time_drift,
-            ),
-            state,
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    if observer is None:
+        decoded, tree = validation.decode_and_parse(data, limits=limits)
+        return validation.validate_multi_tenant_tree(
+            tree=tree,
+            decoded=decoded,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
         )
-    else:
-        result_future: asyncio.Future[tuple[Response, State]] = asyncio.Future()
+    trace = TraceRecorder(observer)
+    try:
+        decoded, tree = validation.decode_and_parse(data, trace, limits)
+        result = validation.validate_multi_tenant_tree(
+            tree=tree,
+            decoded=decoded,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
+            trace=trace,
+        )
+    except Exception as exc:
+        trace.finish(exc)
+        raise
+    return validation.finish_multi_tenant_trace(trace, result)
 
-        def handle_result(
-            task: "asyncio.Future[tuple[ValidationConfig, State]]",
-        ) -> None:
-            if task.cancelled():
-                result_future.cancel()
-                return
 
-            try:
-                config, state = task.result()
-
-                result_future.set_result(
-                    (
-                        validate_response(
-                            data=data,
-                            certificate=config.certificate,
-                            expected_audience=expected_audience,
-                            idp_issuer=issuer,
-                            signature_verification_config=config.signature_verification_config,
-                            allowed_time_drift=config.allowed_time_drift,
-                        ),
-                        state,
-                    )
-                )
-            except Exception as exc:
-                result_future.set_exception(exc)
+@overload
+def validate_multi_tenant_response_stream(
+    *,
+    stream: ResponseStream,
+    get_config_for_issuer: SyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = ...,
+    chunk_size: int = ...,
+    observer: ValidationObserver | None = ...,
+) -> tuple[Response, State]:
+    pass
 
-        task = asyncio.ensure_future(maybe_awaitable)
-        task.add_done_callback(handle_result)
-        return result_future
+
+@overload
+def validate_multi_tenant_response_stream(
+    *,
+    stream: ResponseStream,
+    get_config_for_issuer: AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = ...,
+    chunk_size: int = ...,
+    observer: ValidationObserver | None = ...,
+) -> Awaitable[tuple[Response, State]]:
+    pass
+
+
+def validate_multi_tenant_response_stream(
+    *,
+    stream: ResponseStream,
+    get_config_for_issuer: SyncGetConfigForIssuer[State]
+    | AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    observer: ValidationObserver | None = None,
+) -> tuple[Response, State] | Awaitable[tuple[Response, State]]:
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    if observer is None:
+        digest, tree = validation.digest_and_parse_stream(stream, chunk_size, limits)
+        return validation.validate_multi_tenant_tree(
+            tree=tree,
+            digest=digest,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
+        )
+    trace = TraceRecorder(observer)
+    try:
+        digest, tree = validation.digest_and_parse_stream(
+            stream, chunk_size, limits, trace
+        )
+        result = validation.validate_multi_tenant_tree(
+            tree=tree,
+            digest=digest,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
+            trace=trace,
+        )
+    except Exception as exc:
+        trace.finish(exc)
+        raise
+    return validation.finish_multi_tenant_trace(trace, result)
 
 
 def validate_response(
     *,
-    data: bytes | str,
+    data: ResponseData,
     certificate: Certificate | Collection[Certificate],
-    expected_audience: str,
+    expected_audience: ExpectedAudience,
     idp_issuer: str,
-    signature_verification_config: VerifyConfig = VerifyConfig.default(),
+    signature_verification_config: VerifyConfig | None = None,
     allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none(),
+    replay_protection: ReplayProtection | None = None,
+    attribute_names: Collection[str] | None = None,
+    prefilter: bool = False,
+    limits: ResponseLimits | None = None,
+    decryptor: AssertionDecryptor | None = None,
+    observer: ValidationObserver | None = None,
+    response_cache: ResponseCache | None = None,
 ) -> Response:
-    xml = base64.b64decode(data)
-    certificates: Collection[Certificate]
-    if isinstance(certificate, Certificate):
-        certificates = {certificate}
-    else:
-        certificates = certificate
-    element, certificate_used = extract_verified_element_and_certificate(
-        xml=xml, certificates=certificates, config=signature_verification_config
-    )
-    if element.tag == QName(NAMES_SAML2_PROTOCOL, "Response"):
-        assertion = find_or_raise(element, "./saml:Assertion")
-    elif element.tag == QName(NAMES_SAML2_ASSERTION, "Assertion"):
-        assertion = element
-    else:
-        raise MalformedSAMLResponse(
-            "Signed element is neither a Response with an Assertion, nor an Assertion"
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    if response_cache is not None:
+        return validation.validate_response_cached(
+            data=data,
+            certificate=certificate,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            signature_verification_config=signature_verification_config,
+            allowed_time_drift=allowed_time_drift,
+            replay_protection=replay_protection,
+            attribute_names=attribute_names,
+            prefilter=prefilter,
+            limits=limits,
+            decryptor=decryptor,
+            observer=observer,
+            response_cache=response_cache,
         )
-    issuer = find_or_raise(assertion, "./saml:Issuer").text
-    if issuer != idp_issuer:
-        raise IssuerMismatch(received_issuer=issuer, expected_issuer=idp_issuer)
-    subject = find_or_raise(assertion, "./saml:Subject")
-    name_id = find_or_raise(subject, "./saml:NameID").text
-    subject_confirmation_method = find_or_raise(subject, "./saml:SubjectConfirmation")
-    subject_confirmation_data = find_or_raise(
-        subject_confirmation_method, "./saml:SubjectConfirmationData"
-    )
-    in_response_to = subject_confirmation_data.attrib.get("InResponseTo", None)
-    conditions = find_or_raise(assertion, "./saml:Conditions")
-    not_before = saml_to_datetime(conditions.attrib["NotBefore"])
-    not_on_or_after = saml_to_datetime(conditions.attrib["NotOnOrAfter"])
-    now = datetime.datetime.now(datetime.timezone.utc)
-    if now + allowed_time_drift.not_before_max_drift < not_before:
-        raise ResponseTooEarly(observed_time=now, not_before=not_before)
-    if now - allowed_time_drift.not_on_or_after_max_drift >= not_on_or_after:
-        raise ResponseExpired(observed_time=now, not_on_or_after=not_on_or_after)
-
-    audience = find_or_raise(
-        conditions, "./saml:AudienceRestriction/saml:Audience"
-    ).text
-
-    if audience != expected_audience:
-        raise AudienceMismatch(
-            received_audience=audience, expected_audience=expected_audience
+    if observer is None:
+        return validation.validate_tree(
+            tree=validation.parse_response(data, limits=limits),
+            certificate=certificate,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            signature_verification_config=signature_verification_config,
+            allowed_time_drift=allowed_time_drift,
+            replay_protection=replay_protection,
+            attribute_names=attribute_names,
+            prefilter=prefilter,
+            decryptor=decryptor,
         )
+    trace = TraceRecorder(observer, idp_issuer)
+    try:
+        response = validation.validate_tree(
+            tree=validation.parse_response(data, trace, limits),
+            certificate=certificate,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            signature_verification_config=signature_verification_config,
+            allowed_time_drift=allowed_time_drift,
+            replay_protection=replay_protection,
+            attribute_names=attribute_names,
+            prefilter=prefilter,
+            decryptor=decryptor,
+            trace=trace,
+        )
+    except Exception as exc:
+        trace.finish(exc)
+        raise
+    trace.finish()
+    return response
 
-    raw_session_not_on_or_after = find_or_raise(
-        assertion, "./saml:AuthnStatement"
-    ).attrib.get("SessionNotOnOrAfter", None)
 
-    session_not_on_or_after = raw_session_not_on_or_after and saml_to_datetime(
-        raw_session_not_on_or_after
-    )
+def validate_response_stream(
+    *,
+    stream: ResponseStream,
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None = None,
+    allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none(),
+    replay_protection: ReplayProtection | None = None,
+    attribute_names: Collection[str] | None = None,
+    prefilter: bool = False,
+    limits: ResponseLimits | None = None,
+    decryptor: AssertionDecryptor | None = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    observer: ValidationObserver | None = None,
+) -> Response:
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
 
+    trace = None if observer is None else TraceRecorder(observer, idp_issuer)
     try:
-        attribute_statement = find_or_raise(assertion, "./saml:AttributeStatement")
-    except ElementNotFound:
-        attribute_statement = None
-
-    attributes = (
-        list(gather_attributes(attribute_statement))
-        if attribute_statement is not None
-        else []
+        response = validation.validate_tree(
+            tree=validation.parse_response_stream(stream, chunk_size, limits, trace),
+            certificate=certificate,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            signature_verification_config=signature_verification_config,
+            allowed_time_drift=allowed_time_drift,
+            replay_protection=replay_protection,
+            attribute_names=attribute_names,
+            prefilter=prefilter,
+            decryptor=decryptor,
+            trace=trace,
+        )
+    except Exception as exc:
+        if trace is not None:
+            trace.finish(exc)
+        raise
+    if trace is not None:
+        trace.finish()
+    return response
+
+
+class PreparedValidator:
+    """
+    Validates SAML Responses of a single Identity Provider. All state derived
+    from the configuration, the certificate store, the resolved algorithm
+    allowlists and the attribute allowlist, is computed once when the
+    validator is created. Validators are immutable and can be shared between
+    threads.
+    """
+
+    __slots__ = (
+        "config",
+        "expected_audience",
+        "idp_issuer",
+        "_certificates",
+        "_verify_config",
+        "_attribute_names",
     )
 
-    return Response(
-        issuer=issuer,
-        name_id=name_id,
-        audience=audience,
-        attributes=attributes,
-        session_not_on_or_after=session_not_on_or_after,
-        in_response_to=in_response_to,
-        certificate=certificate_used,
+    def __init__(
+        self,
+        config: ValidationConfig,
+        *,
+        expected_audience: ExpectedAudience,
+        idp_issuer: str,
+    ) -> None:
+        self.config = config
+        self.expected_audience = expected_audience
+        self.idp_issuer = idp_issuer
+        self._certificates = config._certificate_store
+        self._verify_config = config._prepared_verify_config
+        self._attribute_names = (
+            None
+            if config.attribute_names is None
+            else frozenset(config.attribute_names)
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"PreparedValidator(expected_audience={self.expected_audience!r}, "
+            f"idp_issuer={self.idp_issuer!r})"
+        )
+
+    def validate(
+        self, data: ResponseData, *, observer: ValidationObserver | None = None
+    ) -> Response:
+        config = self.config
+        return validate_response(
+            data=data,
+            certificate=self._certificates,
+            expected_audience=self.expected_audience,
+            idp_issuer=self.idp_issuer,
+            signature_verification_config=self._verify_config,
+            allowed_time_drift=config.allowed_time_drift,
+            replay_protection=config.replay_protection,
+            attribute_names=self._attribute_names,
+            prefilter=config.prefilter,
+            limits=config.limits,
+            decryptor=config.decryptor,
+            observer=observer,
+            response_cache=config.response_cache,
+        )
+
+
+async def validate_multi_tenant_response_async(
+    *,
+    data: ResponseData,
+    get_config_for_issuer: SyncGetConfigForIssuer[State]
+    | AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = None,
+    executor: Executor | None = None,
+    concurrency_limit: asyncio.Semaphore | None = None,
+    observer: ValidationObserver | None = None,
+) -> tuple[Response, State]:
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    trace = None if observer is None else TraceRecorder(observer)
+    try:
+        decoded, tree = await validation.run_in_executor(
+            functools.partial(validation.decode_and_parse, data, trace, limits),
+            executor,
+            concurrency_limit,
+        )
+        result = await validation.validate_multi_tenant_tree_async(
+            tree=tree,
+            decoded=decoded,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
+            executor=executor,
+            concurrency_limit=concurrency_limit,
+            trace=trace,
+        )
+    except Exception as exc:
+        if trace is not None:
+            trace.finish(exc)
+        raise
+    if trace is not None:
+        trace.finish()
+    return result
+
+
+async def validate_multi_tenant_response_stream_async(
+    *,
+    stream: AsyncIterable[bytes],
+    get_config_for_issuer: SyncGetConfigForIssuer[State]
+    | AsyncGetConfigForIssuer[State],
+    expected_audience: ExpectedAudience,
+    limits: ResponseLimits | None = None,
+    executor: Executor | None = None,
+    concurrency_limit: asyncio.Semaphore | None = None,
+    observer: ValidationObserver | None = None,
+) -> tuple[Response, State]:
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    trace = None if observer is None else TraceRecorder(observer)
+    try:
+        digest, tree = await validation.digest_and_parse_stream_async(
+            stream, limits, trace, executor
+        )
+        result = await validation.validate_multi_tenant_tree_async(
+            tree=tree,
+            digest=digest,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience=expected_audience,
+            executor=executor,
+            concurrency_limit=concurrency_limit,
+            trace=trace,
+        )
+    except Exception as exc:
+        if trace is not None:
+            trace.finish(exc)
+        raise
+    if trace is not None:
+        trace.finish()
+    return result
+
+
+async def validate_response_async(
+    *,
+    data: ResponseData,
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None = None,
+    allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none(),
+    replay_protection: ReplayProtection | None = None,
+    attribute_names: Collection[str] | None = None,
+    prefilter: bool = False,
+    limits: ResponseLimits | None = None,
+    decryptor: AssertionDecryptor | None = None,
+    observer: ValidationObserver | None = None,
+    executor: Executor | None = None,
+    concurrency_limit: asyncio.Semaphore | None = None,
+    response_cache: ResponseCache | None = None,
+) -> Response:
+    from .internal import validation
+
+    return await validation.run_in_executor(
+        functools.partial(
+            validate_response,
+            data=data,
+            certificate=certificate,
+            expected_audience=expected_audience,
+            idp_issuer=idp_issuer,
+            signature_verification_config=signature_verification_config,
+            allowed_time_drift=allowed_time_drift,
+            replay_protection=replay_protection,
+            attribute_names=attribute_names,
+            prefilter=prefilter,
+            decryptor=decryptor,
+            limits=limits,
+            observer=observer,
+            response_cache=response_cache,
+        ),
+        executor,
+        concurrency_limit,
     )
 
 
-def gather_attributes(attribute_statement: Element) -> Iterable[Attribute]:
-    for attribute in attribute_statement.findall("./saml:Attribute", NAMESPACE_MAP):
-        values = [
-            value.text
-            for value in attribute.findall("./saml:AttributeValue", NAMESPACE_MAP)
-        ]
-        extra_attributes = {k: v for k, v in attribute.attrib.items()}
-        name = extra_attributes.pop("Name")
-        format = extra_attributes.pop("NameFormat", None)
+async def validate_response_stream_async(
+    *,
+    stream: AsyncIterable[bytes],
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None = None,
+    allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none(),
+    replay_protection: ReplayProtection | None = None,
+    attribute_names: Collection[str] | None = None,
+    prefilter: bool = False,
+    limits: ResponseLimits | None = None,
+    decryptor: AssertionDecryptor | None = None,
+    executor: Executor | None = None,
+    concurrency_limit: asyncio.Semaphore | None = None,
+    observer: ValidationObserver | None = None,
+) -> Response:
+    from .internal import validation
+    from .internal.tracing import TraceRecorder
+
+    trace = None if observer is None else TraceRecorder(observer, idp_issuer)
+    try:
+        tree = await validation.parse_response_stream_async(
+            stream, limits, trace, executor
+        )
+        response = await validation.run_in_executor(
+            functools.partial(
+                validation.validate_tree,
+                tree=tree,
+                certificate=certificate,
+                expected_audience=expected_audience,
+                idp_issuer=idp_issuer,
+                signature_verification_config=signature_verification_config,
+                allowed_time_drift=allowed_time_drift,
+                replay_protection=replay_protection,
+                attribute_names=attribute_names,
+                prefilter=prefilter,
+                decryptor=decryptor,
+                trace=trace,
+            ),
+            executor,
+            concurrency_limit,
+        )
+    except Exception as exc:
+        if trace is not None:
+            trace.finish(exc)
+        raise
+    if trace is not None:
+        trace.finish()
+    return response
+
+
+class _EmptyMapping(Mapping[str, str]):
+    """
+    Immutable empty mapping shared by all attributes without extra XML
+    attributes.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> str:
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+    def __repr__(self) -> str:
+        return "{}"
+
+    def __reduce__(self) -> str:
+        return "_NO_EXTRA_ATTRIBUTES"
+
+
+_NO_EXTRA_ATTRIBUTES = _EmptyMapping()
+_ATTRIBUTE_OWN_ATTRIBUTES = frozenset({"Name", "NameFormat"})
+
+
+def gather_attributes(
+    attribute_statement: Element, *, attribute_names: Collection[str] | None = None
+) -> Iterable[Attribute]:
+    from .internal import paths
+
+    for attribute in paths.ATTRIBUTE.find_all(attribute_statement):
+        if attribute_names is not None and attribute.get("Name") not in attribute_names:
+            continue
+        values = [value.text for value in paths.ATTRIBUTE_VALUE.find_all(attribute)]
+        attrib = attribute.attrib
+        # Names and formats repeat across responses, intern them so stored
+        # responses share them.
+        name = sys.intern(attrib["Name"])
+        format = attrib.get("NameFormat")
+        if format is not None:
+            format = sys.intern(format)
+        extra_attributes: Mapping[str, str]
+        if len(attrib) == (1 if format is None else 2):
+            extra_attributes = _NO_EXTRA_ATTRIBUTES
+        else:
+            extra_attributes = {
+                k: v for k, v in attrib.items() if k not in _ATTRIBUTE_OWN_ATTRIBUTES
+            }
         yield Attribute(
             name=name,
             values=values,
             format=format,
             extra_attributes=extra_attributes,
         )
+
+
+BatchResult: TypeAlias = "Response | MiniSAMLError | MiniSignXMLError"
+
+
+@dataclass(frozen=True)
+class _BatchJob:
+    certificates: tuple[bytes, ...]
+    expected_audience: ExpectedAudience
+    idp_issuer: str
+    signature_verification_config: VerifyConfig | None
+    allowed_time_drift: TimeDriftLimits
+    attribute_names: frozenset[str] | None
+    prefilter: bool
+    limits: ResponseLimits | None
+    decryptor: AssertionDecryptor | None
+
+    @functools.cached_property
+    def _certificate_store(self) -> Collection[Certificate]:
+        from .internal import validation
+
+        return validation.load_certificates(self.certificates)
+
+    def run(self, chunk: list[bytes | str]) -> list[BatchResult]:
+        from minisignxml.errors import MiniSignXMLError
+
+        results: list[BatchResult] = []
+        for data in chunk:
+            try:
+                results.append(
+                    validate_response(
+                        data=data,
+                        certificate=self._certificate_store,
+                        expected_audience=self.expected_audience,
+                        idp_issuer=self.idp_issuer,
+                        signature_verification_config=self.signature_verification_config,
+                        allowed_time_drift=self.allowed_time_drift,
+                        attribute_names=self.attribute_names,
+                        prefilter=self.prefilter,
+                        decryptor=self.decryptor,
+                        limits=self.limits,
+                    )
+                )
+            except (MiniSAMLError, MiniSignXMLError) as exc:
+                results.append(exc)
+        return results
+
+
+_worker_job: _BatchJob | None = None
+
+
+def _install_worker_job(job: _BatchJob) -> None:
+    global _worker_job
+    _worker_job = job
+
+
+def _run_worker_job(chunk: list[bytes | str]) -> bytes:
+    from .internal.pickling import dumps
+
+    assert _worker_job is not None
+    return dumps(_worker_job.run(chunk))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_job(payload: bytes) -> _BatchJob:
+    import pickle
+
+    job: _BatchJob = pickle.loads(payload)
+    return job
+
+
+def _run_pickled_job(payload: bytes, chunk: list[bytes | str]) -> bytes:
+    # Used with executors passed by the caller, which can't be given an
+    # initializer, so the pickled job is sent with every chunk. It is only
+    # pickled once, and only unpickled once per worker.
+    from .internal.pickling import dumps
+
+    return dumps(_load_job(payload).run(chunk))
+
+
+def _chunked(items: Iterable[bytes | str], size: int) -> Iterator[list[bytes | str]]:
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def validate_responses(
+    batch: Iterable[bytes | str],
+    *,
+    certificate: Certificate | Collection[Certificate],
+    expected_audience: ExpectedAudience,
+    idp_issuer: str,
+    signature_verification_config: VerifyConfig | None = None,
+    allowed_time_drift: TimeDriftLimits = TimeDriftLimits.none(),
+    attribute_names: Collection[str] | None = None,
+    prefilter: bool = False,
+    limits: ResponseLimits | None = None,
+    decryptor: AssertionDecryptor | None = None,
+    executor: Executor | None = None,
+    max_workers: int | None = None,
+    chunk_size: int = 64,
+) -> list[BatchResult]:
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    from cryptography.hazmat.primitives.serialization import Encoding
+    from cryptography.x509 import Certificate
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    if isinstance(certificate, Certificate):
+        certificate = {certificate}
+    job = _BatchJob(
+        certificates=tuple(cert.public_bytes(Encoding.DER) for cert in certificate),
+        expected_audience=expected_audience,
+        idp_issuer=idp_issuer,
+        signature_verification_config=signature_verification_config,
+        allowed_time_drift=allowed_time_drift,
+        attribute_names=None if attribute_names is None else frozenset(attribute_names),
+        prefilter=prefilter,
+        limits=limits,
+        decryptor=decryptor,
+    )
+    chunks = _chunked(batch, chunk_size)
+    if isinstance(executor, ThreadPoolExecutor):
+        return list(itertools.chain.from_iterable(executor.map(job.run, chunks)))
+    # Results are pickled by the workers, since errors raised by minisignxml
+    # hold certificates and elements which pickle can't handle by itself.
+    if executor is None:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_install_worker_job,
+            initargs=(job,),
+        ) as pool:
+            results = list(pool.map(_run_worker_job, chunks))
+    else:
+        results = list(
+            executor.map(
+                _run_pickled_job,
+                itertools.repeat(pickle.dumps(job, pickle.HIGHEST_PROTOCOL)),
+                chunks,
+            )
+        )
+    return list(
+        itertools.chain.from_iterable(pickle.loads(result) for result in results)
+    )
@@ -0,0 +1,102 @@
+import base64
+from collections.abc import Mapping
+from urllib.parse import quote
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
+from minisignxml.internal.constants import XMLDSIG_RSA_SHA1, XMLDSIG_RSA_SHA256
+
+XMLDSIG_RSA_SHA384 = "http://www.w3.org/2001/04/xmldsig-more#rsa-sha384"
+XMLDSIG_RSA_SHA512 = "http://www.w3.org/2001/04/xmldsig-more#rsa-sha512"
+
+_SIGNATURE_METHODS: Mapping[str, str] = {
+    hashes.SHA1.name: XMLDSIG_RSA_SHA1,
+    hashes.SHA256.name: XMLDSIG_RSA_SHA256,
+    hashes.SHA384.name: XMLDSIG_RSA_SHA384,
+    hashes.SHA512.name: XMLDSIG_RSA_SHA512,
+}
+
+
+class RedirectSigner:
+    """
+    Signs messages sent using the HTTP-Redirect binding with the private key
+    of a Service Provider. The key and the `SigAlg` parameter are prepared
+    once when the signer is created, so create it once and re-use it.
+    Instances are immutable and can be shared between threads.
+    """
+
+    __slots__ = ("_private_key", "_signature_method", "_padding", "_sig_alg")
+
+    def __init__(
+        self,
+        private_key: RSAPrivateKey,
+        *,
+        signature_method: hashes.HashAlgorithm = hashes.SHA256(),
+    ) -> None:
+        if not isinstance(private_key, RSAPrivateKey):
+            raise TypeError(
+                f"Only RSA private keys are supported. Got {private_key!r} instead."
+            )
+        if signature_method.name not in _SIGNATURE_METHODS:
+            raise ValueError(
+                f"Unsupported signature method {signature_method.name!r}, "
+                f"expected one of {', '.join(_SIGNATURE_METHODS)}"
+            )
+        self._private_key = private_key
+        self._signature_method = signature_method
+        self._padding = padding.PKCS1v15()
+        self._sig_alg = "&SigAlg=" + quote(
+            _SIGNATURE_METHODS[signature_method.name], safe=""
+        )
+
+    @classmethod
+    def from_pem(
+        cls,
+        data: bytes,
+        password: bytes | None = None,
+        *,
+        signature_method: hashes.HashAlgorithm = hashes.SHA256(),
+    ) -> "RedirectSigner":
+        """
+        Loads a PEM encoded private key, encrypted with `password` if given.
+        """
+        key = load_pem_private_key(data, password)
+        if not isinstance(key, RSAPrivateKey):
+            raise TypeError(
+                f"Only RSA private keys are supported. Got {key!r} instead."
+            )
+        return cls(key, signature_method=signature_method)
+
+    @property
+    def private_key(self) -> RSAPrivateKey:
+        return self._private_key
+
+    @property
+    def signature_method(self) -> hashes.HashAlgorithm:
+        return self._signature_method
+
+    @property
+    def sig_alg(self) -> str:
+        return _SIGNATURE_METHODS[self._signature_method.name]
+
+    def __repr__(self) -> str:
+        return f"RedirectSigner(<private key>, signature_method={self.sig_alg!r})"
+
+    def sign_query(self, query: str) -> str:
+        """
+        Appends the `SigAlg` and `Signature` parameters to `query`, the URL
+        encoded `SAMLRequest` (or `SAMLResponse`) and optional `RelayState`
+        parameters in that order. The signature is computed over exactly
+        these bytes, as required by the HTTP-Redirect binding.
+        """
+        query += self._sig_alg
+        signature = self._private_key.sign(
+            query.encode("ascii"), self._padding, self._signature_method
+        )
+        return (
+            query
+            + "&Signature="
+            + quote(base64.b64encode(signature).decode("ascii"), safe="")
+        )
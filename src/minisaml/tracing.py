@@ -0,0 +1,156 @@
+import logging
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+STAGE_DECODE = "decode"
+STAGE_PARSE = "parse"
+STAGE_PREFILTER = "prefilter"
+STAGE_TENANT_LOOKUP = "tenant_lookup"
+STAGE_VERIFY = "verify"
+STAGE_DECRYPT = "decrypt"
+STAGE_EXTRACT = "extract"
+STAGE_REPLAY = "replay"
+STAGE_CACHE = "cache"
+
+
+@dataclass(frozen=True, slots=True)
+class StageTiming:
+    name: str
+    start_time_ns: int
+    end_time_ns: int
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+
+@dataclass(frozen=True, slots=True)
+class ValidationTrace:
+    """
+    Timings and outcome of validating a single SAML Response. Times are in
+    nanoseconds since the epoch, like `time.time_ns`.
+    """
+
+    start_time_ns: int
+    end_time_ns: int
+    stages: tuple[StageTiming, ...]
+    issuer: str | None
+    certificate_fingerprint: str | None
+    error: BaseException | None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time_ns - self.start_time_ns) / 1e9
+
+    @property
+    def error_class(self) -> str | None:
+        return None if self.error is None else type(self.error).__name__
+
+
+class ValidationObserver(ABC):
+    @abstractmethod
+    def observe(self, trace: ValidationTrace) -> None:
+        """
+        Called once per validated response, after validation succeeded or
+        failed. Called on the thread which validated the response.
+        """
+
+
+class CallbackObserver(ValidationObserver):
+    def __init__(self, callback: Callable[[ValidationTrace], None]) -> None:
+        self.callback = callback
+
+    def observe(self, trace: ValidationTrace) -> None:
+        self.callback(trace)
+
+
+class LoggingObserver(ValidationObserver):
+    """
+    Logs one message per response, at `level` if validation succeeded and at
+    `error_level` if it failed. The trace is passed as `extra={"saml_trace": trace}`.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger | None = None,
+        *,
+        level: int = logging.DEBUG,
+        error_level: int = logging.INFO,
+    ) -> None:
+        self.logger = logger if logger is not None else logging.getLogger("minisaml")
+        self.level = level
+        self.error_level = error_level
+
+    def observe(self, trace: ValidationTrace) -> None:
+        level = self.level if trace.error is None else self.error_level
+        if not self.logger.isEnabledFor(level):
+            return
+        self.logger.log(
+            level,
+            "SAML Response %s in %.3fms (issuer=%s, certificate=%s, stages: %s)",
+            "validated" if trace.error is None else f"rejected: {trace.error_class}",
+            trace.duration * 1e3,
+            trace.issuer,
+            trace.certificate_fingerprint,
+            ", ".join(
+                f"{stage.name}={stage.duration * 1e3:.3f}ms" for stage in trace.stages
+            ),
+            extra={"saml_trace": trace},
+        )
+
+
+class Span(Protocol):
+    def set_attribute(self, key: str, value: Any) -> None: ...
+
+    def add_event(
+        self,
+        name: str,
+        attributes: dict[str, Any] | None = None,
+        timestamp: int | None = None,
+    ) -> None: ...
+
+    def record_exception(self, exception: BaseException) -> None: ...
+
+    def end(self, end_time: int | None = None) -> None: ...
+
+
+class Tracer(Protocol):
+    def start_span(
+        self, name: str, *, attributes: dict[str, Any], start_time: int
+    ) -> Span: ...
+
+
+class SpanObserver(ValidationObserver):
+    """
+    Records each validation as a span of an OpenTelemetry compatible `tracer`,
+    such as `opentelemetry.trace.get_tracer(__name__)`. Stages are recorded as
+    span events carrying their duration.
+    """
+
+    def __init__(self, tracer: Tracer, *, span_name: str = "minisaml.validate") -> None:
+        self.tracer = tracer
+        self.span_name = span_name
+
+    def observe(self, trace: ValidationTrace) -> None:
+        attributes: dict[str, Any] = {}
+        if trace.issuer is not None:
+            attributes["minisaml.issuer"] = trace.issuer
+        if trace.certificate_fingerprint is not None:
+            attributes["minisaml.certificate_fingerprint"] = (
+                trace.certificate_fingerprint
+            )
+        span = self.tracer.start_span(
+            self.span_name, attributes=attributes, start_time=trace.start_time_ns
+        )
+        for stage in trace.stages:
+            span.add_event(
+                stage.name,
+                attributes={"minisaml.duration_ms": stage.duration * 1e3},
+                timestamp=stage.end_time_ns,
+            )
+        if trace.error is not None:
+            span.set_attribute("error.type", trace.error_class)
+            span.record_exception(trace.error)
+        span.end(end_time=trace.end_time_ns)
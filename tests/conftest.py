@@ -5,7 +5,6 @@ from pathlib import Path
 import pytest
 from _pytest.monkeypatch import MonkeyPatch
 from cryptography.x509 import Certificate, load_pem_x509_certificate
-from defusedxml.lxml import fromstring
 from lxml.etree import _Element as Element
 from minisignxml.config import VerifyConfig
 from time_machine import TimeMachineFixture
@@ -45,14 +44,15 @@ def too_early(time_machine: TimeMachineFixture) -> None:
 def null_extract(monkeypatch: MonkeyPatch) -> None:
     def null_extract(
         *,
-        xml: bytes,
+        tree: Element,
         certificates: Collection[Certificate],
         config: VerifyConfig = VerifyConfig.default(),
     ) -> tuple[Element, Certificate]:
-        return fromstring(xml), next(iter(certificates))
+        return tree, next(iter(certificates))
 
     monkeypatch.setattr(
-        "minisaml.response.extract_verified_element_and_certificate", null_extract
+        "minisaml.internal.validation.extract_verified_element_and_certificate",
+        null_extract,
     )
 
 
@@ -0,0 +1,62 @@
+import hashlib
+import pickle
+
+import pytest
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509 import Certificate
+from minisignxml.errors import CertificateMismatch
+
+from minisaml.certificates import CertificateStore
+from minisaml.response import validate_response
+
+
+def test_certificate_store(cert: Certificate, cert2: Certificate) -> None:
+    store = CertificateStore([cert, cert2, cert])
+    assert len(store) == 2
+    assert set(store) == {cert, cert2}
+    assert cert in store
+    assert object() not in store
+    der = cert.public_bytes(Encoding.DER)
+    assert store.get_by_der(der) is cert
+    assert store.get_by_fingerprint(hashlib.sha256(der).digest()) is cert
+    assert store.get_by_fingerprint(b"unknown") is None
+    public_key = cert2.public_key()
+    assert isinstance(public_key, RSAPublicKey)
+    assert store.get_by_public_key(public_key) == (cert2,)
+    assert set(pickle.loads(pickle.dumps(store, protocol=5))) == {cert, cert2}
+
+
+def test_certificate_store_of(cert: Certificate, cert2: Certificate) -> None:
+    store = CertificateStore([cert])
+    assert CertificateStore.of(store) is store
+    assert set(CertificateStore.of(cert)) == {cert}
+    assert set(CertificateStore.of([cert, cert2])) == {cert, cert2}
+
+
+@pytest.mark.usefixtures("good_time")
+def test_validate_response_with_store(
+    response_xml_b64: bytes, cert: Certificate, cert2: Certificate
+) -> None:
+    store = CertificateStore([cert2, cert])
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=store,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert response.certificate is cert
+
+
+@pytest.mark.usefixtures("good_time")
+def test_validate_response_with_store_mismatch(
+    response_xml_b64: bytes, cert: Certificate, cert2: Certificate
+) -> None:
+    with pytest.raises(CertificateMismatch) as exc_info:
+        validate_response(
+            data=response_xml_b64,
+            certificate=CertificateStore([cert2]),
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+        )
+    assert exc_info.value.received_certificate == cert
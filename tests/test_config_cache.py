@@ -0,0 +1,271 @@
+import asyncio
+import datetime
+import threading
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any
+
+import pytest
+from cryptography.x509 import Certificate
+from time_machine import TimeMachineFixture
+
+from minisaml.config_cache import AsyncConfigCache, ConfigCache
+from minisaml.response import (
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_multi_tenant_response_async,
+)
+
+NOW = datetime.datetime(2020, 1, 16, 14, 32, 32, tzinfo=datetime.timezone.utc)
+TTL = datetime.timedelta(minutes=5)
+
+
+class InlineExecutor(Executor):
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> "Future[Any]":
+        future: Future[Any] = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+class Backend:
+    def __init__(self, cert: Certificate) -> None:
+        self.config = ValidationConfig(certificate=cert)
+        self.calls: list[str] = []
+        self.version = 0
+
+    def __call__(self, issuer: str) -> tuple[ValidationConfig, tuple[str, int]]:
+        self.calls.append(issuer)
+        return self.config, (issuer, self.version)
+
+    async def get_async(self, issuer: str) -> tuple[ValidationConfig, tuple[str, int]]:
+        await asyncio.sleep(0)
+        return self(issuer)
+
+
+def test_config_cache_ttl(cert: Certificate, time_machine: TimeMachineFixture) -> None:
+    time_machine.move_to(NOW, tick=False)
+    backend = Backend(cert)
+    cache = ConfigCache(backend, ttl=TTL)
+    assert cache("a") == (backend.config, ("a", 0))
+    backend.version = 1
+    assert cache("a") == (backend.config, ("a", 0))
+    assert backend.calls == ["a"]
+    time_machine.move_to(NOW + TTL, tick=False)
+    assert cache("a") == (backend.config, ("a", 1))
+    assert backend.calls == ["a", "a"]
+
+
+def test_config_cache_lru(cert: Certificate) -> None:
+    backend = Backend(cert)
+    cache = ConfigCache(backend, ttl=TTL, max_size=2)
+    cache("a")
+    cache("b")
+    cache("a")
+    cache("c")
+    assert len(cache) == 2
+    cache("a")
+    cache("b")
+    assert backend.calls == ["a", "b", "c", "b"]
+
+
+def test_config_cache_invalidate(cert: Certificate) -> None:
+    backend = Backend(cert)
+    cache = ConfigCache(backend, ttl=TTL)
+    cache("a")
+    cache("b")
+    cache.invalidate("a")
+    cache("a")
+    cache("b")
+    assert backend.calls == ["a", "b", "a"]
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_config_cache_errors_not_cached(cert: Certificate) -> None:
+    backend = Backend(cert)
+    failures = [ValueError("a")]
+
+    def get_config_for_issuer(
+        issuer: str,
+    ) -> tuple[ValidationConfig, tuple[str, int]]:
+        if failures:
+            raise failures.pop()
+        return backend(issuer)
+
+    cache = ConfigCache(get_config_for_issuer, ttl=TTL)
+    with pytest.raises(ValueError):
+        cache("a")
+    assert cache("a") == (backend.config, ("a", 0))
+
+
+def test_config_cache_stale_while_revalidate(
+    cert: Certificate, time_machine: TimeMachineFixture
+) -> None:
+    time_machine.move_to(NOW, tick=False)
+    backend = Backend(cert)
+    cache = ConfigCache(
+        backend,
+        ttl=TTL,
+        stale_while_revalidate=datetime.timedelta(minutes=1),
+        executor=InlineExecutor(),
+    )
+    cache("a")
+    backend.version = 1
+    time_machine.move_to(NOW + TTL, tick=False)
+    assert cache("a") == (backend.config, ("a", 0))
+    assert cache("a") == (backend.config, ("a", 1))
+    assert backend.calls == ["a", "a"]
+    time_machine.move_to(NOW + TTL * 3, tick=False)
+    backend.version = 2
+    assert cache("a") == (backend.config, ("a", 2))
+
+
+def test_config_cache_collapses_concurrent_lookups(cert: Certificate) -> None:
+    backend = Backend(cert)
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_config_for_issuer(
+        issuer: str,
+    ) -> tuple[ValidationConfig, tuple[str, int]]:
+        started.set()
+        release.wait()
+        return backend(issuer)
+
+    cache = ConfigCache(get_config_for_issuer, ttl=TTL)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        first = executor.submit(cache, "a")
+        started.wait()
+        rest = [executor.submit(cache, "a") for _ in range(7)]
+        release.set()
+        results = [future.result() for future in [first, *rest]]
+    assert results == [(backend.config, ("a", 0))] * 8
+    assert backend.calls == ["a"]
+
+
+class Exit(BaseException):
+    pass
+
+
+def test_config_cache_base_exception(cert: Certificate) -> None:
+    backend = Backend(cert)
+    started = threading.Event()
+    release = threading.Event()
+
+    def get_config_for_issuer(
+        issuer: str,
+    ) -> tuple[ValidationConfig, tuple[str, int]]:
+        started.set()
+        release.wait()
+        if not backend.calls:
+            backend.calls.append(issuer)
+            raise Exit()
+        return backend(issuer)
+
+    cache = ConfigCache(get_config_for_issuer, ttl=TTL)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = executor.submit(cache, "a")
+        started.wait()
+        # The lookup concurrent callers wait for.
+        pending = cache._pending["a"]
+        release.set()
+        with pytest.raises(Exit):
+            first.result(timeout=5)
+        assert isinstance(pending.exception(timeout=5), Exit)
+        # The failed lookup is not left pending.
+        assert executor.submit(cache, "a").result(timeout=5) == (
+            backend.config,
+            ("a", 0),
+        )
+    assert backend.calls == ["a", "a"]
+
+
+@pytest.mark.usefixtures("good_time")
+def test_config_cache_validate_multi_tenant_response(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    backend = Backend(cert)
+    cache = ConfigCache(backend, ttl=TTL)
+    for _ in range(2):
+        response, state = validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=cache,
+            expected_audience="https://sp.invalid",
+        )
+        assert state == (response.issuer, 0)
+    assert backend.calls == ["https://idp.invalid"]
+
+
+async def test_async_config_cache_collapses_concurrent_lookups(
+    cert: Certificate,
+) -> None:
+    backend = Backend(cert)
+    cache = AsyncConfigCache(backend.get_async, ttl=TTL)
+    results = await asyncio.gather(*(cache("a") for _ in range(8)))
+    assert results == [(backend.config, ("a", 0))] * 8
+    assert backend.calls == ["a"]
+    assert await cache("a") == (backend.config, ("a", 0))
+    assert backend.calls == ["a"]
+
+
+async def test_async_config_cache_cancelled_caller(cert: Certificate) -> None:
+    backend = Backend(cert)
+    cache = AsyncConfigCache(backend.get_async, ttl=TTL)
+    cancelled = asyncio.ensure_future(cache("a"))
+    other = asyncio.ensure_future(cache("a"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    assert await other == (backend.config, ("a", 0))
+    assert backend.calls == ["a"]
+
+
+async def test_async_config_cache_stale_while_revalidate(
+    cert: Certificate, time_machine: TimeMachineFixture
+) -> None:
+    time_machine.move_to(NOW, tick=False)
+    backend = Backend(cert)
+    cache = AsyncConfigCache(
+        backend.get_async, ttl=TTL, stale_while_revalidate=datetime.timedelta(minutes=1)
+    )
+    await cache("a")
+    backend.version = 1
+    time_machine.move_to(NOW + TTL, tick=False)
+    assert await cache("a") == (backend.config, ("a", 0))
+    assert await cache("a") == (backend.config, ("a", 0))
+    await asyncio.sleep(0.01)
+    assert await cache("a") == (backend.config, ("a", 1))
+    assert backend.calls == ["a", "a"]
+
+
+async def test_async_config_cache_invalidate_during_lookup(cert: Certificate) -> None:
+    backend = Backend(cert)
+    cache = AsyncConfigCache(backend.get_async, ttl=TTL)
+    pending = asyncio.ensure_future(cache("a"))
+    await asyncio.sleep(0)
+    cache.invalidate("a")
+    assert await pending == (backend.config, ("a", 0))
+    assert len(cache) == 0
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_async_config_cache_validate_multi_tenant_response(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    backend = Backend(cert)
+    cache = AsyncConfigCache(backend.get_async, ttl=TTL)
+    for _ in range(2):
+        response, state = await validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=cache,
+            expected_audience="https://sp.invalid",
+        )
+        assert state == (response.issuer, 0)
+        response, state = await validate_multi_tenant_response_async(
+            data=response_xml_b64,
+            get_config_for_issuer=cache,
+            expected_audience="https://sp.invalid",
+        )
+        assert state == (response.issuer, 0)
+    assert backend.calls == ["https://idp.invalid"]
@@ -0,0 +1,88 @@
+import base64
+import binascii
+import re
+
+from hypothesis import given
+from hypothesis import strategies as st
+
+from minisaml.internal.encoding import (
+    Base64Data,
+    Base64Decoder,
+    decode_base64,
+)
+
+base64_like = st.lists(
+    st.sampled_from(
+        [b"A", b"Q", b"z", b"+", b"/", b"=", b"\n", b"\r", b" ", b"-", b"\xff"]
+    ),
+    max_size=64,
+).map(b"".join)
+
+
+def decode_chunked(data: bytes, splits: list[int]) -> bytes:
+    decoder = Base64Decoder()
+    chunks = []
+    start = 0
+    for split in sorted(splits):
+        chunks.append(decoder.decode(data[start:split]))
+        start = max(start, split)
+    chunks.append(decoder.decode(data[start:]))
+    chunks.append(decoder.final())
+    return b"".join(chunks)
+
+
+@given(st.binary(max_size=256), st.lists(st.integers(0, 400)), st.integers(1, 80))
+def test_round_trip(data: bytes, splits: list[int], line_length: int) -> None:
+    encoded = base64.b64encode(data)
+    wrapped = b"\r\n".join(
+        encoded[i : i + line_length] for i in range(0, len(encoded), line_length)
+    )
+    assert decode_chunked(wrapped, splits) == data
+
+
+def strict_b64decode(data: bytes) -> bytes | binascii.Error:
+    """
+    Reference for `decode_base64`: whitespace is discarded, the rest has to
+    be complete groups of base64 characters with at most two padding
+    characters at the end.
+    """
+    data = data.translate(None, b"\t\n\r ")
+    if len(data) % 4 or not re.fullmatch(rb"[A-Za-z0-9+/]*={0,2}", data):
+        return binascii.Error()
+    try:
+        return base64.b64decode(data)
+    except binascii.Error as exc:
+        return exc
+
+
+@given(base64_like)
+def test_decode_base64(data: bytes) -> None:
+    expected = strict_b64decode(data)
+    values: list[Base64Data] = [
+        data,
+        bytearray(data),
+        memoryview(data),
+        data.decode("latin-1"),
+    ]
+    for value in values:
+        try:
+            result: bytes | binascii.Error = decode_base64(value)
+        except binascii.Error as exc:
+            result = exc
+        if isinstance(expected, binascii.Error):
+            assert isinstance(result, binascii.Error)
+        else:
+            assert result == expected
+
+
+@given(base64_like, st.lists(st.integers(0, 64)))
+def test_matches_decode_base64(data: bytes, splits: list[int]) -> None:
+    expected = strict_b64decode(data)
+    try:
+        result: bytes | binascii.Error = decode_chunked(data, splits)
+    except binascii.Error as exc:
+        result = exc
+    if isinstance(expected, binascii.Error):
+        assert isinstance(result, binascii.Error)
+    else:
+        assert result == expected
@@ -0,0 +1,462 @@
+import base64
+import datetime
+import os
+import pickle
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.ciphers import Cipher
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.ciphers.algorithms import AES
+from cryptography.hazmat.primitives.ciphers.modes import CBC
+from cryptography.hazmat.primitives.serialization import (
+    BestAvailableEncryption,
+    Encoding,
+    PrivateFormat,
+)
+from cryptography.x509 import Certificate
+from cryptography.x509.oid import NameOID
+from lxml.etree import _Element as Element
+from lxml.etree import tostring
+from minisignxml.internal.namespaces import ds, make_namespace
+from minisignxml.sign import sign
+
+from minisaml.encryption import AssertionDecryptor
+from minisaml.errors import (
+    DecryptionFailed,
+    MalformedSAMLResponse,
+    UnsupportedEncryption,
+)
+from minisaml.internal import paths
+from minisaml.internal.constants import (
+    XMLENC11,
+    XMLENC11_AES128_GCM,
+    XMLENC11_AES192_GCM,
+    XMLENC11_AES256_GCM,
+    XMLENC11_RSA_OAEP,
+    XMLENC_AES128_CBC,
+    XMLENC_AES192_CBC,
+    XMLENC_AES256_CBC,
+    XMLENC_ELEMENT,
+    XMLENC_RSA_OAEP_MGF1P,
+)
+from minisaml.internal.namespaces import NAMESPACE_MAP, saml, xenc
+from minisaml.internal.utils import deserialize_xml
+from minisaml.response import (
+    Response,
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_response,
+)
+from minisaml.tracing import STAGE_DECRYPT, CallbackObserver, ValidationTrace
+
+xenc11 = make_namespace("xenc11", XMLENC11)
+
+XMLENC11_MGF1SHA256 = "http://www.w3.org/2009/xmlenc11#mgf1sha256"
+XMLENC_SHA256 = "http://www.w3.org/2001/04/xmlenc#sha256"
+
+
+def generate_key_and_certificate() -> tuple[RSAPrivateKey, Certificate]:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "minisaml test")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, certificate
+
+
+@pytest.fixture(scope="session")
+def sp_key_and_certificate() -> tuple[RSAPrivateKey, Certificate]:
+    return generate_key_and_certificate()
+
+
+@pytest.fixture(scope="session")
+def sp_key(sp_key_and_certificate: tuple[RSAPrivateKey, Certificate]) -> RSAPrivateKey:
+    return sp_key_and_certificate[0]
+
+
+@pytest.fixture(scope="session")
+def other_sp_key() -> RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def encrypt_assertion(
+    assertion: Element,
+    key: RSAPrivateKey,
+    *,
+    block_method: str = XMLENC11_AES256_GCM,
+    key_transport: str = XMLENC_RSA_OAEP_MGF1P,
+    certificate: Certificate | None = None,
+    plaintext: bytes | None = None,
+) -> Element:
+    """
+    Encrypts `assertion` for `key` and returns the resulting
+    saml:EncryptedAssertion, like an Identity Provider would.
+    """
+    key_size = int(block_method.rsplit("aes", 1)[1][:3]) // 8
+    content_key = os.urandom(key_size)
+    if plaintext is None:
+        plaintext = tostring(assertion)
+    if block_method.endswith("gcm"):
+        iv = os.urandom(12)
+        cipher_value = iv + AESGCM(content_key).encrypt(iv, plaintext, None)
+    else:
+        iv = os.urandom(16)
+        padding_length = 16 - len(plaintext) % 16
+        padded = plaintext + os.urandom(padding_length - 1) + bytes([padding_length])
+        encryptor = Cipher(AES(content_key), CBC(iv)).encryptor()
+        cipher_value = iv + encryptor.update(padded) + encryptor.finalize()
+    if key_transport == XMLENC11_RSA_OAEP:
+        oaep = padding.OAEP(
+            mgf=padding.MGF1(hashes.SHA256()), algorithm=hashes.SHA256(), label=None
+        )
+        key_method = xenc.EncryptionMethod(
+            ds.DigestMethod(Algorithm=XMLENC_SHA256),
+            xenc11.MGF(Algorithm=XMLENC11_MGF1SHA256),
+            Algorithm=key_transport,
+        )
+    else:
+        oaep = padding.OAEP(
+            mgf=padding.MGF1(hashes.SHA1()), algorithm=hashes.SHA1(), label=None
+        )
+        key_method = xenc.EncryptionMethod(Algorithm=key_transport)
+    encrypted_key = xenc.EncryptedKey(
+        key_method,
+        xenc.CipherData(
+            xenc.CipherValue(
+                base64.b64encode(key.public_key().encrypt(content_key, oaep)).decode()
+            )
+        ),
+    )
+    if certificate is not None:
+        encrypted_key.insert(
+            1,
+            ds.KeyInfo(
+                ds.X509Data(
+                    ds.X509Certificate(
+                        base64.b64encode(
+                            certificate.public_bytes(Encoding.DER)
+                        ).decode()
+                    )
+                )
+            ),
+        )
+    return saml.EncryptedAssertion(
+        xenc.EncryptedData(
+            xenc.EncryptionMethod(Algorithm=block_method),
+            ds.KeyInfo(encrypted_key),
+            xenc.CipherData(xenc.CipherValue(base64.b64encode(cipher_value).decode())),
+            Type=XMLENC_ELEMENT,
+        )
+    )
+
+
+def encrypted_response_tree(
+    response_xml_b64: bytes,
+    key: RSAPrivateKey,
+    *,
+    block_method: str = XMLENC11_AES256_GCM,
+    key_transport: str = XMLENC_RSA_OAEP_MGF1P,
+    certificate: Certificate | None = None,
+) -> Element:
+    tree = deserialize_xml(base64.b64decode(response_xml_b64))
+    assertion = paths.ASSERTION.find_one(tree)
+    tree.replace(
+        assertion,
+        encrypt_assertion(
+            assertion,
+            key,
+            block_method=block_method,
+            key_transport=key_transport,
+            certificate=certificate,
+        ),
+    )
+    return tree
+
+
+def encode(tree: Element) -> bytes:
+    return base64.b64encode(tostring(tree))
+
+
+def validate(
+    data: bytes, certificate: Certificate, decryptor: AssertionDecryptor | None
+) -> Response:
+    return validate_response(
+        data=data,
+        certificate=certificate,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        decryptor=decryptor,
+    )
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize(
+    "block_method", [XMLENC11_AES128_GCM, XMLENC11_AES192_GCM, XMLENC11_AES256_GCM]
+)
+@pytest.mark.parametrize("key_transport", [XMLENC_RSA_OAEP_MGF1P, XMLENC11_RSA_OAEP])
+def test_encrypted_assertion(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    sp_key: RSAPrivateKey,
+    block_method: str,
+    key_transport: str,
+) -> None:
+    tree = encrypted_response_tree(
+        response_xml_b64,
+        sp_key,
+        block_method=block_method,
+        key_transport=key_transport,
+    )
+    response = validate(encode(tree), cert, AssertionDecryptor(sp_key))
+    assert response.name_id == "user.name"
+    assert response.audience == "https://sp.invalid"
+    assert response.issuer == "https://idp.invalid"
+    assert response.attrs == {"attr name": "attr value"}
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_inherited_namespace(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    # Identity Providers may serialize the assertion without the namespace
+    # declarations of its ancestors.
+    tree = deserialize_xml(base64.b64decode(response_xml_b64))
+    assertion = paths.ASSERTION.find_one(tree)
+    plaintext = tostring(assertion).replace(
+        b' xmlns:saml="urn:oasis:names:tc:SAML:2.0:assertion"', b"", 1
+    )
+    assert b"xmlns:saml=" not in plaintext.split(b">", 1)[0]
+    tree.replace(assertion, encrypt_assertion(assertion, sp_key, plaintext=plaintext))
+    response = validate(encode(tree), cert, AssertionDecryptor(sp_key))
+    assert response.name_id == "user.name"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_signed_response(
+    response_xml_b64: bytes, sp_key: RSAPrivateKey
+) -> None:
+    idp_key, idp_certificate = generate_key_and_certificate()
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    data = base64.b64encode(
+        sign(element=tree, private_key=idp_key, certificate=idp_certificate, index=1)
+    )
+    response = validate(data, idp_certificate, AssertionDecryptor(sp_key))
+    assert response.name_id == "user.name"
+    assert response.certificate == idp_certificate
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize(
+    "block_method", [XMLENC_AES128_CBC, XMLENC_AES192_CBC, XMLENC_AES256_CBC]
+)
+@pytest.mark.parametrize("key_transport", [XMLENC_RSA_OAEP_MGF1P, XMLENC11_RSA_OAEP])
+def test_encrypted_assertion_cbc(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    sp_key: RSAPrivateKey,
+    block_method: str,
+    key_transport: str,
+) -> None:
+    tree = encrypted_response_tree(
+        response_xml_b64,
+        sp_key,
+        block_method=block_method,
+        key_transport=key_transport,
+    )
+    # AES-CBC is only decrypted if the response signature authenticates it.
+    with pytest.raises(UnsupportedEncryption) as exc_info:
+        validate(encode(tree), cert, AssertionDecryptor(sp_key))
+    assert exc_info.value.algorithm == block_method
+    idp_key, idp_certificate = generate_key_and_certificate()
+    data = base64.b64encode(
+        sign(element=tree, private_key=idp_key, certificate=idp_certificate, index=1)
+    )
+    response = validate(data, idp_certificate, AssertionDecryptor(sp_key))
+    assert response.name_id == "user.name"
+    assert response.attrs == {"attr name": "attr value"}
+
+
+def test_decrypt_cbc_errors_are_indistinguishable(
+    response_xml_b64: bytes, sp_key: RSAPrivateKey
+) -> None:
+    # Invalid padding, invalid XML and a valid element other than an
+    # assertion must fail the same way, otherwise the error is an oracle
+    # revealing the plaintext of modified ciphertexts.
+    assertion = paths.ASSERTION.find_one(
+        deserialize_xml(base64.b64decode(response_xml_b64))
+    )
+    bad_padding = encrypt_assertion(assertion, sp_key, block_method=XMLENC_AES256_CBC)
+    (cipher_value,) = bad_padding.xpath(
+        "xenc:EncryptedData/xenc:CipherData/xenc:CipherValue",
+        namespaces=NAMESPACE_MAP,
+    )
+    assert cipher_value.text is not None
+    data = bytearray(base64.b64decode(cipher_value.text))
+    # Flips the highest bit of the last plaintext byte, the padding length.
+    data[-17] ^= 0x80
+    cipher_value.text = base64.b64encode(data).decode()
+    encrypted_assertions = [
+        bad_padding,
+        encrypt_assertion(
+            assertion,
+            sp_key,
+            block_method=XMLENC_AES256_CBC,
+            plaintext=b"<saml:Issuer>https://idp.invalid</saml:Issuer>",
+        ),
+        encrypt_assertion(
+            assertion, sp_key, block_method=XMLENC_AES256_CBC, plaintext=b"<saml:"
+        ),
+    ]
+    decryptor = AssertionDecryptor(sp_key)
+    errors = []
+    for encrypted_assertion in encrypted_assertions:
+        with pytest.raises(DecryptionFailed) as exc_info:
+            decryptor.decrypt(encrypted_assertion, authenticated=True)
+        errors.append(exc_info.value)
+    assert {(type(error), str(error), error.args) for error in errors} == {
+        (DecryptionFailed, "", ())
+    }
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_key_rollover(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    sp_key_and_certificate: tuple[RSAPrivateKey, Certificate],
+    other_sp_key: RSAPrivateKey,
+) -> None:
+    sp_key, sp_certificate = sp_key_and_certificate
+    decryptor = AssertionDecryptor([other_sp_key, sp_key])
+    for certificate in (None, sp_certificate):
+        tree = encrypted_response_tree(
+            response_xml_b64, sp_key, certificate=certificate
+        )
+        assert validate(encode(tree), cert, decryptor).name_id == "user.name"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_wrong_key(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    sp_key: RSAPrivateKey,
+    other_sp_key: RSAPrivateKey,
+) -> None:
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    with pytest.raises(DecryptionFailed):
+        validate(encode(tree), cert, AssertionDecryptor(other_sp_key))
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_tampered(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    (cipher_value,) = tree.xpath(
+        "//xenc:EncryptedData/xenc:CipherData/xenc:CipherValue",
+        namespaces=NAMESPACE_MAP,
+    )
+    assert cipher_value.text is not None
+    data = bytearray(base64.b64decode(cipher_value.text))
+    data[-20] ^= 1
+    cipher_value.text = base64.b64encode(data).decode()
+    with pytest.raises(DecryptionFailed):
+        validate(encode(tree), cert, AssertionDecryptor(sp_key))
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_unsupported_algorithm(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    (method,) = tree.xpath(
+        "//xenc:EncryptedKey/xenc:EncryptionMethod", namespaces=NAMESPACE_MAP
+    )
+    method.set("Algorithm", "http://www.w3.org/2001/04/xmlenc#rsa-1_5")
+    with pytest.raises(UnsupportedEncryption) as exc_info:
+        validate(encode(tree), cert, AssertionDecryptor(sp_key))
+    assert exc_info.value.algorithm == "http://www.w3.org/2001/04/xmlenc#rsa-1_5"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_without_decryptor(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    with pytest.raises(MalformedSAMLResponse):
+        validate(encode(tree), cert, None)
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_multi_tenant(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    issuers = []
+
+    def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, None]:
+        issuers.append(issuer)
+        return (
+            ValidationConfig(certificate=cert, decryptor=AssertionDecryptor(sp_key)),
+            None,
+        )
+
+    response, _ = validate_multi_tenant_response(
+        data=encode(tree),
+        get_config_for_issuer=get_config_for_issuer,
+        expected_audience="https://sp.invalid",
+    )
+    assert issuers == ["https://idp.invalid"]
+    assert response.name_id == "user.name"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_encrypted_assertion_trace(
+    response_xml_b64: bytes, cert: Certificate, sp_key: RSAPrivateKey
+) -> None:
+    traces: list[ValidationTrace] = []
+    tree = encrypted_response_tree(response_xml_b64, sp_key)
+    validate_response(
+        data=encode(tree),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        decryptor=AssertionDecryptor(sp_key),
+        observer=CallbackObserver(traces.append),
+    )
+    assert [trace.error for trace in traces] == [None]
+    assert STAGE_DECRYPT in [stage.name for stage in traces[0].stages]
+
+
+def test_decryptor_pickle(sp_key: RSAPrivateKey, other_sp_key: RSAPrivateKey) -> None:
+    decryptor = AssertionDecryptor([sp_key, other_sp_key])
+    unpickled = pickle.loads(pickle.dumps(decryptor))
+    assert [key.private_numbers() for key in unpickled.private_keys] == [
+        key.private_numbers() for key in decryptor.private_keys
+    ]
+
+
+def test_decryptor_from_pem(sp_key: RSAPrivateKey) -> None:
+    pem = sp_key.private_bytes(
+        Encoding.PEM, PrivateFormat.PKCS8, BestAvailableEncryption(b"secret")
+    )
+    decryptor = AssertionDecryptor.from_pem(pem, password=b"secret")
+    assert [key.private_numbers() for key in decryptor.private_keys] == [
+        sp_key.private_numbers()
+    ]
+
+
+def test_decryptor_requires_key() -> None:
+    with pytest.raises(ValueError):
+        AssertionDecryptor([])
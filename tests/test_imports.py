@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_PACKAGES = {"asyncio", "cryptography", "lxml", "minisignxml"}
+
+
+def loaded_packages(*modules: str) -> set[str]:
+    """
+    Imports `modules` in a fresh interpreter and returns the top level
+    packages in its `sys.modules` afterwards.
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, {', '.join(modules)}\nprint('\\n'.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {name.split(".")[0] for name in result.stdout.splitlines()}
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["minisaml", "minisaml.request", "minisaml.response", "minisaml.errors"],
+)
+def test_import_does_not_load_crypto_stack(module: str) -> None:
+    assert not loaded_packages(module) & HEAVY_PACKAGES
+
+
+def test_validation_loads_crypto_stack() -> None:
+    assert HEAVY_PACKAGES <= loaded_packages("minisaml.internal.validation")
@@ -0,0 +1,207 @@
+import base64
+import io
+import pickle
+from collections.abc import Iterator
+
+import pytest
+from cryptography.x509 import Certificate
+
+from minisaml.errors import (
+    AttributeCountLimitExceeded,
+    DecodedSizeLimitExceeded,
+    DepthLimitExceeded,
+    ElementCountLimitExceeded,
+    EncodedSizeLimitExceeded,
+    ResponseLimitExceeded,
+)
+from minisaml.response import (
+    ResponseLimits,
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_response,
+    validate_response_stream,
+)
+
+
+def validate(data: bytes, cert: Certificate, limits: ResponseLimits) -> None:
+    validate_response(
+        data=data,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        limits=limits,
+    )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_default_limits_accept_response(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        limits=ResponseLimits(),
+    )
+    assert response.name_id == "user.name"
+
+
+@pytest.mark.parametrize(
+    "limits,error",
+    [
+        (ResponseLimits(max_encoded_size=1000), EncodedSizeLimitExceeded),
+        (ResponseLimits(max_decoded_size=1000), DecodedSizeLimitExceeded),
+        (ResponseLimits(max_elements=10), ElementCountLimitExceeded),
+        (ResponseLimits(max_depth=3), DepthLimitExceeded),
+        (ResponseLimits(max_attributes=2), AttributeCountLimitExceeded),
+    ],
+)
+def test_limits(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    limits: ResponseLimits,
+    error: type[ResponseLimitExceeded],
+) -> None:
+    with pytest.raises(error):
+        validate(response_xml_b64, cert, limits)
+
+
+@pytest.mark.parametrize(
+    "xml,limits,error",
+    [
+        (
+            b"<a>" * 100 + b"</a>" * 100,
+            ResponseLimits(max_depth=50),
+            DepthLimitExceeded,
+        ),
+        (
+            b"<a>" + b"<b/>" * 100 + b"</a>",
+            ResponseLimits(max_elements=50),
+            ElementCountLimitExceeded,
+        ),
+        (
+            b"<a>" + b'<b c="1"/>' * 100 + b"</a>",
+            ResponseLimits(max_attributes=50),
+            AttributeCountLimitExceeded,
+        ),
+    ],
+)
+def test_structure_limits(
+    cert: Certificate, xml: bytes, limits: ResponseLimits, error: type[Exception]
+) -> None:
+    with pytest.raises(error) as exc_info:
+        validate(base64.b64encode(xml), cert, limits)
+    assert isinstance(exc_info.value, ResponseLimitExceeded)
+
+
+def test_disabled_limits(cert: Certificate) -> None:
+    limits = ResponseLimits(
+        max_encoded_size=None,
+        max_decoded_size=None,
+        max_elements=None,
+        max_depth=None,
+        max_attributes=None,
+    )
+    xml = b"<a>" * 100 + b"</a>" * 100
+    # Fails looking for the signature, after parsing.
+    with pytest.raises(Exception) as exc_info:
+        validate(base64.b64encode(xml), cert, limits)
+    assert not isinstance(exc_info.value, ResponseLimitExceeded)
+
+
+@pytest.mark.parametrize(
+    "limits,error,repeated",
+    [
+        (
+            ResponseLimits(max_encoded_size=4096),
+            EncodedSizeLimitExceeded,
+            b"<b/>" * 300,
+        ),
+        (
+            ResponseLimits(max_decoded_size=4096),
+            DecodedSizeLimitExceeded,
+            b"<b/>" * 300,
+        ),
+    ],
+)
+def test_stream_rejected_before_end(
+    cert: Certificate,
+    limits: ResponseLimits,
+    error: type[Exception],
+    repeated: bytes,
+) -> None:
+    consumed = 0
+
+    def stream() -> Iterator[bytes]:
+        nonlocal consumed
+        yield base64.b64encode(b"<a>")
+        # Endless document, each chunk is valid base64 on its own.
+        chunk = base64.b64encode(repeated)
+        while True:
+            consumed += 1
+            yield chunk
+
+    with pytest.raises(error):
+        validate_response_stream(
+            stream=stream(),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            limits=limits,
+        )
+    assert consumed < 10
+
+
+@pytest.mark.parametrize(
+    "limits,error",
+    [
+        (ResponseLimits(max_elements=10), ElementCountLimitExceeded),
+        (ResponseLimits(max_depth=3), DepthLimitExceeded),
+        (ResponseLimits(max_attributes=2), AttributeCountLimitExceeded),
+    ],
+)
+def test_stream_structure_limits(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    limits: ResponseLimits,
+    error: type[Exception],
+) -> None:
+    with pytest.raises(error):
+        validate_response_stream(
+            stream=io.BytesIO(response_xml_b64),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            limits=limits,
+            chunk_size=100,
+        )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_multi_tenant_limits(response_xml_b64: bytes, cert: Certificate) -> None:
+    def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, None]:
+        return ValidationConfig(
+            certificate=cert, limits=ResponseLimits(max_elements=10)
+        ), None
+
+    with pytest.raises(ElementCountLimitExceeded):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience="https://sp.invalid",
+        )
+
+    with pytest.raises(DepthLimitExceeded):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience="https://sp.invalid",
+            limits=ResponseLimits(max_depth=3),
+        )
+
+
+def test_limit_error_pickle() -> None:
+    error = pickle.loads(pickle.dumps(DepthLimitExceeded(limit=3)))
+    assert isinstance(error, DepthLimitExceeded)
+    assert error.limit == 3
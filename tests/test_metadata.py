@@ -0,0 +1,296 @@
+import base64
+import datetime
+import os
+from pathlib import Path
+
+import pytest
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509 import Certificate
+from defusedxml.lxml import EntitiesForbidden
+from time_machine import TimeMachineFixture
+
+from minisaml.errors import MalformedMetadata, MetadataExpired, UnknownIssuer
+from minisaml.metadata import EntityMetadata, MetadataRegistry, parse_metadata
+from minisaml.response import ValidationConfig, validate_multi_tenant_response
+
+REDIRECT = "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-Redirect"
+POST = "urn:oasis:names:tc:SAML:2.0:bindings:HTTP-POST"
+
+
+def key_descriptor(certificate: Certificate, use: str | None = "signing") -> str:
+    der = base64.b64encode(certificate.public_bytes(Encoding.DER)).decode("ascii")
+    use_attribute = f' use="{use}"' if use else ""
+    return (
+        f"<md:KeyDescriptor{use_attribute}><ds:KeyInfo><ds:X509Data>"
+        f"<ds:X509Certificate>{der}</ds:X509Certificate>"
+        "</ds:X509Data></ds:KeyInfo></md:KeyDescriptor>"
+    )
+
+
+def idp(
+    entity_id: str,
+    *key_descriptors: str,
+    location: str = "https://idp.invalid/sso",
+    valid_until: str | None = None,
+) -> str:
+    valid_until_attribute = f' validUntil="{valid_until}"' if valid_until else ""
+    return (
+        f'<md:EntityDescriptor entityID="{entity_id}"{valid_until_attribute}>'
+        '<md:IDPSSODescriptor protocolSupportEnumeration="'
+        'urn:oasis:names:tc:SAML:2.0:protocol">'
+        f"{''.join(key_descriptors)}"
+        f'<md:SingleSignOnService Binding="{POST}" Location="{location}/post"/>'
+        f'<md:SingleSignOnService Binding="{REDIRECT}" Location="{location}"/>'
+        "</md:IDPSSODescriptor></md:EntityDescriptor>"
+    )
+
+
+def sp(entity_id: str) -> str:
+    return (
+        f'<md:EntityDescriptor entityID="{entity_id}">'
+        '<md:SPSSODescriptor protocolSupportEnumeration="'
+        'urn:oasis:names:tc:SAML:2.0:protocol"/>'
+        "</md:EntityDescriptor>"
+    )
+
+
+def aggregate(*entities: str, valid_until: str | None = None) -> bytes:
+    valid_until_attribute = f' validUntil="{valid_until}"' if valid_until else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<md:EntitiesDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" '
+        'xmlns:ds="http://www.w3.org/2000/09/xmldsig#"'
+        f"{valid_until_attribute}>{''.join(entities)}</md:EntitiesDescriptor>"
+    ).encode()
+
+
+def test_parse_metadata(cert: Certificate, cert2: Certificate) -> None:
+    metadata = aggregate(
+        idp(
+            "https://one.invalid",
+            key_descriptor(cert),
+            key_descriptor(cert2, use=None),
+            key_descriptor(cert2, use="encryption"),
+            location="https://one.invalid/sso",
+        ),
+        sp("https://sp.invalid"),
+        # Nested aggregate with a shorter validity.
+        "<md:EntitiesDescriptor validUntil='2020-01-01T00:00:00Z'>"
+        + idp(
+            "https://two.invalid",
+            key_descriptor(cert2, use="encryption"),
+            location="https://two.invalid/sso",
+            valid_until="2021-01-01T00:00:00Z",
+        )
+        + "</md:EntitiesDescriptor>",
+        valid_until="2020-06-01T00:00:00Z",
+    )
+    one, two = parse_metadata(metadata)
+    assert one.entity_id == "https://one.invalid"
+    assert set(one.certificates) == {cert, cert2}
+    assert one.single_sign_on_url == "https://one.invalid/sso"
+    assert one.valid_until == datetime.datetime(
+        2020, 6, 1, tzinfo=datetime.timezone.utc
+    )
+    assert two.entity_id == "https://two.invalid"
+    assert len(two.certificates) == 0
+    assert two.single_sign_on_url == "https://two.invalid/sso"
+    assert two.valid_until == datetime.datetime(
+        2020, 1, 1, tzinfo=datetime.timezone.utc
+    )
+
+
+def test_parse_metadata_single_entity(cert: Certificate) -> None:
+    metadata = idp("https://idp.invalid", key_descriptor(cert)).replace(
+        "<md:EntityDescriptor ",
+        '<md:EntityDescriptor xmlns:md="urn:oasis:names:tc:SAML:2.0:metadata" '
+        'xmlns:ds="http://www.w3.org/2000/09/xmldsig#" ',
+        1,
+    )
+    (entity,) = parse_metadata(metadata.encode("utf-8"))
+    assert entity.entity_id == "https://idp.invalid"
+    assert entity.valid_until is None
+
+
+def test_parse_metadata_invalid() -> None:
+    with pytest.raises(MalformedMetadata):
+        list(parse_metadata(aggregate(idp(""))))
+    with pytest.raises(MalformedMetadata):
+        list(parse_metadata(aggregate(idp("https://idp.invalid", valid_until="x"))))
+    with pytest.raises(MalformedMetadata):
+        list(
+            parse_metadata(
+                aggregate(
+                    idp(
+                        "https://idp.invalid",
+                        "<md:KeyDescriptor><ds:KeyInfo><ds:X509Data>"
+                        "<ds:X509Certificate>AAAA</ds:X509Certificate>"
+                        "</ds:X509Data></ds:KeyInfo></md:KeyDescriptor>",
+                    )
+                )
+            )
+        )
+
+
+def test_parse_metadata_entities_forbidden() -> None:
+    metadata = (
+        b'<!DOCTYPE md:EntitiesDescriptor [<!ENTITY idp "https://idp.invalid">]>'
+        + aggregate(idp("&idp;")).split(b"?>", 1)[1]
+    )
+    with pytest.raises(EntitiesForbidden):
+        list(parse_metadata(metadata))
+
+
+@pytest.mark.usefixtures("good_time")
+def test_registry(cert: Certificate, cert2: Certificate) -> None:
+    registry = MetadataRegistry()
+    registry.load(
+        aggregate(
+            idp("https://one.invalid", key_descriptor(cert)),
+            idp(
+                "https://two.invalid",
+                key_descriptor(cert2),
+                valid_until="2020-01-01T00:00:00Z",
+            ),
+            sp("https://sp.invalid"),
+        )
+    )
+    assert len(registry) == 2
+    assert "https://one.invalid" in registry
+    assert "https://sp.invalid" not in registry
+    assert {entity.entity_id for entity in registry} == {
+        "https://one.invalid",
+        "https://two.invalid",
+    }
+    config, metadata = registry("https://one.invalid")
+    assert isinstance(metadata, EntityMetadata)
+    assert config.certificate is metadata.certificates
+    with pytest.raises(UnknownIssuer) as unknown:
+        registry("https://sp.invalid")
+    assert unknown.value.issuer == "https://sp.invalid"
+    with pytest.raises(MetadataExpired) as expired:
+        registry("https://two.invalid")
+    assert expired.value.valid_until == datetime.datetime(
+        2020, 1, 1, tzinfo=datetime.timezone.utc
+    )
+
+
+def test_registry_duplicate_entity_id(cert: Certificate) -> None:
+    registry = MetadataRegistry()
+    registry.load(aggregate(idp("https://one.invalid", key_descriptor(cert))))
+    with pytest.raises(MalformedMetadata):
+        registry.load(
+            aggregate(
+                idp("https://two.invalid", key_descriptor(cert)),
+                idp("https://two.invalid", key_descriptor(cert)),
+            )
+        )
+    # A failed load leaves the registry untouched.
+    assert list(registry) == [registry("https://one.invalid")[1]]
+
+
+def test_registry_incremental(cert: Certificate, cert2: Certificate) -> None:
+    built: list[str] = []
+
+    def config_factory(metadata: EntityMetadata) -> ValidationConfig:
+        built.append(metadata.entity_id)
+        return ValidationConfig(certificate=metadata.certificates)
+
+    registry = MetadataRegistry(config_factory=config_factory)
+    assert registry.load(
+        aggregate(
+            idp("https://one.invalid", key_descriptor(cert)),
+            idp("https://two.invalid", key_descriptor(cert)),
+            idp("https://three.invalid", key_descriptor(cert)),
+        ),
+        etag='"1"',
+    )
+    assert built == [
+        "https://one.invalid",
+        "https://two.invalid",
+        "https://three.invalid",
+    ]
+    one = registry("https://one.invalid")
+    two = registry("https://two.invalid")
+    built.clear()
+    # Same ETag, nothing to do.
+    assert not registry.load(b"not even XML", etag='"1"')
+    assert registry.load(
+        aggregate(
+            idp("https://one.invalid", key_descriptor(cert)),
+            idp("https://two.invalid", key_descriptor(cert2)),
+            idp("https://four.invalid", key_descriptor(cert)),
+        ),
+        etag='"2"',
+    )
+    assert registry.etag == '"2"'
+    assert built == ["https://two.invalid", "https://four.invalid"]
+    assert registry("https://one.invalid") is one
+    assert registry("https://two.invalid") is not two
+    assert set(registry("https://two.invalid")[1].certificates) == {cert2}
+    assert "https://three.invalid" not in registry
+    built.clear()
+    # Whitespace between entities is not part of them.
+    assert registry.load(
+        aggregate(
+            idp("https://one.invalid", key_descriptor(cert)),
+            "\n",
+            idp("https://two.invalid", key_descriptor(cert2)),
+            "\n",
+            idp("https://four.invalid", key_descriptor(cert)),
+        ),
+        etag='"3"',
+    )
+    assert built == []
+    assert registry("https://one.invalid") is one
+
+
+def test_registry_refresh(
+    tmp_path: Path, cert: Certificate, cert2: Certificate
+) -> None:
+    path = tmp_path / "metadata.xml"
+    path.write_bytes(aggregate(idp("https://one.invalid", key_descriptor(cert))))
+    registry = MetadataRegistry(path)
+    assert set(registry("https://one.invalid")[1].certificates) == {cert}
+    assert not registry.refresh()
+    path.write_bytes(aggregate(idp("https://one.invalid", key_descriptor(cert2))))
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert registry.refresh()
+    assert set(registry("https://one.invalid")[1].certificates) == {cert2}
+    with pytest.raises(ValueError):
+        MetadataRegistry().refresh()
+
+
+def test_registry_get_config_for_issuer(
+    response_xml_b64: bytes, cert: Certificate, time_machine: TimeMachineFixture
+) -> None:
+    registry = MetadataRegistry()
+    registry.load(
+        aggregate(
+            idp(
+                "https://idp.invalid",
+                key_descriptor(cert),
+                valid_until="2020-01-17T00:00:00Z",
+            )
+        )
+    )
+    time_machine.move_to(
+        datetime.datetime(2020, 1, 16, 14, 32, 32, tzinfo=datetime.timezone.utc)
+    )
+    response, metadata = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=registry,
+        expected_audience="https://sp.invalid",
+    )
+    assert response.attrs == {"attr name": "attr value"}
+    assert metadata.single_sign_on_url == "https://idp.invalid/sso"
+    time_machine.move_to(
+        datetime.datetime(2020, 1, 17, 0, 0, 0, tzinfo=datetime.timezone.utc)
+    )
+    with pytest.raises(MetadataExpired):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=registry,
+            expected_audience="https://sp.invalid",
+        )
@@ -0,0 +1,188 @@
+import datetime
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from cryptography.x509 import Certificate
+from time_machine import TimeMachineFixture
+
+from minisaml.errors import ReplayCacheFull, ReplayDetected, UnsolicitedResponse
+from minisaml.replay import (
+    MemoryReplayCache,
+    ReplayCacheBackend,
+    ReplayProtection,
+    SQLiteReplayCache,
+)
+from minisaml.request import get_request_redirect_url
+from minisaml.response import ValidationConfig, validate_multi_tenant_response
+
+NOW = datetime.datetime(2020, 1, 16, 14, 32, 32, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(
+    request: pytest.FixtureRequest, tmp_path: Path
+) -> Iterator[ReplayCacheBackend]:
+    if request.param == "memory":
+        yield MemoryReplayCache()
+    else:
+        cache = SQLiteReplayCache(tmp_path / "replay.sqlite3", sweep_interval=1)
+        yield cache
+        cache.close()
+
+
+def test_backend_add_pop(
+    backend: ReplayCacheBackend, time_machine: TimeMachineFixture
+) -> None:
+    time_machine.move_to(NOW)
+    expires_at = NOW + datetime.timedelta(seconds=10)
+    assert backend.add("key", expires_at)
+    assert not backend.add("key", expires_at)
+    assert backend.pop("key")
+    assert not backend.pop("key")
+    assert backend.add("key", expires_at)
+
+
+def test_backend_expiry(
+    backend: ReplayCacheBackend, time_machine: TimeMachineFixture
+) -> None:
+    time_machine.move_to(NOW)
+    assert backend.add("key", NOW + datetime.timedelta(seconds=10))
+    time_machine.move_to(NOW + datetime.timedelta(seconds=10))
+    assert not backend.pop("key")
+    assert backend.add("key", NOW + datetime.timedelta(seconds=20))
+    assert not backend.add("key", NOW + datetime.timedelta(seconds=20))
+
+
+def test_memory_replay_cache_full(time_machine: TimeMachineFixture) -> None:
+    time_machine.move_to(NOW)
+    cache = MemoryReplayCache(max_size=2)
+    assert cache.add("a", NOW + datetime.timedelta(seconds=10))
+    assert cache.add("b", NOW + datetime.timedelta(seconds=20))
+    # Evicting a key which has not expired yet would allow replaying it.
+    with pytest.raises(ReplayCacheFull) as exc_info:
+        cache.add("c", NOW + datetime.timedelta(seconds=10))
+    assert exc_info.value.max_size == 2
+    assert not cache.add("a", NOW + datetime.timedelta(seconds=10))
+    assert len(cache) == 2
+    time_machine.move_to(NOW + datetime.timedelta(seconds=10))
+    assert cache.add("c", NOW + datetime.timedelta(seconds=30))
+    assert not cache.add("b", NOW + datetime.timedelta(seconds=30))
+
+
+def test_replay_protection_cache_full(time_machine: TimeMachineFixture) -> None:
+    time_machine.move_to(NOW)
+    protection = ReplayProtection(MemoryReplayCache(max_size=1))
+    expires_at = NOW + datetime.timedelta(minutes=5)
+    protection.check(assertion_id="first", in_response_to=None, expires_at=expires_at)
+    with pytest.raises(ReplayCacheFull):
+        protection.check(
+            assertion_id="second", in_response_to=None, expires_at=expires_at
+        )
+    with pytest.raises(ReplayDetected):
+        protection.check(
+            assertion_id="first", in_response_to=None, expires_at=expires_at
+        )
+
+
+def test_memory_replay_cache_evict_oldest(time_machine: TimeMachineFixture) -> None:
+    time_machine.move_to(NOW)
+    cache = MemoryReplayCache(max_size=2, evict_oldest=True)
+    assert cache.add("a", NOW + datetime.timedelta(seconds=10))
+    assert cache.add("b", NOW + datetime.timedelta(seconds=20))
+    assert cache.pop("a")
+    assert cache.add("a", NOW + datetime.timedelta(seconds=30))
+    assert cache.add("c", NOW + datetime.timedelta(seconds=40))
+    assert len(cache) == 2
+    assert not cache.pop("b")
+    assert cache.pop("a")
+    assert cache.pop("c")
+
+
+def test_replay_protection_requests_do_not_fill_backend(
+    time_machine: TimeMachineFixture,
+) -> None:
+    time_machine.move_to(NOW)
+    protection = ReplayProtection(
+        MemoryReplayCache(max_size=2), check_in_response_to=True
+    )
+    expires_at = NOW + datetime.timedelta(minutes=5)
+    protection.register_request("legitimate")
+    for i in range(20_000):
+        protection.register_request(f"flood-{i}")
+    with pytest.raises(UnsolicitedResponse):
+        protection.check(
+            assertion_id="first", in_response_to="legitimate", expires_at=expires_at
+        )
+    protection.register_request("legitimate")
+    protection.check(
+        assertion_id="second", in_response_to="legitimate", expires_at=expires_at
+    )
+
+
+def test_replay_protection_shared_request_backend(tmp_path: Path) -> None:
+    backend = SQLiteReplayCache(tmp_path / "replay.sqlite3")
+    try:
+        assert ReplayProtection(backend).request_backend is backend
+    finally:
+        backend.close()
+
+
+def test_memory_replay_cache_sweep(time_machine: TimeMachineFixture) -> None:
+    time_machine.move_to(NOW)
+    cache = MemoryReplayCache()
+    for i in range(1000):
+        cache.add(str(i), NOW + datetime.timedelta(seconds=i % 10 + 1))
+    time_machine.move_to(NOW + datetime.timedelta(seconds=5))
+    cache.add("new", NOW + datetime.timedelta(seconds=60))
+    assert len(cache) == 501
+
+
+@pytest.mark.usefixtures("good_time")
+def test_replay_detected(response_xml_b64: bytes, cert: Certificate) -> None:
+    config = ValidationConfig(certificate=cert, replay_protection=ReplayProtection())
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (config, None),
+        expected_audience="https://sp.invalid",
+    )
+    assert response.assertion_id == "R6b0bizWeNOLGCqJXNXbpO3lA54TatP6QEudV0HzyOk"
+    with pytest.raises(ReplayDetected):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=lambda issuer: (config, None),
+            expected_audience="https://sp.invalid",
+        )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_in_response_to(response_xml_b64: bytes, cert: Certificate) -> None:
+    replay_protection = ReplayProtection(check_in_response_to=True)
+    config = ValidationConfig(certificate=cert, replay_protection=replay_protection)
+    get_request_redirect_url(
+        saml_endpoint="https://saml.invalid",
+        expected_audience="https://sp.invalid",
+        acs_url="https://acs.invalid",
+        request_id="8QmO2elg5T6-GPgr7dZI7v27M-wvMXc1k76B6jleNmM",
+        replay_protection=replay_protection,
+    )
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (config, None),
+        expected_audience="https://sp.invalid",
+    )
+    assert response.in_response_to == "8QmO2elg5T6-GPgr7dZI7v27M-wvMXc1k76B6jleNmM"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_unsolicited_response(response_xml_b64: bytes, cert: Certificate) -> None:
+    config = ValidationConfig(
+        certificate=cert,
+        replay_protection=ReplayProtection(check_in_response_to=True),
+    )
+    with pytest.raises(UnsolicitedResponse):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=lambda issuer: (config, None),
+            expected_audience="https://sp.invalid",
+        )
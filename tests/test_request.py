@@ -1,9 +1,22 @@
+import base64
 import datetime
+import zlib
+from urllib.parse import unquote
 
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey, RSAPublicKey
+from cryptography.hazmat.primitives.serialization import (
+    BestAvailableEncryption,
+    Encoding,
+    PrivateFormat,
+)
 from time_machine import TimeMachineFixture
 from yarl import URL
 
-from minisaml.request import get_request_redirect_url
+from minisaml.request import AuthnRequestBuilder, get_request_redirect_url
+from minisaml.signing import RedirectSigner
 
 
 def test_base64_encoding(time_machine: TimeMachineFixture) -> None:
@@ -44,3 +57,147 @@ def test_endpoint_url_merge() -> None:
 
     assert "idpid" in query
     assert "SAMLRequest" in query
+
+
+@pytest.mark.parametrize(
+    "saml_endpoint", ["https://saml.invalid", "https://saml.invalid/sso?idpid=abcdef"]
+)
+@pytest.mark.parametrize("force_reauthentication", [True, False])
+@pytest.mark.parametrize(
+    "request_id", ["テスト", "id-1", 'needs "escaping" & <more>', "tab\there"]
+)
+@pytest.mark.parametrize("relay_state", [None, "/next?a=b&c=d"])
+def test_authn_request_builder(
+    time_machine: TimeMachineFixture,
+    saml_endpoint: str,
+    force_reauthentication: bool,
+    request_id: str,
+    relay_state: str | None,
+) -> None:
+    time_machine.move_to(
+        datetime.datetime(2020, 9, 14, 14, 20, 11, tzinfo=datetime.timezone.utc),
+        tick=False,
+    )
+    builder = AuthnRequestBuilder(
+        saml_endpoint=saml_endpoint,
+        expected_audience="https://sp.invalid/?a=b&c=d",
+        acs_url="https://acs.invalid",
+        force_reauthentication=force_reauthentication,
+    )
+    assert builder.get_redirect_url(
+        request_id=request_id, relay_state=relay_state
+    ) == get_request_redirect_url(
+        saml_endpoint=saml_endpoint,
+        expected_audience="https://sp.invalid/?a=b&c=d",
+        acs_url="https://acs.invalid",
+        force_reauthentication=force_reauthentication,
+        request_id=request_id,
+        relay_state=relay_state,
+    )
+
+
+def test_authn_request_builder_invalid_request_id() -> None:
+    builder = AuthnRequestBuilder(
+        saml_endpoint="https://saml.invalid",
+        expected_audience="audience",
+        acs_url="https://acs.invalid",
+    )
+    with pytest.raises(ValueError):
+        builder.get_redirect_url(request_id="\x00")
+
+
+@pytest.fixture(scope="module")
+def sp_key() -> RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def verify_redirect_url(url: str, public_key: RSAPublicKey) -> None:
+    # The signature covers the raw query parameters in binding order.
+    raw_query = url.split("?", 1)[1]
+    params = dict(param.split("=", 1) for param in raw_query.split("&"))
+    signed = "&".join(
+        f"{name}={params[name]}"
+        for name in ("SAMLRequest", "RelayState", "SigAlg")
+        if name in params
+    )
+    assert unquote(params["SigAlg"]) in {
+        "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256",
+        "http://www.w3.org/2001/04/xmldsig-more#rsa-sha512",
+    }
+    hash_algorithm = (
+        hashes.SHA256()
+        if unquote(params["SigAlg"]).endswith("256")
+        else hashes.SHA512()
+    )
+    public_key.verify(
+        base64.b64decode(unquote(params["Signature"])),
+        signed.encode(),
+        padding.PKCS1v15(),
+        hash_algorithm,
+    )
+
+
+@pytest.mark.parametrize(
+    "saml_endpoint", ["https://saml.invalid", "https://saml.invalid/sso?idpid=abcdef"]
+)
+@pytest.mark.parametrize("relay_state", [None, "/next?a=b&c=d ü"])
+def test_signed_redirect_url(
+    sp_key: RSAPrivateKey, saml_endpoint: str, relay_state: str | None
+) -> None:
+    signer = RedirectSigner(sp_key)
+    url = get_request_redirect_url(
+        saml_endpoint=saml_endpoint,
+        expected_audience="audience",
+        acs_url="https://acs.invalid",
+        request_id="id-1",
+        relay_state=relay_state,
+        signer=signer,
+    )
+    verify_redirect_url(url, sp_key.public_key())
+    parsed = URL(url)
+    assert parsed.with_query(None) == URL(saml_endpoint).with_query(None)
+    assert parsed.query.get("RelayState") == relay_state
+    assert parsed.query["SigAlg"] == (
+        "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"
+    )
+    if "idpid" in saml_endpoint:
+        assert parsed.query["idpid"] == "abcdef"
+    request_xml = zlib.decompress(
+        base64.b64decode(parsed.query["SAMLRequest"]), -zlib.MAX_WBITS
+    )
+    assert b'ID="id-1"' in request_xml
+
+
+def test_signed_redirect_url_builder(sp_key: RSAPrivateKey) -> None:
+    signer = RedirectSigner(sp_key, signature_method=hashes.SHA512())
+    builder = AuthnRequestBuilder(
+        saml_endpoint="https://saml.invalid/sso?idpid=abcdef",
+        expected_audience="audience",
+        acs_url="https://acs.invalid",
+        signer=signer,
+    )
+    url = builder.get_redirect_url(request_id="id-1", relay_state="state")
+    verify_redirect_url(url, sp_key.public_key())
+    # PKCS#1 v1.5 signatures are deterministic.
+    assert url == get_request_redirect_url(
+        saml_endpoint="https://saml.invalid/sso?idpid=abcdef",
+        expected_audience="audience",
+        acs_url="https://acs.invalid",
+        request_id="id-1",
+        relay_state="state",
+        signer=signer,
+    )
+
+
+def test_redirect_signer_from_pem(sp_key: RSAPrivateKey) -> None:
+    pem = sp_key.private_bytes(
+        Encoding.PEM, PrivateFormat.PKCS8, BestAvailableEncryption(b"secret")
+    )
+    signer = RedirectSigner.from_pem(pem, b"secret")
+    assert signer.private_key.private_numbers() == sp_key.private_numbers()
+    assert signer.sig_alg == "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"
+
+
+def test_redirect_signer_unsupported_signature_method(sp_key: RSAPrivateKey) -> None:
+    with pytest.raises(ValueError):
+        RedirectSigner(sp_key, signature_method=hashes.MD5())
@@ -1,31 +1,72 @@
 import asyncio
+import base64
 import datetime
+import io
+import pickle
+import threading
+from collections.abc import AsyncIterator, Callable, Collection, Iterable
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.reduction import ForkingPickler
 from typing import Any
 
 import pytest
 from _pytest.monkeypatch import MonkeyPatch
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.x509 import Certificate
-from defusedxml.lxml import fromstring
+from defusedxml.lxml import EntitiesForbidden, fromstring
+from lxml.etree import _Element as Element
+from lxml.etree import tostring
 from minisignxml.config import VerifyConfig
-from minisignxml.errors import UnsupportedAlgorithm
+from minisignxml.errors import (
+    CertificateMismatch,
+    ElementNotFound,
+    MultipleElementsFound,
+    UnsupportedAlgorithm,
+    VerificationFailed,
+)
+from minisignxml.internal.utils import serialize_xml
+from minisignxml.sign import sign
 from time_machine import TimeMachineFixture
 
+import minisaml.response
+from minisaml.certificates import CertificateStore
 from minisaml.errors import (
     AudienceMismatch,
     IssuerMismatch,
+    MalformedSAMLResponse,
     ResponseExpired,
     ResponseTooEarly,
 )
+from minisaml.internal import paths, validation
+from minisaml.internal.namespaces import NAMESPACE_MAP
+from minisaml.internal.utils import CompiledPath, deserialize_xml, find_or_raise
+from minisaml.internal.verify import (
+    PreparedVerifyConfig,
+    extract_verified_element_and_certificate,
+)
 from minisaml.response import (
     Attribute,
+    PreparedValidator,
+    Response,
+    ResponseData,
+    ResponseLimits,
     TimeDriftLimits,
     ValidationConfig,
+    _LazyAttributes,
     gather_attributes,
     validate_multi_tenant_response,
+    validate_multi_tenant_response_async,
+    validate_multi_tenant_response_stream,
+    validate_multi_tenant_response_stream_async,
     validate_response,
+    validate_response_async,
+    validate_response_stream,
+    validate_response_stream_async,
+    validate_responses,
 )
 from tests.conftest import Read
+from tests.test_encryption import generate_key_and_certificate
 
 
 @pytest.mark.usefixtures("good_time")
@@ -232,7 +273,7 @@ async def test_multi_tenant_saml_response_async_cancelled(
         return fut
 
     monkeypatch.setattr(
-        "minisaml.response.asyncio.ensure_future", ensure_future_then_cancel
+        "minisaml.internal.validation.asyncio.ensure_future", ensure_future_then_cancel
     )
 
     with pytest.raises(asyncio.CancelledError):
@@ -243,6 +284,421 @@ async def test_multi_tenant_saml_response_async_cancelled(
         )
 
 
+@pytest.mark.usefixtures("good_time")
+def test_multi_tenant_saml_response_parses_once(
+    response_xml_b64: bytes, cert: Certificate, monkeypatch: MonkeyPatch
+) -> None:
+    calls: list[bytes] = []
+
+    def counting_deserialize_xml(xml: bytes) -> Any:
+        calls.append(xml)
+        return deserialize_xml(xml)
+
+    monkeypatch.setattr(
+        "minisaml.internal.validation.deserialize_xml", counting_deserialize_xml
+    )
+    monkeypatch.setattr(
+        "minisignxml.internal.utils.deserialize_xml", counting_deserialize_xml
+    )
+
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), None),
+        expected_audience="https://sp.invalid",
+    )
+    assert response.name_id == "user.name"
+    assert len(calls) == 1
+
+
+def test_deserialize_xml_drops_comments() -> None:
+    element = deserialize_xml(
+        b"<NameID>user@example.invalid<!-- -->.evil.invalid</NameID>"
+    )
+    assert element.text == "user@example.invalid.evil.invalid"
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self) -> None:
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(
+        self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any
+    ) -> Future[Any]:
+        self.submitted += 1
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_validate_response_async(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    with CountingExecutor() as executor:
+        response = await validate_response_async(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            executor=executor,
+            concurrency_limit=asyncio.Semaphore(1),
+        )
+    assert executor.submitted == 1
+    assert response.name_id == "user.name"
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_validate_response_async_error(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    with pytest.raises(AudienceMismatch):
+        await validate_response_async(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other.sp.invalid",
+            idp_issuer="https://idp.invalid",
+        )
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("is_async", [True, False])
+async def test_validate_multi_tenant_response_async(
+    response_xml_b64: bytes, cert: Certificate, is_async: bool
+) -> None:
+    state = object()
+
+    def sync_get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, Any]:
+        assert issuer == "https://idp.invalid"
+        return ValidationConfig(certificate=cert), state
+
+    async def async_get_config_for_issuer(
+        issuer: str,
+    ) -> tuple[ValidationConfig, Any]:
+        return sync_get_config_for_issuer(issuer)
+
+    semaphore = asyncio.Semaphore(1)
+    with CountingExecutor() as executor:
+        response, received_state = await validate_multi_tenant_response_async(
+            data=response_xml_b64,
+            get_config_for_issuer=async_get_config_for_issuer
+            if is_async
+            else sync_get_config_for_issuer,
+            expected_audience="https://sp.invalid",
+            executor=executor,
+            concurrency_limit=semaphore,
+        )
+    assert executor.submitted == 2
+    assert not semaphore.locked()
+    assert received_state is state
+    assert response.name_id == "user.name"
+    assert response.issuer == "https://idp.invalid"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_pickle(response_xml_b64: bytes, cert: Certificate) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert pickle.loads(pickle.dumps(response)) == response
+
+
+@pytest.mark.usefixtures("good_time", "null_extract")
+def test_response_attributes_tail(response_xml_b64: bytes, cert: Certificate) -> None:
+    tree = deserialize_xml(base64.b64decode(response_xml_b64))
+    attribute_statement = paths.ATTRIBUTE_STATEMENT.find_one(
+        paths.ASSERTION.find_one(tree)
+    )
+    attribute_statement.tail = "text after the AttributeStatement"
+    response = validate_response(
+        data=base64.b64encode(tostring(tree)),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert pickle.loads(pickle.dumps(response)).attrs == {"attr name": "attr value"}
+    assert response.attrs == {"attr name": "attr value"}
+
+
+def test_error_pickle() -> None:
+    error = AudienceMismatch(received_audience="a", expected_audience="b")
+    assert pickle.loads(pickle.dumps(error)) == error
+
+
+@pytest.mark.usefixtures("good_time")
+def test_prepared_validator(response_xml_b64: bytes, cert: Certificate) -> None:
+    validator = PreparedValidator(
+        ValidationConfig(certificate=[cert], attribute_names=["attr name"]),
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    response = validator.validate(response_xml_b64)
+    assert response == validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert response.attrs == {"attr name": "attr value"}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(validator.validate, [response_xml_b64] * 16))
+    assert results == [response] * 16
+
+
+@pytest.mark.usefixtures("good_time")
+def test_prepared_validator_errors(response_xml_b64: bytes, cert: Certificate) -> None:
+    with pytest.raises(AudienceMismatch):
+        PreparedValidator(
+            ValidationConfig(certificate=cert),
+            expected_audience="https://other.sp.invalid",
+            idp_issuer="https://idp.invalid",
+        ).validate(response_xml_b64)
+    with pytest.raises(UnsupportedAlgorithm):
+        PreparedValidator(
+            ValidationConfig(
+                certificate=cert,
+                signature_verification_config=VerifyConfig(
+                    allowed_digest_method={hashes.SHA1},
+                    allowed_signature_method={hashes.SHA1},
+                ),
+            ),
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+        ).validate(response_xml_b64)
+
+
+@pytest.mark.usefixtures("good_time")
+def test_multi_tenant_config_prepared_once(
+    response_xml_b64: bytes, cert: Certificate, monkeypatch: MonkeyPatch
+) -> None:
+    config = ValidationConfig(certificate=[cert])
+    stores = []
+    configs = []
+
+    def recording_extract(
+        *, tree: Element, certificates: CertificateStore, config: VerifyConfig
+    ) -> tuple[Element, Certificate]:
+        stores.append(certificates)
+        configs.append(config)
+        return extract_verified_element_and_certificate(
+            tree=tree, certificates=certificates, config=config
+        )
+
+    monkeypatch.setattr(
+        "minisaml.internal.validation.extract_verified_element_and_certificate",
+        recording_extract,
+    )
+    for _ in range(2):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=lambda issuer: (config, None),
+            expected_audience="https://sp.invalid",
+        )
+    validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert stores[0] is stores[1]
+    assert configs[0] is configs[1]
+    assert all(isinstance(config, PreparedVerifyConfig) for config in configs)
+
+
+def test_prepared_verify_config() -> None:
+    config = PreparedVerifyConfig.of(
+        VerifyConfig(
+            allowed_signature_method=[hashes.SHA1, hashes.SHA256],
+            allowed_digest_method={hashes.SHA256},
+        )
+    )
+    assert PreparedVerifyConfig.of(config) is config
+    assert set(config.signature_methods) == {
+        "http://www.w3.org/2000/09/xmldsig#rsa-sha1",
+        "http://www.w3.org/2001/04/xmldsig-more#rsa-sha256",
+    }
+    assert set(config.digest_methods) == {"http://www.w3.org/2001/04/xmlenc#sha256"}
+    assert config.allowed_digest_method == {hashes.SHA256}
+
+
+@pytest.mark.usefixtures("good_time")
+def test_validate_responses_thread_pool(
+    response_xml_b64: bytes, azure_ad_unsigned_b64: bytes, cert: Certificate
+) -> None:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = validate_responses(
+            [
+                response_xml_b64,
+                azure_ad_unsigned_b64,
+                base64.b64encode(b"not xml"),
+                response_xml_b64.decode(),
+            ],
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            executor=executor,
+            chunk_size=1,
+        )
+    assert len(results) == 4
+    assert isinstance(results[0], Response)
+    assert results[0].certificate == cert
+    assert isinstance(results[1], ElementNotFound)
+    assert isinstance(results[2], MalformedSAMLResponse)
+    assert results[3] == results[0]
+    # Sending results between processes does not change how multiprocessing
+    # pickles certificates in general.
+    with pytest.raises(TypeError):
+        ForkingPickler.dumps(cert)
+
+
+def test_validate_responses_process_pool(
+    response_xml_b64: bytes, azure_ad_unsigned_b64: bytes, cert: Certificate
+) -> None:
+    results = validate_responses(
+        [
+            response_xml_b64,
+            azure_ad_unsigned_b64,
+            base64.b64encode(b"not xml"),
+            response_xml_b64,
+        ],
+        certificate=cert,
+        expected_audience="https://other.sp.invalid",
+        idp_issuer="https://idp.invalid",
+        # worker processes do not see the time_machine fixtures
+        allowed_time_drift=TimeDriftLimits(
+            not_before_max_drift=datetime.timedelta(),
+            not_on_or_after_max_drift=datetime.timedelta(days=365 * 1000),
+        ),
+        max_workers=2,
+        chunk_size=2,
+    )
+    assert [type(result) for result in results] == [
+        AudienceMismatch,
+        ElementNotFound,
+        MalformedSAMLResponse,
+        AudienceMismatch,
+    ]
+
+
+def test_validate_responses_process_pool_certificate_mismatch(
+    response_xml_b64: bytes, cert: Certificate, cert2: Certificate
+) -> None:
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        results = validate_responses(
+            [response_xml_b64, base64.b64encode(b"not xml"), response_xml_b64],
+            certificate=cert2,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            executor=executor,
+            chunk_size=1,
+        )
+    assert [type(result) for result in results] == [
+        CertificateMismatch,
+        MalformedSAMLResponse,
+        CertificateMismatch,
+    ]
+    assert isinstance(results[0], CertificateMismatch)
+    assert results[0].received_certificate == cert
+    assert set(results[0].expected_certificates) == {cert2}
+
+
+@pytest.mark.usefixtures("good_time", "null_extract")
+def test_validate_responses_malformed_item(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    def with_conditions(**attributes: str | None) -> bytes:
+        tree = deserialize_xml(base64.b64decode(response_xml_b64))
+        conditions = paths.CONDITIONS.find_one(paths.ASSERTION.find_one(tree))
+        for name, value in attributes.items():
+            if value is None:
+                del conditions.attrib[name]
+            else:
+                conditions.set(name, value)
+        return base64.b64encode(tostring(tree))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = validate_responses(
+            [
+                response_xml_b64,
+                with_conditions(NotBefore=None),
+                with_conditions(NotOnOrAfter="tomorrow"),
+                response_xml_b64,
+            ],
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            executor=executor,
+            chunk_size=4,
+        )
+    assert [type(result) for result in results] == [
+        Response,
+        MalformedSAMLResponse,
+        MalformedSAMLResponse,
+        Response,
+    ]
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("uri", ["", "#", "assertion"])
+def test_saml_response_unsupported_reference_uri(
+    response_xml_b64: bytes, uri: str
+) -> None:
+    key, certificate = generate_key_and_certificate()
+    unsigned = deserialize_xml(base64.b64decode(response_xml_b64))
+    for signature in unsigned.findall(".//ds:Signature", NAMESPACE_MAP):
+        signature.getparent().remove(signature)
+    tree = deserialize_xml(
+        sign(element=unsigned, private_key=key, certificate=certificate)
+    )
+    signature = find_or_raise(tree, "./ds:Signature")
+    signed_info = find_or_raise(signature, "./ds:SignedInfo")
+    find_or_raise(signed_info, "./ds:Reference").set("URI", uri)
+    find_or_raise(signature, "./ds:SignatureValue").text = base64.b64encode(
+        key.sign(serialize_xml(signed_info), padding.PKCS1v15(), hashes.SHA256())
+    ).decode()
+    with pytest.raises(MalformedSAMLResponse):
+        validate_response(
+            data=base64.b64encode(tostring(tree)),
+            certificate=certificate,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+        )
+
+
+@pytest.mark.parametrize(
+    "path",
+    [value for value in vars(paths).values() if isinstance(value, CompiledPath)],
+)
+@pytest.mark.parametrize(
+    "xml,error",
+    [
+        (b"<root/>", ElementNotFound),
+        (b"<root {namespaces}>{elements}{elements}</root>", MultipleElementsFound),
+    ],
+)
+def test_compiled_path_errors(
+    path: CompiledPath, xml: bytes, error: type[Exception]
+) -> None:
+    steps = path.path.removeprefix("./").split("/")
+    elements = "".join(f"<{step}>" for step in steps) + "".join(
+        f"</{step}>" for step in reversed(steps)
+    )
+    namespaces = " ".join(
+        f'xmlns:{prefix}="{uri}"' for prefix, uri in NAMESPACE_MAP.items()
+    )
+    element = deserialize_xml(
+        xml.replace(b"{namespaces}", namespaces.encode()).replace(
+            b"{elements}", elements.encode()
+        )
+    )
+    with pytest.raises(error) as expected:
+        find_or_raise(element, path.path)
+    with pytest.raises(error) as compiled:
+        path.find_one(element)
+    assert compiled.value.args == expected.value.args
+
+
 @pytest.mark.usefixtures("null_extract")
 def test_azure_ad_response_parsing(
     azure_ad_unsigned_b64: bytes, time_machine: TimeMachineFixture, cert: Certificate
@@ -529,3 +985,602 @@ def test_attributes(
     result = list(gather_attributes(tree))
     assert result == attributes
     assert [attribute.value for attribute in result] == values
+
+
+def test_gather_attributes_allowlist(read: Read) -> None:
+    tree = fromstring(read("attrs/aad2.xml"))
+    result = list(gather_attributes(tree, attribute_names={"sn", "mail", "unknown"}))
+    assert [attribute.name for attribute in result] == ["sn", "mail"]
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_attributes_lazy(
+    response_xml_b64: bytes, cert: Certificate, monkeypatch: MonkeyPatch
+) -> None:
+    calls = []
+    original = minisaml.response.gather_attributes
+
+    def counting_gather_attributes(
+        attribute_statement: Element, *, attribute_names: Collection[str] | None
+    ) -> Iterable[Attribute]:
+        calls.append(attribute_names)
+        return original(attribute_statement, attribute_names=attribute_names)
+
+    monkeypatch.setattr(
+        "minisaml.response.gather_attributes", counting_gather_attributes
+    )
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert calls == []
+    # Only the serialized AttributeStatement is kept, not the document.
+    assert isinstance(response.attributes, _LazyAttributes)
+    statement = response.attributes._attribute_statement
+    assert isinstance(statement, bytes)
+    assert statement.startswith(b"<saml:AttributeStatement ")
+    assert response.attrs == {"attr name": "attr value"}
+    assert response.attrs is response.attrs
+    assert response.attributes == [
+        Attribute(
+            name="attr name",
+            values=["attr value"],
+            format="urn:oasis:names:tc:SAML:2.0:attrname-format:basic",
+            extra_attributes={"ExtraAttribute": "hoge"},
+        )
+    ]
+    assert len(response.attributes) == 1
+    assert calls == [None]
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize(
+    "attribute_names,attrs",
+    [({"attr name"}, {"attr name": "attr value"}), (set(), {})],
+)
+def test_response_attribute_names(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    attribute_names: set[str],
+    attrs: dict[str, str],
+) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        attribute_names=attribute_names,
+    )
+    assert response.attrs == attrs
+    # Gathered right away, nothing of the document is kept.
+    assert type(response.attributes) is list
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (
+            ValidationConfig(certificate=cert, attribute_names=attribute_names),
+            None,
+        ),
+        expected_audience="https://sp.invalid",
+    )
+    assert response.attrs == attrs
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_slots(response_xml_b64: bytes, cert: Certificate, read: Read) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert not hasattr(response, "__dict__")
+    assert not hasattr(response.attributes[0], "__dict__")
+    attributes = list(gather_attributes(fromstring(read("attrs/multi.xml"))))
+    assert attributes[0].extra_attributes is attributes[1].extra_attributes
+    assert attributes[0].extra_attributes == {}
+    assert pickle.loads(pickle.dumps(attributes)) == attributes
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000, 64 * 1024])
+def test_validate_response_stream(
+    response_xml_b64: bytes, cert: Certificate, chunk_size: int
+) -> None:
+    expected = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    response = validate_response_stream(
+        stream=io.BytesIO(response_xml_b64),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        chunk_size=chunk_size,
+    )
+    assert response == expected
+    chunks = [
+        response_xml_b64[i : i + chunk_size]
+        for i in range(0, len(response_xml_b64), chunk_size)
+    ]
+    response, state = validate_multi_tenant_response_stream(
+        stream=iter(chunks),
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), 1),
+        expected_audience="https://sp.invalid",
+    )
+    assert response == expected
+    assert state == 1
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_validate_response_stream_async(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    async def body() -> AsyncIterator[bytes]:
+        for i in range(0, len(response_xml_b64), 100):
+            yield response_xml_b64[i : i + 100]
+
+    async def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, int]:
+        return ValidationConfig(certificate=cert), 1
+
+    response = await validate_response_stream_async(
+        stream=body(),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    assert response.name_id == "user.name"
+    response, state = await validate_multi_tenant_response_stream_async(
+        stream=body(),
+        get_config_for_issuer=get_config_for_issuer,
+        expected_audience="https://sp.invalid",
+    )
+    assert response.name_id == "user.name"
+    assert state == 1
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_validate_response_stream_async_off_event_loop(
+    response_xml_b64: bytes, cert: Certificate, monkeypatch: MonkeyPatch
+) -> None:
+    threads = set()
+    decode = validation._ResponseStreamParser._decode
+
+    def recording_decode(self: validation._ResponseStreamParser, chunk: bytes) -> None:
+        threads.add(threading.get_ident())
+        decode(self, chunk)
+
+    monkeypatch.setattr(validation._ResponseStreamParser, "_decode", recording_decode)
+
+    async def body() -> AsyncIterator[bytes]:
+        for i in range(0, len(response_xml_b64), 100):
+            yield response_xml_b64[i : i + 100]
+
+    async def invalid_body() -> AsyncIterator[bytes]:
+        yield response_xml_b64[:100]
+        yield b"%2B%2F%3D"
+        yield response_xml_b64[100:]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        response = await validate_response_stream_async(
+            stream=body(),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            executor=executor,
+        )
+        assert response.name_id == "user.name"
+        with pytest.raises(MalformedSAMLResponse):
+            await validate_response_stream_async(
+                stream=invalid_body(),
+                certificate=cert,
+                expected_audience="https://sp.invalid",
+                idp_issuer="https://idp.invalid",
+                executor=executor,
+            )
+    assert threads
+    assert threading.get_ident() not in threads
+
+
+def test_validate_response_stream_rejects_entities(cert: Certificate) -> None:
+    xml = b'<!DOCTYPE x [<!ENTITY e "e">]><x>&e;</x>'
+    with pytest.raises(EntitiesForbidden):
+        validate_response_stream(
+            stream=io.BytesIO(base64.b64encode(xml)),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+        )
+
+
+@pytest.fixture
+def failing_extract(monkeypatch: MonkeyPatch) -> None:
+    def failing_extract(**kwargs: Any) -> tuple[Element, Certificate]:
+        raise AssertionError("signature verified")
+
+    monkeypatch.setattr(
+        "minisaml.internal.validation.extract_verified_element_and_certificate",
+        failing_extract,
+    )
+
+
+@pytest.mark.usefixtures("too_late", "failing_extract")
+def test_prefilter_expired(response_xml_b64: bytes, cert: Certificate) -> None:
+    with pytest.raises(ResponseExpired):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=True,
+        )
+
+
+@pytest.mark.usefixtures("too_early", "failing_extract")
+def test_prefilter_too_early(response_xml_b64: bytes, cert: Certificate) -> None:
+    with pytest.raises(ResponseTooEarly):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=True,
+        )
+
+
+@pytest.mark.usefixtures("good_time", "failing_extract")
+def test_prefilter_audience_mismatch(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    with pytest.raises(AudienceMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other-sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=True,
+        )
+
+
+@pytest.mark.usefixtures("good_time", "failing_extract")
+def test_prefilter_issuer_mismatch(response_xml_b64: bytes, cert: Certificate) -> None:
+    with pytest.raises(IssuerMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://other-idp.invalid",
+            prefilter=True,
+        )
+
+
+@pytest.mark.usefixtures("too_late", "failing_extract")
+def test_prefilter_multi_tenant(response_xml_b64: bytes, cert: Certificate) -> None:
+    def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, None]:
+        return ValidationConfig(certificate=cert, prefilter=True), None
+
+    with pytest.raises(ResponseExpired):
+        validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience="https://sp.invalid",
+        )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_prefilter_ok(response_xml_b64: bytes, cert: Certificate) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        prefilter=True,
+    )
+    assert response.name_id == "user.name"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_prefilter_decides_on_verified_element(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    # The unsigned copy passes the prefilter but the signature does not verify.
+    tree = deserialize_xml(base64.b64decode(response_xml_b64))
+    paths.AUDIENCE.find_one(
+        paths.CONDITIONS.find_one(paths.ASSERTION.find_one(tree))
+    ).text = "https://other-sp.invalid"
+    with pytest.raises(VerificationFailed):
+        validate_response(
+            data=base64.b64encode(tostring(tree)),
+            certificate=cert,
+            expected_audience="https://other-sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=True,
+        )
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("prefilter", [False, True])
+@pytest.mark.parametrize(
+    "not_before", ["0001-01-01T00:00:00+00:01", "2020-01-16T14:32:32+99:99", "junk"]
+)
+def test_prefilter_invalid_timestamp(
+    response_xml_b64: bytes, cert: Certificate, prefilter: bool, not_before: str
+) -> None:
+    # The tampered, no longer verifiable response is rejected the same way with
+    # and without the prefilter.
+    tree = deserialize_xml(base64.b64decode(response_xml_b64))
+    paths.CONDITIONS.find_one(paths.ASSERTION.find_one(tree)).set(
+        "NotBefore", not_before
+    )
+    with pytest.raises(VerificationFailed):
+        validate_response(
+            data=base64.b64encode(tostring(tree)),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=prefilter,
+        )
+
+
+@pytest.mark.usefixtures("good_time", "failing_extract")
+def test_prefilter_skips_missing_elements(cert: Certificate) -> None:
+    xml = b'<samlp:Response xmlns:samlp="urn:oasis:names:tc:SAML:2.0:protocol"/>'
+    with pytest.raises(AssertionError, match="signature verified"):
+        validate_response(
+            data=base64.b64encode(xml),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            prefilter=True,
+        )
+
+
+class SuffixMatcher:
+    def __init__(self, suffix: str) -> None:
+        self.suffix = suffix
+
+    def __contains__(self, audience: object) -> bool:
+        return isinstance(audience, str) and audience.endswith(self.suffix)
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize(
+    "expected_audience",
+    [
+        frozenset({"https://other-sp.invalid", "https://sp.invalid"}),
+        ["https://sp.invalid"],
+        SuffixMatcher("sp.invalid"),
+    ],
+)
+@pytest.mark.parametrize("prefilter", [False, True])
+def test_expected_audience_container(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    expected_audience: Collection[str],
+    prefilter: bool,
+) -> None:
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience=expected_audience,
+        idp_issuer="https://idp.invalid",
+        prefilter=prefilter,
+    )
+    assert response.audience == "https://sp.invalid"
+    validator = PreparedValidator(
+        ValidationConfig(certificate=cert, prefilter=prefilter),
+        expected_audience=expected_audience,
+        idp_issuer="https://idp.invalid",
+    )
+    assert validator.validate(response_xml_b64) == response
+    multi_tenant_response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (
+            ValidationConfig(certificate=cert, prefilter=prefilter),
+            None,
+        ),
+        expected_audience=expected_audience,
+    )
+    assert multi_tenant_response == response
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("prefilter", [False, True])
+def test_expected_audience_container_mismatch(
+    response_xml_b64: bytes, cert: Certificate, prefilter: bool
+) -> None:
+    expected_audience = frozenset({"https://other-sp.invalid", "sp.invalid"})
+    with pytest.raises(AudienceMismatch) as exc_info:
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience=expected_audience,
+            idp_issuer="https://idp.invalid",
+            prefilter=prefilter,
+        )
+    assert exc_info.value.received_audience == "https://sp.invalid"
+    assert exc_info.value.expected_audience is expected_audience
+    # A single audience is never matched as a substring.
+    with pytest.raises(AudienceMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid/",
+            idp_issuer="https://idp.invalid",
+            prefilter=prefilter,
+        )
+
+
+def with_audience_restrictions(data: bytes, restrictions: list[list[str]]) -> bytes:
+    tree = deserialize_xml(base64.b64decode(data))
+    conditions = paths.CONDITIONS.find_one(paths.ASSERTION.find_one(tree))
+    for restriction in conditions.xpath(
+        "./saml:AudienceRestriction", namespaces=NAMESPACE_MAP
+    ):
+        conditions.remove(restriction)
+    for audiences in restrictions:
+        restriction = conditions.makeelement(
+            f"{{{NAMESPACE_MAP['saml']}}}AudienceRestriction"
+        )
+        for audience in audiences:
+            element = restriction.makeelement(f"{{{NAMESPACE_MAP['saml']}}}Audience")
+            element.text = audience
+            restriction.append(element)
+        conditions.append(restriction)
+    return base64.b64encode(tostring(tree))
+
+
+@pytest.mark.usefixtures("good_time", "null_extract")
+@pytest.mark.parametrize("prefilter", [False, True])
+@pytest.mark.parametrize(
+    "restrictions,expected_audience,result",
+    [
+        # Any audience of a restriction may match.
+        (
+            [["https://a.invalid", "https://b.invalid"]],
+            "https://b.invalid",
+            "https://b.invalid",
+        ),
+        # The first accepted audience is returned.
+        (
+            [["https://a.invalid", "https://b.invalid", "https://c.invalid"]],
+            frozenset({"https://c.invalid", "https://b.invalid"}),
+            "https://b.invalid",
+        ),
+        # Every restriction has to match.
+        (
+            [["https://a.invalid"], ["https://b.invalid", "https://a.invalid"]],
+            "https://a.invalid",
+            "https://a.invalid",
+        ),
+        (
+            [["https://a.invalid"], ["https://b.invalid"]],
+            frozenset({"https://a.invalid", "https://b.invalid"}),
+            "https://a.invalid",
+        ),
+        (
+            [["https://a.invalid"], ["https://b.invalid"]],
+            "https://a.invalid",
+            AudienceMismatch,
+        ),
+        (
+            [["https://a.invalid", "https://b.invalid"], ["https://c.invalid"]],
+            frozenset({"https://a.invalid", "https://b.invalid"}),
+            AudienceMismatch,
+        ),
+        ([], "https://a.invalid", ElementNotFound),
+    ],
+)
+def test_multiple_audience_restrictions(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    restrictions: list[list[str]],
+    expected_audience: str | frozenset[str],
+    result: str | type[Exception],
+    prefilter: bool,
+) -> None:
+    data = with_audience_restrictions(response_xml_b64, restrictions)
+    if isinstance(result, str):
+        response = validate_response(
+            data=data,
+            certificate=cert,
+            expected_audience=expected_audience,
+            idp_issuer="https://idp.invalid",
+            prefilter=prefilter,
+        )
+        assert response.audience == result
+    else:
+        with pytest.raises(result):
+            validate_response(
+                data=data,
+                certificate=cert,
+                expected_audience=expected_audience,
+                idp_issuer="https://idp.invalid",
+                prefilter=prefilter,
+            )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_validate_response_data_types(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    expected = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    wrapped = b"\r\n".join(
+        response_xml_b64[i : i + 76] for i in range(0, len(response_xml_b64), 76)
+    )
+    values: list[ResponseData] = [
+        response_xml_b64.decode("ascii"),
+        bytearray(response_xml_b64),
+        memoryview(response_xml_b64),
+        wrapped,
+        wrapped.decode("ascii"),
+        memoryview(wrapped),
+    ]
+    for data in values:
+        response = validate_response(
+            data=data,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            limits=ResponseLimits(),
+        )
+        assert response == expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"PHNhbWxwOlJlc3BvbnNlLz4=!",
+        b"PHNhbWxwOlJlc3BvbnNlLz4=PHNh",
+        "PHNhbWxwOlJlc3BvbnNlLz4é",
+        b"PHNhbWxwOlJlc3BvbnNlLz4",
+    ],
+)
+def test_validate_response_invalid_base64(data: bytes | str, cert: Certificate) -> None:
+    with pytest.raises(MalformedSAMLResponse):
+        validate_response(
+            data=data,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+        )
+    if isinstance(data, bytes):
+        with pytest.raises(MalformedSAMLResponse):
+            validate_response_stream(
+                stream=iter([data[:10], data[10:]]),
+                certificate=cert,
+                expected_audience="https://sp.invalid",
+                idp_issuer="https://idp.invalid",
+            )
+
+
+@pytest.mark.parametrize("xml", [b"not xml", b"<samlp:Response", b"<a></b>"])
+@pytest.mark.parametrize("limits", [None, ResponseLimits()])
+def test_validate_response_not_xml(
+    xml: bytes, limits: ResponseLimits | None, cert: Certificate
+) -> None:
+    data = base64.b64encode(xml)
+    with pytest.raises(MalformedSAMLResponse):
+        validate_response(
+            data=data,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            limits=limits,
+        )
+    with pytest.raises(MalformedSAMLResponse):
+        validate_response_stream(
+            stream=iter([data[:4], data[4:]]),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            limits=limits,
+        )
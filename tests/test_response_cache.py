@@ -0,0 +1,318 @@
+import base64
+import datetime
+import io
+from collections.abc import AsyncIterator
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from cryptography.x509 import Certificate
+from lxml.etree import _Element as Element
+from minisignxml.config import VerifyConfig
+from time_machine import TimeMachineFixture
+
+from minisaml.certificates import CertificateStore
+from minisaml.errors import (
+    AudienceMismatch,
+    ReplayDetected,
+    ResponseExpired,
+    ResponseTooEarly,
+)
+from minisaml.internal.verify import extract_verified_element_and_certificate
+from minisaml.replay import ReplayProtection
+from minisaml.response import (
+    PreparedValidator,
+    ResponseCache,
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_multi_tenant_response_async,
+    validate_multi_tenant_response_stream,
+    validate_multi_tenant_response_stream_async,
+    validate_response,
+)
+
+TTL = datetime.timedelta(minutes=10)
+
+
+@pytest.fixture
+def verifications(monkeypatch: MonkeyPatch) -> list[Element]:
+    verified: list[Element] = []
+
+    def counting_extract(
+        *,
+        tree: Element,
+        certificates: CertificateStore,
+        config: VerifyConfig = VerifyConfig.default(),
+    ) -> tuple[Element, Certificate]:
+        verified.append(tree)
+        return extract_verified_element_and_certificate(
+            tree=tree, certificates=certificates, config=config
+        )
+
+    monkeypatch.setattr(
+        "minisaml.internal.validation.extract_verified_element_and_certificate",
+        counting_extract,
+    )
+    return verified
+
+
+def with_trailing_newline(data: bytes) -> bytes:
+    # A different document with the same, still valid, signature.
+    return base64.b64encode(base64.b64decode(data) + b"\n")
+
+
+def test_response_cache_max_size() -> None:
+    with pytest.raises(ValueError):
+        ResponseCache(ttl=TTL, max_size=0)
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_cache(
+    response_xml_b64: bytes, cert: Certificate, verifications: list[Element]
+) -> None:
+    cache = ResponseCache(ttl=TTL)
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        response_cache=cache,
+    )
+    assert len(cache) == 1
+    # The encoding does not matter, only the decoded response.
+    assert (
+        validate_response(
+            data=response_xml_b64.decode("ascii"),
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            response_cache=cache,
+        )
+        is response
+    )
+    assert len(verifications) == 1
+    # Different parameters, different outcome.
+    with pytest.raises(AudienceMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other.sp.invalid",
+            idp_issuer="https://idp.invalid",
+            response_cache=cache,
+        )
+    assert len(verifications) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_cache_errors(
+    response_xml_b64: bytes, cert: Certificate, verifications: list[Element]
+) -> None:
+    cache = ResponseCache(ttl=TTL)
+    errors = []
+    for _ in range(2):
+        with pytest.raises(AudienceMismatch) as exc_info:
+            validate_response(
+                data=response_xml_b64,
+                certificate=cert,
+                expected_audience="https://other.sp.invalid",
+                idp_issuer="https://idp.invalid",
+                response_cache=cache,
+            )
+        errors.append(exc_info.value)
+    assert len(verifications) == 1
+    assert errors[0] == errors[1]
+    assert errors[0] is not errors[1]
+
+
+@pytest.mark.usefixtures("too_early")
+def test_response_cache_too_early(
+    response_xml_b64: bytes, cert: Certificate, verifications: list[Element]
+) -> None:
+    cache = ResponseCache(ttl=TTL)
+    for _ in range(2):
+        with pytest.raises(ResponseTooEarly):
+            validate_response(
+                data=response_xml_b64,
+                certificate=cert,
+                expected_audience="https://sp.invalid",
+                idp_issuer="https://idp.invalid",
+                response_cache=cache,
+            )
+    assert len(verifications) == 2
+    assert len(cache) == 0
+
+
+def test_response_cache_expiry(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    verifications: list[Element],
+    time_machine: TimeMachineFixture,
+) -> None:
+    def validate(cache: ResponseCache) -> None:
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            response_cache=cache,
+        )
+
+    start = datetime.datetime(2020, 1, 16, 14, 32, 32, tzinfo=datetime.timezone.utc)
+    time_machine.move_to(start, tick=False)
+    cache = ResponseCache(ttl=datetime.timedelta(seconds=30))
+    validate(cache)
+    time_machine.move_to(start + datetime.timedelta(seconds=29), tick=False)
+    validate(cache)
+    assert len(verifications) == 1
+    time_machine.move_to(start + datetime.timedelta(seconds=30), tick=False)
+    validate(cache)
+    assert len(verifications) == 2
+
+    # Never cached past the NotOnOrAfter of the assertion, 14:34:31.
+    time_machine.move_to(start, tick=False)
+    cache = ResponseCache(ttl=TTL)
+    validate(cache)
+    time_machine.move_to(
+        datetime.datetime(2020, 1, 16, 14, 34, 30, tzinfo=datetime.timezone.utc),
+        tick=False,
+    )
+    validate(cache)
+    assert len(verifications) == 3
+    time_machine.move_to(
+        datetime.datetime(2020, 1, 16, 14, 34, 31, tzinfo=datetime.timezone.utc),
+        tick=False,
+    )
+    with pytest.raises(ResponseExpired):
+        validate(cache)
+    assert len(verifications) == 4
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_cache_eviction(
+    response_xml_b64: bytes, cert: Certificate, verifications: list[Element]
+) -> None:
+    cache = ResponseCache(ttl=TTL, max_size=2)
+    first = response_xml_b64
+    second = with_trailing_newline(first)
+    third = with_trailing_newline(second)
+    for data in [first, second, first, third, first, second]:
+        validate_response(
+            data=data,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            response_cache=cache,
+        )
+    # The second response was evicted by the third, the first was used more
+    # recently.
+    assert len(verifications) == 4
+    assert len(cache) == 2
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_cache_replay_protection(
+    response_xml_b64: bytes, cert: Certificate, verifications: list[Element]
+) -> None:
+    validator = PreparedValidator(
+        ValidationConfig(
+            certificate=cert,
+            replay_protection=ReplayProtection(),
+            response_cache=ResponseCache(ttl=TTL),
+        ),
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    validator.validate(response_xml_b64)
+    with pytest.raises(ReplayDetected):
+        validator.validate(response_xml_b64)
+    with pytest.raises(ReplayDetected):
+        validator.validate(response_xml_b64)
+    assert len(verifications) == 1
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("is_async", [True, False])
+async def test_response_cache_multi_tenant(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    verifications: list[Element],
+    is_async: bool,
+) -> None:
+    config = ValidationConfig(certificate=cert, response_cache=ResponseCache(ttl=TTL))
+    other_config = ValidationConfig(
+        certificate=cert, response_cache=config.response_cache
+    )
+    if is_async:
+        results = [
+            await validate_multi_tenant_response_async(
+                data=response_xml_b64,
+                get_config_for_issuer=lambda issuer: (config, None),
+                expected_audience="https://sp.invalid",
+            )
+            for _ in range(2)
+        ]
+    else:
+        results = [
+            validate_multi_tenant_response(
+                data=response_xml_b64,
+                get_config_for_issuer=lambda issuer: (config, None),
+                expected_audience="https://sp.invalid",
+            )
+            for _ in range(2)
+        ]
+    assert results[0][0] is results[1][0]
+    assert len(verifications) == 1
+    # An equal configuration shares the cached response.
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (other_config, None),
+        expected_audience="https://sp.invalid",
+    )
+    assert response is results[0][0]
+    assert len(verifications) == 1
+
+
+async def chunks(data: bytes) -> AsyncIterator[bytes]:
+    for offset in range(0, len(data), 100):
+        yield data[offset : offset + 100]
+
+
+@pytest.mark.usefixtures("good_time")
+@pytest.mark.parametrize("is_async", [True, False])
+async def test_response_cache_multi_tenant_stream(
+    response_xml_b64: bytes,
+    cert: Certificate,
+    verifications: list[Element],
+    is_async: bool,
+) -> None:
+    config = ValidationConfig(certificate=cert, response_cache=ResponseCache(ttl=TTL))
+    if is_async:
+        results = [
+            await validate_multi_tenant_response_stream_async(
+                stream=chunks(response_xml_b64),
+                get_config_for_issuer=lambda issuer: (config, None),
+                expected_audience="https://sp.invalid",
+            )
+            for _ in range(2)
+        ]
+    else:
+        results = [
+            validate_multi_tenant_response_stream(
+                stream=io.BytesIO(response_xml_b64),
+                get_config_for_issuer=lambda issuer: (config, None),
+                expected_audience="https://sp.invalid",
+                chunk_size=100,
+            )
+            for _ in range(2)
+        ]
+    assert results[0][0] is results[1][0]
+    assert len(verifications) == 1
+    # The digest computed while streaming matches the one of the whole response.
+    response, _ = validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (config, None),
+        expected_audience="https://sp.invalid",
+    )
+    assert response is results[0][0]
+    assert len(verifications) == 1
@@ -0,0 +1,85 @@
+import datetime
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from minisaml.internal.constants import DATE_TIME_FORMAT, DATE_TIME_FORMAT_FRACTIONAL
+from minisaml.internal.saml import saml_to_datetime
+
+utc_datetimes = st.datetimes(
+    min_value=datetime.datetime(1000, 1, 2),  # noqa: DTZ001
+    max_value=datetime.datetime(9999, 12, 30),  # noqa: DTZ001
+    timezones=st.just(datetime.timezone.utc),
+)
+offsets = st.builds(
+    lambda minutes: datetime.timezone(datetime.timedelta(minutes=minutes)),
+    st.integers(min_value=-14 * 60 - 59, max_value=14 * 60 + 59),
+)
+
+
+@given(utc_datetimes)
+def test_whole_seconds(value: datetime.datetime) -> None:
+    value = value.replace(microsecond=0)
+    assert saml_to_datetime(value.strftime(DATE_TIME_FORMAT)) == value
+
+
+@given(utc_datetimes, st.integers(min_value=1, max_value=6))
+def test_fractional_seconds_match_strptime(
+    value: datetime.datetime, digits: int
+) -> None:
+    text = value.strftime(DATE_TIME_FORMAT_FRACTIONAL)
+    text = text[: len(text) - 1 - (6 - digits)] + "Z"
+    expected = datetime.datetime.strptime(text, DATE_TIME_FORMAT_FRACTIONAL).replace(
+        tzinfo=datetime.timezone.utc
+    )
+    assert saml_to_datetime(text) == expected
+
+
+@given(utc_datetimes, st.integers(min_value=7, max_value=12))
+def test_long_fractions_are_truncated(value: datetime.datetime, digits: int) -> None:
+    text = value.strftime("%Y-%m-%dT%H:%M:%S.%f") + "9" * (digits - 6) + "Z"
+    assert saml_to_datetime(text) == value
+
+
+@given(utc_datetimes, offsets)
+def test_offsets(value: datetime.datetime, offset: datetime.timezone) -> None:
+    result = saml_to_datetime(value.astimezone(offset).isoformat())
+    assert result == value
+    assert result.tzinfo is datetime.timezone.utc
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "",
+        "2020-01-16T14:32:32",
+        "2020-01-16 14:32:32Z",
+        "2020-01-16T14:32:32.Z",
+        "2020-01-16T14:32:32+0000",
+        "2020-01-16T14:32:32Zjunk",
+        "2020-13-16T14:32:32Z",
+        "２０２０-01-16T14:32:32Z",
+        "2020-01-16T14:32:32+99:99",
+        "2020-01-16T14:32:32+15:00",
+        "2020-01-16T14:32:32-01:60",
+        # Out of the range of datetime once the offset is applied.
+        "0001-01-01T00:00:00+00:01",
+        "9999-12-31T23:59:59-00:01",
+    ],
+)
+def test_invalid(value: str) -> None:
+    with pytest.raises(ValueError):
+        saml_to_datetime(value)
+
+
+def test_range_limits() -> None:
+    assert saml_to_datetime("0001-01-01T00:00:00-00:01") == datetime.datetime(
+        1, 1, 1, 0, 1, tzinfo=datetime.timezone.utc
+    )
+    assert saml_to_datetime("9999-12-31T23:59:59+00:01") == datetime.datetime(
+        9999, 12, 31, 23, 58, 59, tzinfo=datetime.timezone.utc
+    )
+    assert saml_to_datetime("2020-01-16T14:32:32+14:59") == datetime.datetime(
+        2020, 1, 15, 23, 33, 32, tzinfo=datetime.timezone.utc
+    )
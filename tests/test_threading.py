@@ -0,0 +1,186 @@
+import sys
+import threading
+from collections.abc import Callable, Iterator
+from typing import Any, TypeVar
+
+import pytest
+from _pytest.monkeypatch import MonkeyPatch
+from cryptography.x509 import Certificate
+from yarl import URL
+
+import minisaml.response
+from minisaml.errors import ReplayDetected
+from minisaml.replay import ReplayProtection
+from minisaml.request import AuthnRequestBuilder, get_request_redirect_url
+from minisaml.response import (
+    PreparedValidator,
+    Response,
+    ResponseLimits,
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_response,
+)
+
+THREADS = 16
+ITERATIONS = 25
+
+T = TypeVar("T")
+
+
+@pytest.fixture(autouse=True)
+def switch_often() -> Iterator[None]:
+    # Switch threads as often as possible to provoke interleavings on builds
+    # with a GIL.
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def run_threads(func: Callable[[int], T]) -> list[T]:
+    """
+    Calls `func` with the index of each of `THREADS` threads, starting them
+    at the same time, and returns the results in thread order. Exceptions
+    raised in a thread are re-raised.
+    """
+    barrier = threading.Barrier(THREADS)
+    results: list[Any] = [None] * THREADS
+    errors: list[BaseException] = []
+
+    def target(index: int) -> None:
+        barrier.wait()
+        try:
+            results[index] = func(index)
+        except BaseException as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+@pytest.mark.usefixtures("good_time")
+def test_validate_response_threads(response_xml_b64: bytes, cert: Certificate) -> None:
+    config = ValidationConfig(
+        certificate=[cert], prefilter=True, limits=ResponseLimits()
+    )
+    validator = PreparedValidator(
+        config, expected_audience="https://sp.invalid", idp_issuer="https://idp.invalid"
+    )
+    expected = validator.validate(response_xml_b64)
+
+    def validate(index: int) -> list[Response]:
+        results = []
+        for iteration in range(ITERATIONS):
+            if (index + iteration) % 3 == 0:
+                response = validator.validate(response_xml_b64)
+            elif (index + iteration) % 3 == 1:
+                response = validate_response(
+                    data=response_xml_b64,
+                    certificate=config.certificate,
+                    expected_audience="https://sp.invalid",
+                    idp_issuer="https://idp.invalid",
+                    prefilter=True,
+                    limits=config.limits,
+                )
+            else:
+                response, _ = validate_multi_tenant_response(
+                    data=response_xml_b64,
+                    get_config_for_issuer=lambda issuer: (config, None),
+                    expected_audience="https://sp.invalid",
+                )
+            assert response.attrs == {"attr name": "attr value"}
+            results.append(response)
+        return results
+
+    for results in run_threads(validate):
+        assert results == [expected] * ITERATIONS
+
+
+@pytest.mark.usefixtures("good_time")
+def test_replay_protection_threads(response_xml_b64: bytes, cert: Certificate) -> None:
+    validator = PreparedValidator(
+        ValidationConfig(certificate=cert, replay_protection=ReplayProtection()),
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+
+    def validate(index: int) -> bool:
+        try:
+            validator.validate(response_xml_b64)
+        except ReplayDetected:
+            return False
+        return True
+
+    assert sum(run_threads(validate)) == 1
+
+
+@pytest.mark.usefixtures("good_time")
+def test_lazy_attributes_threads(
+    response_xml_b64: bytes, cert: Certificate, monkeypatch: MonkeyPatch
+) -> None:
+    calls = 0
+    gather_attributes = minisaml.response.gather_attributes
+
+    def counting_gather_attributes(*args: Any, **kwargs: Any) -> Any:
+        nonlocal calls
+        calls += 1
+        return gather_attributes(*args, **kwargs)
+
+    monkeypatch.setattr(
+        "minisaml.response.gather_attributes", counting_gather_attributes
+    )
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+    )
+    results = run_threads(lambda index: list(response.attributes))
+    assert calls == 1
+    assert all(result == results[0] for result in results)
+    assert [attribute.name for attribute in results[0]] == ["attr name"]
+
+
+def test_redirect_url_threads() -> None:
+    builder = AuthnRequestBuilder(
+        saml_endpoint="https://saml.invalid/sso?idpid=abcdef",
+        expected_audience="https://sp.invalid",
+        acs_url="https://acs.invalid",
+    )
+    replay_protection = ReplayProtection(check_in_response_to=True)
+
+    def redirect(index: int) -> list[str]:
+        urls = []
+        for iteration in range(ITERATIONS):
+            request_id = f"id-{index}-{iteration}"
+            if iteration % 2:
+                url = builder.get_redirect_url(
+                    request_id=request_id, replay_protection=replay_protection
+                )
+            else:
+                url = get_request_redirect_url(
+                    saml_endpoint="https://saml.invalid/sso?idpid=abcdef",
+                    expected_audience="https://sp.invalid",
+                    acs_url="https://acs.invalid",
+                    request_id=request_id,
+                    replay_protection=replay_protection,
+                )
+            urls.append(url)
+        return urls
+
+    results = run_threads(redirect)
+    assert len({url for urls in results for url in urls}) == THREADS * ITERATIONS
+    for urls in results:
+        for url in urls:
+            assert URL(url).query["idpid"] == "abcdef"
+    for index in range(THREADS):
+        for iteration in range(ITERATIONS):
+            assert replay_protection.request_backend.pop(
+                f"request:id-{index}-{iteration}"
+            )
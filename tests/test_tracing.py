@@ -0,0 +1,345 @@
+import datetime
+import io
+import logging
+from collections.abc import AsyncIterator
+from typing import Any
+
+import pytest
+from cryptography.x509 import Certificate
+
+from minisaml.certificates import fingerprint
+from minisaml.errors import AudienceMismatch
+from minisaml.response import (
+    ResponseCache,
+    ValidationConfig,
+    validate_multi_tenant_response,
+    validate_multi_tenant_response_async,
+    validate_multi_tenant_response_stream,
+    validate_multi_tenant_response_stream_async,
+    validate_response,
+    validate_response_stream,
+    validate_response_stream_async,
+)
+from minisaml.tracing import (
+    CallbackObserver,
+    LoggingObserver,
+    SpanObserver,
+    ValidationTrace,
+)
+
+
+class InMemorySpan:
+    def __init__(self, name: str, attributes: dict[str, Any], start_time: int) -> None:
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start_time = start_time
+        self.end_time: int | None = None
+        self.events: list[tuple[str, dict[str, Any] | None, int | None]] = []
+        self.exceptions: list[BaseException] = []
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(
+        self,
+        name: str,
+        attributes: dict[str, Any] | None = None,
+        timestamp: int | None = None,
+    ) -> None:
+        self.events.append((name, attributes, timestamp))
+
+    def record_exception(self, exception: BaseException) -> None:
+        self.exceptions.append(exception)
+
+    def end(self, end_time: int | None = None) -> None:
+        self.end_time = end_time
+
+
+class InMemoryTracer:
+    def __init__(self) -> None:
+        self.spans: list[InMemorySpan] = []
+
+    def start_span(
+        self, name: str, *, attributes: dict[str, Any], start_time: int
+    ) -> InMemorySpan:
+        span = InMemorySpan(name, attributes, start_time)
+        self.spans.append(span)
+        return span
+
+
+@pytest.mark.usefixtures("good_time")
+def test_callback_observer(response_xml_b64: bytes, cert: Certificate) -> None:
+    traces: list[ValidationTrace] = []
+    validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=CallbackObserver(traces.append),
+    )
+    (trace,) = traces
+    assert [stage.name for stage in trace.stages] == [
+        "decode",
+        "parse",
+        "verify",
+        "extract",
+    ]
+    assert trace.issuer == "https://idp.invalid"
+    assert trace.certificate_fingerprint == fingerprint(cert).hex()
+    assert trace.error is None
+    assert trace.error_class is None
+    assert trace.start_time_ns <= trace.stages[0].start_time_ns
+    assert trace.stages[-1].end_time_ns <= trace.end_time_ns
+    assert trace.duration >= sum(stage.duration for stage in trace.stages)
+
+
+@pytest.mark.usefixtures("good_time")
+def test_callback_observer_error(response_xml_b64: bytes, cert: Certificate) -> None:
+    traces: list[ValidationTrace] = []
+    with pytest.raises(AudienceMismatch) as exc_info:
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other.invalid",
+            idp_issuer="https://idp.invalid",
+            observer=CallbackObserver(traces.append),
+        )
+    (trace,) = traces
+    assert [stage.name for stage in trace.stages] == ["decode", "parse", "verify"]
+    assert trace.error is exc_info.value
+    assert trace.error_class == "AudienceMismatch"
+
+
+@pytest.mark.usefixtures("good_time")
+def test_response_cache_observer(response_xml_b64: bytes, cert: Certificate) -> None:
+    traces: list[ValidationTrace] = []
+    cache = ResponseCache(ttl=datetime.timedelta(minutes=1))
+    for _ in range(2):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://sp.invalid",
+            idp_issuer="https://idp.invalid",
+            observer=CallbackObserver(traces.append),
+            response_cache=cache,
+        )
+    first, second = traces
+    assert [stage.name for stage in first.stages] == [
+        "decode",
+        "parse",
+        "verify",
+        "extract",
+    ]
+    assert [stage.name for stage in second.stages] == ["decode", "cache"]
+    assert second.certificate_fingerprint == fingerprint(cert).hex()
+    assert second.error is None
+
+
+@pytest.mark.usefixtures("good_time")
+def test_multi_tenant_observer(response_xml_b64: bytes, cert: Certificate) -> None:
+    traces: list[ValidationTrace] = []
+    validate_multi_tenant_response(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), None),
+        expected_audience="https://sp.invalid",
+        observer=CallbackObserver(traces.append),
+    )
+    (trace,) = traces
+    assert [stage.name for stage in trace.stages] == [
+        "decode",
+        "parse",
+        "tenant_lookup",
+        "verify",
+        "extract",
+    ]
+    assert trace.issuer == "https://idp.invalid"
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_multi_tenant_observer_async_callback(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    traces: list[ValidationTrace] = []
+
+    async def get_config_for_issuer(issuer: str) -> tuple[ValidationConfig, None]:
+        raise LookupError(issuer)
+
+    with pytest.raises(LookupError):
+        await validate_multi_tenant_response(
+            data=response_xml_b64,
+            get_config_for_issuer=get_config_for_issuer,
+            expected_audience="https://sp.invalid",
+            observer=CallbackObserver(traces.append),
+        )
+    (trace,) = traces
+    assert [stage.name for stage in trace.stages] == ["decode", "parse"]
+    assert trace.error_class == "LookupError"
+    assert trace.issuer == "https://idp.invalid"
+
+
+async def chunks(data: bytes) -> AsyncIterator[bytes]:
+    for offset in range(0, len(data), 100):
+        yield data[offset : offset + 100]
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_multi_tenant_observer_async(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    traces: list[ValidationTrace] = []
+    await validate_multi_tenant_response_async(
+        data=response_xml_b64,
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), None),
+        expected_audience="https://sp.invalid",
+        observer=CallbackObserver(traces.append),
+    )
+    (trace,) = traces
+    assert [stage.name for stage in trace.stages] == [
+        "decode",
+        "parse",
+        "tenant_lookup",
+        "verify",
+        "extract",
+    ]
+    assert trace.issuer == "https://idp.invalid"
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_stream_observers(response_xml_b64: bytes, cert: Certificate) -> None:
+    traces: list[ValidationTrace] = []
+    observer = CallbackObserver(traces.append)
+    validate_response_stream(
+        stream=io.BytesIO(response_xml_b64),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=observer,
+    )
+    await validate_response_stream_async(
+        stream=chunks(response_xml_b64),
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=observer,
+    )
+    validate_multi_tenant_response_stream(
+        stream=io.BytesIO(response_xml_b64),
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), None),
+        expected_audience="https://sp.invalid",
+        observer=observer,
+    )
+    await validate_multi_tenant_response_stream_async(
+        stream=chunks(response_xml_b64),
+        get_config_for_issuer=lambda issuer: (ValidationConfig(certificate=cert), None),
+        expected_audience="https://sp.invalid",
+        observer=observer,
+    )
+    assert [[stage.name for stage in trace.stages] for trace in traces] == [
+        ["parse", "verify", "extract"],
+        ["parse", "verify", "extract"],
+        ["parse", "tenant_lookup", "verify", "extract"],
+        ["parse", "tenant_lookup", "verify", "extract"],
+    ]
+    assert all(trace.issuer == "https://idp.invalid" for trace in traces)
+    assert all(trace.error is None for trace in traces)
+
+
+@pytest.mark.usefixtures("good_time")
+async def test_stream_observer_error(
+    response_xml_b64: bytes, cert: Certificate
+) -> None:
+    traces: list[ValidationTrace] = []
+    with pytest.raises(AudienceMismatch) as exc_info:
+        await validate_multi_tenant_response_stream_async(
+            stream=chunks(response_xml_b64),
+            get_config_for_issuer=lambda issuer: (
+                ValidationConfig(certificate=cert),
+                None,
+            ),
+            expected_audience="https://other.invalid",
+            observer=CallbackObserver(traces.append),
+        )
+    (trace,) = traces
+    assert trace.error is exc_info.value
+
+
+@pytest.mark.usefixtures("good_time")
+def test_failing_observer(
+    response_xml_b64: bytes, cert: Certificate, caplog: pytest.LogCaptureFixture
+) -> None:
+    def fail(trace: ValidationTrace) -> None:
+        raise RuntimeError("observer failed")
+
+    observer = CallbackObserver(fail)
+    response = validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=observer,
+    )
+    assert response.issuer == "https://idp.invalid"
+    # The validation error is raised, not the error of the observer.
+    with pytest.raises(AudienceMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other.invalid",
+            idp_issuer="https://idp.invalid",
+            observer=observer,
+        )
+    assert [record.levelno for record in caplog.records] == [logging.ERROR] * 2
+    assert all(
+        record.exc_info is not None and isinstance(record.exc_info[1], RuntimeError)
+        for record in caplog.records
+    )
+
+
+@pytest.mark.usefixtures("good_time")
+def test_logging_observer(
+    response_xml_b64: bytes, cert: Certificate, caplog: pytest.LogCaptureFixture
+) -> None:
+    caplog.set_level(logging.DEBUG, logger="minisaml")
+    validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=LoggingObserver(),
+    )
+    (record,) = caplog.records
+    assert record.levelno == logging.DEBUG
+    assert "validated" in record.getMessage()
+    assert "issuer=https://idp.invalid" in record.getMessage()
+    assert isinstance(getattr(record, "saml_trace"), ValidationTrace)
+
+
+@pytest.mark.usefixtures("good_time")
+def test_span_observer(response_xml_b64: bytes, cert: Certificate) -> None:
+    tracer = InMemoryTracer()
+    observer = SpanObserver(tracer)
+    validate_response(
+        data=response_xml_b64,
+        certificate=cert,
+        expected_audience="https://sp.invalid",
+        idp_issuer="https://idp.invalid",
+        observer=observer,
+    )
+    with pytest.raises(AudienceMismatch):
+        validate_response(
+            data=response_xml_b64,
+            certificate=cert,
+            expected_audience="https://other.invalid",
+            idp_issuer="https://idp.invalid",
+            observer=observer,
+        )
+    ok, failed = tracer.spans
+    assert ok.name == "minisaml.validate"
+    assert ok.attributes == {
+        "minisaml.issuer": "https://idp.invalid",
+        "minisaml.certificate_fingerprint": fingerprint(cert).hex(),
+    }
+    assert [event[0] for event in ok.events] == ["decode", "parse", "verify", "extract"]
+    assert ok.end_time is not None and ok.end_time >= ok.start_time
+    assert failed.attributes["error.type"] == "AudienceMismatch"
+    assert isinstance(failed.exceptions[0], AudienceMismatch)